@@ -12,6 +12,7 @@ import sys
 import re
 from isounidecode.unidecode import unidecode
 from collections import OrderedDict, defaultdict
+from functools import partial
 import gzip
 from sortedcontainers import SortedDict
 from xml.sax.saxutils import quoteattr, escape
@@ -29,6 +30,8 @@ except ImportError:
 from . import tree
 from .topsort import topsort
 from .alphabet import PythonAlphabet
+from .edges import EdgeStore
+from . import parsers
 
 __version__ = "2014-07-08"
 __author__ = "Yannick Versley / Univ. Heidelberg"
@@ -37,9 +40,10 @@ if sys.version_info.major >= 3:
     intern = sys.intern
     xrange = range
     unicode = str
-    islice = slice
+    izip = zip
+    from itertools import islice, chain
 else:
-    from itertools import izip, islice
+    from itertools import izip, islice, chain
 
 class _EmptyClass:
     pass
@@ -51,6 +55,18 @@ QNAME_XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
 TEMP_ID = 0
 
 
+def import_numpy():
+    """
+    imports NumPy on first use, so that it is only needed
+    for the array export methods of Document
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("exporting arrays requires numpy")
+    return numpy
+
+
 def create_id(prefix, alphabet):
     n0 = len(alphabet)
     n = n0
@@ -150,7 +166,14 @@ class RefAttribute:
         return doc.get_obj_id(val)
 
     def unmap_attr(self, val, doc, encoding=None):
-        return doc.object_by_id[val]
+        try:
+            return doc.object_by_id[val]
+        except KeyError:
+            pending = getattr(doc, 'pending_refs', None)
+            if pending is None:
+                raise
+            pending.add(val)
+            return PendingRef(val)
 
     def get_updown(self, obj, doc, result):
         if self.restriction is 'down':
@@ -172,6 +195,53 @@ class RefAttribute:
     def get_kind(self):
         return 'REF'
 
+class PendingRef(object):
+
+    """
+    stands in for the target of a reference that has not been
+    read yet, see :py:meth:`Document.resolve_pending_refs`
+    """
+    __slots__ = ('xml_id',)
+
+    def __init__(self, xml_id):
+        self.xml_id = xml_id
+
+    def __getstate__(self):
+        return self.xml_id
+
+    def __setstate__(self, xml_id):
+        self.xml_id = xml_id
+
+    def __repr__(self):
+        return 'PendingRef(%r)' % (self.xml_id,)
+
+
+def replace_pending_refs(obj, object_by_id):
+    """
+    replaces the :py:class:`PendingRef` values in the attributes of
+    obj, and in lists in them such as edges, by the objects from
+    object_by_id.
+
+    :return: the IDs of the placeholders that are left
+    """
+    left = []
+
+    def replace(val):
+        if isinstance(val, PendingRef):
+            try:
+                return object_by_id[val.xml_id]
+            except KeyError:
+                left.append(val.xml_id)
+        elif isinstance(val, list):
+            val[:] = [replace(x) for x in val]
+        return val
+    d = getattr(obj, '__dict__', None)
+    if d:
+        for k, val in list(d.items()):
+            d[k] = replace(val)
+    return left
+
+
 class IDRefAttribute:
 
     """
@@ -399,6 +469,7 @@ class SecondaryEdges:
                            RefAttribute('parent',
                                         restrict_target=['word', 'node'])]
         self.suffix = 'Edge'
+        self.prop_name = 'secedge'
         self.descriptions = {}
 
     def attribute_by_name(self, att_name):
@@ -411,6 +482,12 @@ class SecondaryEdges:
         self.attributes.append(att)
 
     def get_edges(self, obj, doc):
+        store = getattr(doc, 'edge_store', None)
+        if store is not None:
+            if not hasattr(obj, 'xml_id'):
+                return []
+            return [[label, doc.object_by_id[tgt]]
+                    for (tgt, label) in store.edges_from(self.name, obj.xml_id)]
         edges = []
         if hasattr(obj, 'secedge') and obj.secedge is not None:
             for secedge in obj.secedge:
@@ -418,7 +495,23 @@ class SecondaryEdges:
         return edges
 
     def set_edges(self, obj, vals, doc):
-        obj.secedge = vals
+        store = getattr(doc, 'edge_store', None)
+        if store is not None:
+            store.set_edges(self.name, doc.get_obj_id(obj),
+                            [(doc.get_obj_id(tgt), label)
+                             for (label, tgt) in vals])
+        else:
+            obj.secedge = vals
+
+    def add_edge(self, obj, val, doc):
+        store = getattr(doc, 'edge_store', None)
+        if store is not None:
+            store.add_edge(self.name, doc.get_obj_id(obj),
+                           doc.get_obj_id(val[1]), val[0])
+        else:
+            edges = self.get_edges(obj, doc)
+            edges.append(val)
+            self.set_edges(obj, edges, doc)
 
     def get_updown(self, obj, doc, result):
         pass
@@ -451,7 +544,13 @@ def open_tag(f, name, items, indent=0, encoding=None):
         if v is None:
             continue
         if isinstance(v, unicode):
-            if encoding is not None:
+            if str is unicode:
+                # Python 3: f is a text stream, so only characters
+                # that the encoding lacks are replaced
+                f.write(' %s=%s' % (k, quoteattr(v).encode(
+                    encoding or 'ascii', 'xmlcharrefreplace').decode(
+                        encoding or 'ascii')))
+            elif encoding is not None:
                 f.write(' %s="%s"' %
                         (k, escape(v.encode(encoding), {'"': "&quot;"})))
             else:
@@ -500,6 +599,7 @@ class ReferenceEdges(object):
                            IDRefAttribute('target',
                                           restrict_target=['word', 'node'])]
         self.suffix = 'Edge'
+        self.prop_name = 'anaphora_info'
 
     def attribute_by_name(self, att_name):
         for att in self.attributes:
@@ -511,7 +611,7 @@ class ReferenceEdges(object):
         self.attributes.append(att)
 
     def get_edges(self, obj, doc):
-        info = getattr(obj, 'anaphora_info', None)
+        info = get_anaphora_info(obj, doc)
         if info is not None:
             tgt = None
             if info[0] == 'split_antecedent':
@@ -530,7 +630,13 @@ class ReferenceEdges(object):
             targets = vals[0][1].split(' ')
         else:
             targets = None
-        obj.anaphora_info = [kind, targets]
+        set_anaphora_info(obj, doc, kind, targets)
+
+    def add_edge(self, obj, val, doc):
+        if self.get_edges(obj, doc):
+            raise ValueError('%s: more than one %s edge' % (
+                getattr(obj, 'xml_id', obj), self.name))
+        self.set_edges(obj, [val], doc)
 
     def get_updown(self, obj, doc, result):
         pass
@@ -561,14 +667,62 @@ class GenericEdges(object):
     def add_attribute(self, att):
         self.attributes.append(att)
 
+    def target_index(self):
+        """
+        returns the position of the first reference attribute,
+        which is kept as the target in an edge store, or None
+        """
+        for i, att in enumerate(self.attributes):
+            if isinstance(att, (RefAttribute, IDRefAttribute)):
+                return i
+        return None
+
+    def edge_to_row(self, val, doc):
+        k = self.target_index()
+        if k is None:
+            return (None, tuple(val))
+        tgt = val[k]
+        if tgt is not None and isinstance(self.attributes[k], RefAttribute):
+            tgt = doc.get_obj_id(tgt)
+        return (tgt, tuple(val[:k]) + tuple(val[k + 1:]))
+
+    def row_to_edge(self, tgt, label, doc):
+        k = self.target_index()
+        if k is None:
+            return list(label)
+        if tgt is not None and isinstance(self.attributes[k], RefAttribute):
+            tgt = doc.object_by_id[tgt]
+        return list(label[:k]) + [tgt] + list(label[k:])
+
     def get_edges(self, obj, doc):
+        store = getattr(doc, 'edge_store', None)
+        if store is not None:
+            if not hasattr(obj, 'xml_id'):
+                return []
+            return [self.row_to_edge(tgt, label, doc)
+                    for (tgt, label) in store.edges_from(self.name, obj.xml_id)]
         if hasattr(obj, self.prop_name):
             return getattr(obj, self.prop_name)
         else:
             return []
 
     def set_edges(self, obj, vals, doc):
-        setattr(obj, self.prop_name, vals)
+        store = getattr(doc, 'edge_store', None)
+        if store is not None:
+            store.set_edges(self.name, doc.get_obj_id(obj),
+                            [self.edge_to_row(val, doc) for val in vals])
+        else:
+            setattr(obj, self.prop_name, vals)
+
+    def add_edge(self, obj, val, doc):
+        store = getattr(doc, 'edge_store', None)
+        if store is not None:
+            tgt, label = self.edge_to_row(val, doc)
+            store.add_edge(self.name, doc.get_obj_id(obj), tgt, label)
+        else:
+            edges = self.get_edges(obj, doc)
+            edges.append(val)
+            self.set_edges(obj, edges, doc)
 
     def get_updown(self, obj, doc, result):
         pass
@@ -581,6 +735,7 @@ class SplitRefEdges(object):
         self.attributes = [EnumAttribute('type'),
                            TextAttribute('target')]
         self.suffix = 'Edge'
+        self.prop_name = 'anaphora_info'
 
     def attribute_by_name(self, att_name):
         for att in self.attributes:
@@ -592,7 +747,7 @@ class SplitRefEdges(object):
         self.attributes.append(att)
 
     def get_edges(self, obj, doc):
-        info = getattr(obj, 'anaphora_info', None)
+        info = get_anaphora_info(obj, doc)
         if info is not None:
             tgt = None
             if info[0] == 'split_antecedent':
@@ -607,12 +762,54 @@ class SplitRefEdges(object):
         assert len(vals) == 1
         kind = vals[0][0]
         targets = vals[0][1].split(' ')
-        obj.anaphora_info = [kind, targets]
+        set_anaphora_info(obj, doc, kind, targets)
+
+    def add_edge(self, obj, val, doc):
+        if self.get_edges(obj, doc):
+            raise ValueError('%s: more than one %s edge' % (
+                getattr(obj, 'xml_id', obj), self.name))
+        self.set_edges(obj, [val], doc)
 
     def get_updown(self, obj, doc, result):
         pass
 
 
+#: the edge store table for the anaphora_info attribute, which
+#: ReferenceEdges and SplitRefEdges share
+ANAPHORA_TABLE = 'anaphora_info'
+
+
+def get_anaphora_info(obj, doc):
+    """
+    returns [kind, targets] for the coreference relation of an
+    object, from the edge store of the document if it has one
+    """
+    store = getattr(doc, 'edge_store', None)
+    if store is None:
+        return getattr(obj, 'anaphora_info', None)
+    if not hasattr(obj, 'xml_id'):
+        return None
+    rows = store.edges_from(ANAPHORA_TABLE, obj.xml_id)
+    if not rows:
+        return None
+    targets = [tgt for (tgt, kind) in rows if tgt is not None]
+    return [rows[0][1], targets or None]
+
+
+def set_anaphora_info(obj, doc, kind, targets):
+    store = getattr(doc, 'edge_store', None)
+    if store is None:
+        obj.anaphora_info = [kind, targets]
+    elif targets:
+        store.set_edges(ANAPHORA_TABLE, doc.get_obj_id(obj),
+                        [(tgt, kind) for tgt in targets])
+    else:
+        store.set_edges(ANAPHORA_TABLE, doc.get_obj_id(obj), [(None, kind)])
+    chain_index = getattr(doc, 'chain_index', None)
+    if chain_index is not None:
+        chain_index.update(obj)
+
+
 def munge_json(obj):
     if isinstance(obj, list) or isinstance(obj, tuple):
         return map(munge_json, obj)
@@ -817,6 +1014,120 @@ class SortedBag(SortedDict):
         self[key] = val
         return val
 
+    def clear_range(self, start, end):
+        """removes the buckets for positions start..end-1"""
+        keys = self.keys()
+        del keys[self.bisect_left(start):self.bisect_left(end)]
+
+
+class DenseBag(object):
+    """
+    an alternative to SortedBag for documents where most token
+    positions have markables: the buckets are kept in a list
+    indexed by position, with None for positions without a bucket.
+    """
+
+    def __init__(self, items=()):
+        self.buckets = []
+        self.n_keys = 0
+        self.update(items)
+
+    def _grow(self, key):
+        buckets = self.buckets
+        if key >= len(buckets):
+            size = max(key + 1, 2 * len(buckets))
+            buckets.extend([None] * (size - len(buckets)))
+
+    def __getitem__(self, key):
+        try:
+            val = self.buckets[key]
+        except IndexError:
+            val = None
+        if val is None:
+            if key < 0:
+                raise KeyError(key)
+            val = list()
+            self[key] = val
+        return val
+
+    def __setitem__(self, key, val):
+        if key < 0:
+            raise KeyError(key)
+        self._grow(key)
+        if self.buckets[key] is None:
+            self.n_keys += 1
+        self.buckets[key] = val
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.buckets[key] = None
+        self.n_keys -= 1
+
+    def __contains__(self, key):
+        return (0 <= key < len(self.buckets) and
+                self.buckets[key] is not None)
+
+    def __len__(self):
+        return self.n_keys
+
+    def __iter__(self):
+        return self.irange()
+
+    def get(self, key, default=None):
+        if 0 <= key < len(self.buckets):
+            val = self.buckets[key]
+            if val is not None:
+                return val
+        return default
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """
+        yields the positions with a bucket between minimum and
+        maximum, like SortedDict.irange
+        """
+        buckets = self.buckets
+        if minimum is None:
+            start = 0
+        else:
+            start = max(0, minimum if inclusive[0] else minimum + 1)
+        if maximum is None:
+            end = len(buckets)
+        else:
+            end = min(len(buckets), maximum + 1 if inclusive[1] else maximum)
+        for i in xrange(start, end):
+            if buckets[i] is not None:
+                yield i
+
+    def keys(self):
+        return list(self.irange())
+
+    def values(self):
+        return [val for val in self.buckets if val is not None]
+
+    def items(self):
+        return [(i, val) for (i, val) in enumerate(self.buckets)
+                if val is not None]
+
+    def update(self, items=()):
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, val in items:
+            self[key] = val
+
+    def clear(self):
+        self.buckets = []
+        self.n_keys = 0
+
+    def clear_range(self, start, end):
+        """removes the buckets for positions start..end-1"""
+        buckets = self.buckets
+        end = min(end, len(buckets))
+        for i in xrange(max(start, 0), end):
+            if buckets[i] is not None:
+                buckets[i] = None
+                self.n_keys -= 1
+
 class Document:
 
     """
@@ -828,11 +1139,12 @@ class Document:
     # either one per level or one globally
     # http://www.grantjenks.com/docs/sortedcontainers/sorteddict.html
 
-    def __init__(self, t_schema, schemas):
+    def __init__(self, t_schema, schemas, dense_markables=False):
         """
         Creates a Document with the specified annotation layers
         :param TerminalSchema t_schema: the schema for terminal nodes
         :param List[MarkableSchema] schemas: the schemas for each annotation layer 
+        :param bool dense_markables: use a :py:class:`DenseBag` for markables
         """
         self.t_schema = t_schema
         self.schemas = schemas
@@ -843,11 +1155,22 @@ class Document:
         self.words = []
         self.w_objs = []
         self.word_attr = 'word'
-        self.markables_by_start = SortedBag()
+        if dense_markables:
+            self.markables_by_start = DenseBag()
+        else:
+            self.markables_by_start = SortedBag()
         self.node_objs = defaultdict(list)
         self.word_ids = PythonAlphabet()
         self.interface_classes = defaultdict(list)
         self.interface_attrs = {}
+        self.mlevel_cache = {}
+        self.edge_store = None
+        self.chain_index = None
+        # IDs of references that could not be resolved while reading,
+        # or None if unresolved references are an error
+        self.pending_refs = None
+        # a spill.Spill once enable_spill has been called
+        self.spill = None
         if t_schema.cls is not None:
             self.schema_by_class[t_schema.cls] = t_schema
         for schema in schemas:
@@ -865,6 +1188,132 @@ class Document:
         for schema in schemas:
             if schema.cls is not None:
                 self.schema_by_class[schema.cls] = schema
+        self.mlevel_cache.clear()
+
+    def set_dense_markables(self, dense=True):
+        """
+        switches the markable index to position-indexed (dense)
+        or sorted (sparse) storage, keeping its contents
+        """
+        if dense:
+            new_mbs = DenseBag()
+        else:
+            new_mbs = SortedBag()
+        new_mbs.update(self.markables_by_start.items())
+        self.markables_by_start = new_mbs
+
+    def use_edge_store(self):
+        """
+        moves the edges of all objects into an :py:class:`EdgeStore`,
+        from which the edge schemas read and to which they write
+        from now on.
+        """
+        if self.edge_store is not None:
+            return
+        all_edges = []
+        schemas_objs = [(self.t_schema, n) for n in self.w_objs
+                        if n is not None]
+        for pos, entries in self.markables_by_start.items():
+            schemas_objs += entries
+        for schema, obj in schemas_objs:
+            for edge in schema.edges:
+                if hasattr(edge, 'get_edges'):
+                    vals = edge.get_edges(obj, self)
+                    if vals:
+                        all_edges.append((edge, obj, vals))
+        self.edge_store = EdgeStore()
+        for edge, obj, vals in all_edges:
+            edge.set_edges(obj, vals, self)
+        for edge, obj, vals in all_edges:
+            if hasattr(obj, edge.prop_name):
+                delattr(obj, edge.prop_name)
+
+    def enable_spill(self, max_tokens=1000000, fname=None):
+        """
+        lets finished token ranges be written to a spill file once
+        more than max_tokens of them are in memory, see
+        :py:mod:`exmldoc.spill`
+
+        :return: the :py:class:`exmldoc.spill.Spill` object, whose
+           finish method marks ranges as finished
+        """
+        from .spill import Spill, PagedList, PagedDict
+        if self.spill is None:
+            self.spill = Spill(self, max_tokens, fname)
+            self.w_objs = PagedList(self.w_objs, self.spill)
+            self.object_by_id = PagedDict(self.object_by_id, self.spill)
+        return self.spill
+
+    def page_in(self, start, end):
+        """reads back spilled markables and terminals in start..end-1"""
+        if self.spill is not None:
+            self.spill.page_in(start, end)
+
+    def resolve_pending_refs(self):
+        """
+        replaces the :py:class:`PendingRef` placeholders in reference
+        attributes and edges by the objects they point to, once all
+        of them have been read. Raises a KeyError for references to
+        objects that are not in the document.
+        """
+        if not self.pending_refs:
+            return
+        object_by_id = self.object_by_id
+        for k in self.pending_refs:
+            if k not in object_by_id:
+                raise KeyError(k)
+
+        def resolve(val):
+            if isinstance(val, PendingRef):
+                return object_by_id[val.xml_id]
+            return val
+        schemas_objs = [(self.t_schema, n) for n in self.w_objs
+                        if n is not None]
+        for pos, entries in self.markables_by_start.items():
+            schemas_objs += entries
+        for schema, obj in schemas_objs:
+            for att in schema.attributes:
+                if isinstance(att, RefAttribute):
+                    val = getattr(obj, att.prop_name, None)
+                    if isinstance(val, PendingRef):
+                        setattr(obj, att.prop_name, resolve(val))
+            if self.edge_store is not None:
+                # the edge store only keeps IDs
+                continue
+            for edge in schema.edges:
+                if not hasattr(edge, 'prop_name'):
+                    continue
+                for val in getattr(obj, edge.prop_name, None) or ():
+                    if isinstance(val, list):
+                        val[:] = [resolve(x) for x in val]
+        self.pending_refs = set()
+
+    def incoming_edges(self, obj, name):
+        """
+        returns (source, label) pairs for the edges of one type that
+        end at obj; name is the edge schema name, or 'anaphora_info'
+        for coreference relations. Needs an edge store.
+        """
+        if not hasattr(obj, 'xml_id'):
+            return []
+        object_by_id = self.object_by_id
+        return [(object_by_id.get(src_id), label)
+                for (src_id, label) in self.edge_store.edges_to(
+                    name, obj.xml_id)]
+
+    def coref_chains(self, kinds=None):
+        """
+        returns the :py:class:`exmldoc.coref.ChainIndex` of the
+        document, which is kept up to date when relations change.
+        Passing kinds rebuilds it for different relation types.
+        """
+        from .coref import ChainIndex, DEFAULT_KINDS
+        if kinds is None:
+            if self.chain_index is not None:
+                return self.chain_index
+            kinds = DEFAULT_KINDS
+        self.chain_index = ChainIndex(self, kinds)
+        return self.chain_index
 
     def schema_by_name(self, name):
         for schema in self.schemas:
@@ -949,6 +1398,29 @@ class Document:
         self.words.append(getattr(w_obj, self.word_attr))
         self.w_objs.append(w_obj)
 
+    def add_terminals(self, w_objs):
+        """
+        appends a sequence of terminals, like calling
+        :py:meth:`add_terminal` for each of them
+        """
+        w_objs = list(w_objs)
+        posn = len(self.words)
+        try:
+            obj_ids = [w_obj.xml_id for w_obj in w_objs]
+        except AttributeError:
+            get_obj_id = self.get_obj_id
+            obj_ids = [get_obj_id(w_obj) for w_obj in w_objs]
+        word_ids = self.word_ids
+        if len(word_ids) != posn or not word_ids.add_new(obj_ids):
+            get_wid = word_ids.__getitem__
+            for obj_id in obj_ids:
+                val = get_wid(obj_id)
+                assert val == posn, (val, obj_id, posn)
+                posn += 1
+        word_attr = self.word_attr
+        self.words += [getattr(w_obj, word_attr) for w_obj in w_objs]
+        self.w_objs += w_objs
+
     def replace_terminal(self, posn, w_obj):
         w_obj.xml_id = self.word_ids.get_sym(posn)
         assert self.words[posn] == getattr(
@@ -958,13 +1430,17 @@ class Document:
 
     def mlevel_for_class(self, cls):
         try:
-            return self.schema_by_class[cls]
+            return self.mlevel_cache[cls]
         except KeyError:
+            pass
+        result = self.schema_by_class.get(cls)
+        if result is None:
             for k in cls.__bases__:
                 result = self.mlevel_for_class(k)
                 if result is not None:
-                    return result
-        return None
+                    break
+        self.mlevel_cache[cls] = result
+        return result
 
     def reorder_updown(self, objs):
         # 1. extract up/down graph
@@ -1009,6 +1485,40 @@ class Document:
                              (obj, type(obj)))
         self.markables_by_start[obj.span[0]].append((mlevel, obj))
 
+    def register_objects(self, objs, schema=None):
+        """
+        registers a sequence of markables, like calling
+        :py:meth:`register_object` for each of them, but
+        merging them into the index in one step.
+        """
+        by_start = defaultdict(list)
+        if schema is None:
+            mlevel_for_class = self.mlevel_for_class
+            for obj in objs:
+                mlevel = mlevel_for_class(type(obj))
+                if mlevel is None:
+                    raise ValueError("No markable level for %s (type %s)" %
+                                     (obj, type(obj)))
+                by_start[obj.span[0]].append((mlevel, obj))
+        else:
+            for obj in objs:
+                by_start[obj.span[0]].append((schema, obj))
+        self.merge_markables(by_start)
+
+    def merge_markables(self, by_start):
+        """
+        adds (mlevel, obj) pairs from a dictionary of start
+        positions to the markable index
+        """
+        mbs = self.markables_by_start
+        new_keys = {}
+        for pos, entries in by_start.items():
+            if pos in mbs:
+                mbs[pos] += entries
+            else:
+                new_keys[pos] = entries
+        mbs.update(new_keys)
+
     def make_span(self, span):
         wids = self.word_ids
         parts = []
@@ -1023,12 +1533,10 @@ class Document:
     def get_objects_by_class(self, cls, start=0, end=None):
         if end is None:
             end = len(self.words)
+        self.page_in(start, end)
         objs_by_start = self.markables_by_start
-        mbs_start = objs_by_start.bisect_left(start)
-        mbs_end = objs_by_start.bisect_left(end)
         result = []
-        for idx in xrange(mbs_start, mbs_end):
-            i = objs_by_start.iloc[idx]
+        for i in objs_by_start.irange(start, end, inclusive=(True, False)):
             for (mlevel, obj) in objs_by_start[i]:
                 if isinstance(obj, cls):
                     result.append(obj)
@@ -1037,13 +1545,10 @@ class Document:
     def get_objects_by_level(self, level, start=0, end=None):
         if end is None:
             end = len(self.words)
+        self.page_in(start, end)
         objs_by_start = self.markables_by_start
-        mbs_start = objs_by_start.bisect_left(start)
-        mbs_end = objs_by_start.bisect_left(end)
-        result = []
         result = []
-        for idx in xrange(mbs_start, mbs_end):
-            i = objs_by_start.iloc[idx]
+        for i in objs_by_start.irange(start, end, inclusive=(True, False)):
             for (mlevel, obj) in objs_by_start[i]:
                 if level == mlevel.name:
                     result.append(obj)
@@ -1052,11 +1557,10 @@ class Document:
     def clear_objects_by_level(self, levelname, start=0, end=None):
         if end is None:
             end = len(self.words)
+        self.page_in(start, end)
         objs_by_start = self.markables_by_start
-        mbs_start = objs_by_start.bisect_left(start)
-        mbs_end = objs_by_start.bisect_left(end)
-        for idx in xrange(mbs_start, mbs_end):
-            i = objs_by_start.iloc[idx]
+        for i in list(objs_by_start.irange(start, end,
+                                           inclusive=(True, False))):
             objs_new = []
             for (mlevel, obj) in objs_by_start[i]:
                 if mlevel.name == levelname:
@@ -1066,7 +1570,32 @@ class Document:
                     objs_new.append((mlevel, obj))
             objs_by_start[i] = objs_new
 
-    def inline_events(self, start, end, levels=None):
+    def open_markables_stack(self, start, end, open_markables, levels=None):
+        """
+        sorts the markables that overlap start..end-1 across a
+        window boundary (see
+        :py:meth:`XMLCorpusReader.window_markables`) into the
+        initial tag stack and those that are opened in the range.
+        Tags of markables that go on after end are kept open;
+        their stack entries are marked by a third element.
+        """
+        stack = []
+        outer_here = defaultdict(list)
+        for mlevel, obj in open_markables:
+            if levels is not None and mlevel.name not in levels:
+                continue
+            m_end = obj.span[-1]
+            keep_open = (m_end is None or m_end > end)
+            if obj.span[0] < start:
+                if keep_open:
+                    stack.append((mlevel.name, float('inf'), True))
+                else:
+                    stack.append((mlevel.name, m_end))
+            else:
+                outer_here[obj.span[0]].append((mlevel, obj, keep_open))
+        return stack, outer_here
+
+    def inline_events(self, start, end, levels=None, open_markables=()):
         """
         process this part of the document, producing SAX-like events
         
@@ -1075,11 +1604,17 @@ class Document:
         :param start: start from here
         :param end: go to this position
         :param levels: if present, only markables on these levels generate events
+        :param open_markables: markables that overlap this part
+          across a window boundary,
+          see :py:meth:`XMLCorpusReader.window_markables`
         """
         objs_by_start = self.markables_by_start
         if end is None:
             end = len(self.words)
-        stack = []
+        self.page_in(start, end)
+        stack, outer_here = self.open_markables_stack(
+            start, end, open_markables, levels)
+        outer_ids = set([id(x[1]) for x in chain(*outer_here.values())])
         for i, n in izip(xrange(start, end), islice(self.w_objs, start, end)):
             #print("InEv", i, stack)
             # close all tags that must be closed here
@@ -1087,8 +1622,18 @@ class Document:
                 yield ('end', stack[-1][0],)
                 stack.pop()
             assert (not stack or stack[-1][1] > i), (i, stack)
+            for mlevel, obj, keep_open in outer_here.get(i, ()):
+                m = mlevel.serialize_object(obj, self)
+                yield ('start', m[1], m[2].items(), m[3])
+                if keep_open:
+                    stack.append((m[1], float('inf'), True))
+                else:
+                    stack.append((m[1], m[0][-1]))
             # find all markables starting here
-            o_here = objs_by_start.get(i, ())
+            o_here = objs_by_start.get(i, [])
+            if outer_ids:
+                o_here = [mlevel_obj for mlevel_obj in o_here
+                          if id(mlevel_obj[1]) not in outer_ids]
             #print("InEv pre-filter", o_here)
             if levels is not None:
                 o_here = [mlevel_obj for mlevel_obj in o_here if mlevel_obj[0].name in levels]
@@ -1132,17 +1677,26 @@ class Document:
                 stack.append((m[1], endpoint))
             yield ('terminal', n)
         # finally, close everything else
-        while stack:
+        while stack and len(stack[-1]) == 2:
             x = stack.pop()
             yield ('end', x[0])
 
     def write_inline_xml(self, f, start=0, end=None,
-                         encoding=None, force_ids=True):
-        """inline XML serialization for part or whole of the document"""
+                         encoding=None, force_ids=True, open_markables=()):
+        """
+        inline XML serialization for part or whole of the document
+
+        :param open_markables: markables that overlap this part
+          across a window boundary,
+          see :py:meth:`XMLCorpusReader.window_markables`
+        """
         objs_by_start = self.markables_by_start
         if end is None:
             end = len(self.words)
-        stack = []
+        self.page_in(start, end)
+        stack, outer_here = self.open_markables_stack(
+            start, end, open_markables)
+        outer_ids = set([id(x[1]) for x in chain(*outer_here.values())])
         for i, n in izip(xrange(start, end), islice(self.w_objs, start, end)):
             # close all tags that must be closed here
             while stack and i == stack[-1][1]:
@@ -1150,8 +1704,24 @@ class Document:
                 f.write('</%s>\n' % (stack[-1][0],))
                 stack.pop()
             assert (not stack or stack[-1][1] > i), (i, stack)
+            for mlevel, obj, keep_open in outer_here.get(i, ()):
+                m = mlevel.serialize_object(obj, self, force_ids=force_ids)
+                open_tag(f, m[1], m[2].items(), len(stack),
+                         encoding=encoding)
+                f.write('>\n')
+                for e in m[3]:
+                    open_tag(f, e[0], e[1].items(), len(stack) + 1,
+                             encoding=encoding)
+                    f.write('/>\n')
+                if keep_open:
+                    stack.append((m[1], float('inf'), True))
+                else:
+                    stack.append((m[1], m[0][-1]))
             # find all markables starting here
             o_here = objs_by_start.get(i, ())
+            if o_here and outer_ids:
+                o_here = [mlevel_obj for mlevel_obj in o_here
+                          if id(mlevel_obj[1]) not in outer_ids]
             if o_here:
                 o_here.sort(key=lambda mlevel_obj: -mlevel_obj[1].span[-1])
                 j = 0
@@ -1209,10 +1779,13 @@ class Document:
                 f.write('</%s>\n' % (t_desc[0],))
             else:
                 f.write('/>\n')
-        # finally, close everything else
-        while stack:
+        # finally, close everything else; inside of tags that are
+        # kept open, indent as if the next window followed
+        indent = len(stack) - (stack and len(stack[0]) > 2 and 1 or 2)
+        while stack and len(stack[-1]) == 2:
             x = stack.pop()
-            f.write(' ' * (len(stack) - 1))
+            f.write(' ' * indent)
+            indent -= 1
             f.write('</%s>\n' % (x[0],))
 
     def save(self, fname, force_ids=True):
@@ -1240,6 +1813,7 @@ class Document:
         result_by_level = {'_start': start}
         if end is None:
             end = len(self.words)
+        self.page_in(start, end)
         terminals = []
         for i in xrange(start, end):
             w_obj = self.w_objs[i]
@@ -1289,7 +1863,7 @@ class Document:
             markables_by_level[schema.name] = markables
             for m in markables:
                 self.object_by_id[self.get_obj_id(m)] = m
-                self.register_object(m)
+            self.register_objects(markables, schema)
         for i, n, obj in izip(xrange(start, end), islice(self.w_objs, start, end), terminals):
             self.t_schema.fill_from_json(n, obj, self)
         for schema in self.schemas:
@@ -1300,19 +1874,199 @@ class Document:
                 schema.fill_from_json(n, obj, self)
 
     def clear_markables(self, start=0, end=None):
+        if self.spill is not None:
+            self.spill.discard(start, len(self.words) if end is None else end)
         if end is None:
             if start == 0:
                 self.markables_by_start.clear()
-                self.w_objs = [None]*len(self.w_objs)
+                self.w_objs[:] = [None]*len(self.w_objs)
                 return
             end = len(self.words)
-        mbs = self.markables_by_start
-        mbs_start = mbs.bisect_left(start)
-        mbs_end = mbs.bisect_left(end)
-        del mbs.iloc[mbs_start:mbs_end]
+        self.markables_by_start.clear_range(start, end)
         for i in xrange(start, end):
             self.w_objs[i] = None
 
+    def value_coder(self, att, vocab=None):
+        """
+        returns a function that maps attribute values to integer
+        codes. Codes come from vocab (a PythonAlphabet that can be
+        shared between documents and grows with new values) or,
+        for enum attributes, from the attribute's alphabet, which
+        is left unchanged: values that it does not know get -1,
+        as do missing values.
+        """
+        if vocab is None:
+            if not isinstance(att, EnumAttribute):
+                raise ValueError("%s is not an enum attribute, need a vocab" %
+                                 (att.name,))
+            obj2int = att.alphabet.obj2int
+
+            def get_code(val):
+                return obj2int.get(val, -1)
+        else:
+            get_code = vocab.__getitem__
+
+        def coder(val):
+            if val is None:
+                return -1
+            return get_code(val)
+        return coder
+
+    def value_decoder(self, vocab):
+        """
+        returns a function that maps integer codes from vocab
+        back to values (the inverse of :py:meth:`value_coder`)
+        """
+        words = vocab.words
+
+        def decoder(code):
+            if code < 0:
+                return None
+            return words[code]
+        return decoder
+
+    def set_terminal_column(self, att_name, values, start=0, vocab=None):
+        """
+        sets a terminal attribute for positions start..start+len(values)-1
+        in one pass. With a vocab, values are integer codes (for instance
+        from a model that was fed :py:meth:`terminal_array`).
+        """
+        att = self.t_schema.attribute_by_name(att_name)
+        prop = att.prop_name
+        if vocab is not None:
+            values = map(self.value_decoder(vocab), values)
+        values = list(values)
+        end = start + len(values)
+        if start < 0 or end > len(self.words):
+            raise IndexError("column %d..%d outside of document" % (
+                start, end))
+        for n, val in izip(islice(self.w_objs, start, end), values):
+            setattr(n, prop, val)
+        if prop == self.word_attr:
+            self.words[start:end] = values
+
+    def replace_level(self, level, starts, ends, attrs=None,
+                      start=0, end=None, vocabs=None):
+        """
+        replaces all markables of a level that start in start..end-1
+        by new ones with the given spans, creating the objects in bulk
+        and merging them into the markable index in one step.
+
+        :param starts: the start positions of the new markables
+        :param ends: the end positions (exclusive)
+        :param attrs: a dictionary from attribute names to sequences
+           of values, one per markable
+        :param vocabs: a dictionary from attribute names to a
+           PythonAlphabet, for attributes whose values are codes
+        :return: the list of new markables
+        """
+        if end is None:
+            end = len(self.words)
+        if attrs is None:
+            attrs = {}
+        if vocabs is None:
+            vocabs = {}
+        schema = self.schema_by_name(level)
+        columns = {}
+        for att_name, values in attrs.items():
+            if att_name in vocabs:
+                values = map(self.value_decoder(vocabs[att_name]), values)
+            columns[att_name] = list(values)
+        init_cols = [columns.get(att.name) for att in schema.init_attrs]
+        init_names = set([att.name for att in schema.init_attrs])
+        other_cols = [(att.prop_name, columns[att.name])
+                      for att in schema.attributes
+                      if att.name in columns and att.name not in init_names]
+        cls = schema.cls
+        new_objs = []
+        by_start = defaultdict(list)
+        for i, (m_start, m_end) in enumerate(izip(starts, ends)):
+            m_start = int(m_start)
+            m_end = int(m_end)
+            if not start <= m_start < end:
+                raise ValueError("markable %d..%d starts outside of %d..%d" % (
+                    m_start, m_end, start, end))
+            obj = cls(*[None if col is None else col[i]
+                        for col in init_cols])
+            for prop, col in other_cols:
+                setattr(obj, prop, col[i])
+            obj.span = [m_start, m_end]
+            new_objs.append(obj)
+            by_start[m_start].append((schema, obj))
+        self.clear_objects_by_level(level, start, end)
+        self.merge_markables(by_start)
+        return new_objs
+
+    def terminal_array(self, att_name, vocab=None, start=0, end=None):
+        """
+        returns the values of a terminal attribute for positions
+        start..end-1 as an int32 NumPy array of codes
+        (see :py:meth:`value_coder`)
+        """
+        np = import_numpy()
+        if end is None:
+            end = len(self.words)
+        att = self.t_schema.attribute_by_name(att_name)
+        coder = self.value_coder(att, vocab)
+        prop = att.prop_name
+        return np.fromiter(
+            (coder(getattr(n, prop, None))
+             for n in islice(self.w_objs, start, end)),
+            dtype=np.int32, count=end - start)
+
+    def markable_array(self, level, att_name=None, vocab=None,
+                       start=0, end=None):
+        """
+        returns the markables of a level that start in start..end-1
+        as an int32 array with rows (start, end, code), with positions
+        relative to start. Without att_name, all codes are -1.
+        """
+        np = import_numpy()
+        objs = self.get_objects_by_level(level, start, end)
+        result = np.empty((len(objs), 3), dtype=np.int32)
+        result[:, 0] = [obj.span[0] - start for obj in objs]
+        result[:, 1] = [obj.span[-1] - start for obj in objs]
+        if att_name is None:
+            result[:, 2] = -1
+        else:
+            att = self.schema_by_name(level).attribute_by_name(att_name)
+            coder = self.value_coder(att, vocab)
+            prop = att.prop_name
+            result[:, 2] = [coder(getattr(obj, prop, None)) for obj in objs]
+        return result
+
+    def sentence_offsets(self, level='sentence', start=0, end=None):
+        """
+        returns the sentence boundaries between start and end as
+        an int64 array of offsets relative to start: sentence i
+        spans offsets[i]..offsets[i+1]-1
+        """
+        np = import_numpy()
+        objs = self.get_objects_by_level(level, start, end)
+        offsets = [obj.span[0] - start for obj in objs]
+        if objs:
+            offsets.append(objs[-1].span[-1] - start)
+        return np.array(offsets, dtype=np.int64)
+
+    def dependency_heads(self, start=0, end=None, attr='syn_parent'):
+        """
+        returns the dependency head (syn_parent) of each terminal in
+        start..end-1 as an int32 array of positions relative to
+        start; roots, and heads outside the range, are -1
+        """
+        np = import_numpy()
+        if end is None:
+            end = len(self.words)
+        heads = np.fromiter(
+            (-1 if p is None else p.span[0]
+             for p in (getattr(n, attr, None)
+                       for n in islice(self.w_objs, start, end))),
+            dtype=np.int32, count=end - start)
+        outside = (heads < start) | (heads >= end)
+        heads -= start
+        heads[outside] = -1
+        return heads
+
     def describe_schema(self, f, encoding=None):
         edge_descrs = {}
         f.write("<schema>\n")
@@ -1482,6 +2236,7 @@ def add_tree_to_doc(t, ctx, start=None):
         n.xml_id = '%s_%d' % (prefix, i + 1)
     for n in t.roots:
         assign_node_ids(n, prefix, sent_start)
+    markables = []
     if hasattr(t, 'all_nes'):
         last_num = defaultdict(int)
         suffixes = ['', 'a', 'b', 'c', 'd']
@@ -1493,46 +2248,137 @@ def add_tree_to_doc(t, ctx, start=None):
             suff = suffixes[last_num[ne_start]]
             last_num[ne_start] += 1
             ne.xml_id = 'ne_%s%s' % (ne_start, suff)
-            ctx.register_object(ne)
+            markables.append(ne)
     if start is None:
-        for n in t.terminals:
-            ctx.add_terminal(n)
+        ctx.add_terminals(t.terminals)
     else:
         for i, n in enumerate(t.terminals):
             ctx.replace_terminal(start + i, n)
     t.span = [sent_start, sent_start + len(t.terminals)]
-    ctx.register_object(t)
-    for n in t.node_table.values():
-        ctx.register_object(n)
-
-
-def postprocess_doc(doc, start=0, end=None):
-    for t in doc.get_objects_by_class(tree.Tree, start, end):
-        t.terminals = doc.w_objs[t.span[0]:t.span[-1]]
-        all_nonterm = doc.get_objects_by_class(
-            tree.NontermNode, t.span[0], t.span[-1])
-        for n in all_nonterm:
-            n.children = []
-            n.start = n.span[0] - t.span[0]
-            n.end = n.span[-1] - t.span[0]
-        roots = []
-        for i, n in enumerate(t.terminals):
-            if n.parent is not None:
-                n.parent.children.append(n)
-            else:
-                roots.append(n)
-            n.start = i
-            n.end = i + 1
-        for n in all_nonterm:
-            if n.parent is not None:
-                n.parent.children.append(n)
-            else:
-                roots.append(n)
-        roots.sort(key=lambda n: n.span[0])
-        t.roots = roots
-        for n in all_nonterm:
-            assert n.children, (n.span, n.cat, n.xml_id, t.span, t.xml_id)
-            n.children.sort(key=lambda n1: n1.span[0])
+    markables.append(t)
+    markables += t.node_table.values()
+    ctx.register_objects(markables)
+
+
+def _attach_tree_node(n, roots):
+    parent = n.parent
+    if parent is None:
+        roots.append(n)
+    else:
+        parent.children.append(n)
+
+
+def set_node_offsets(t, nodes):
+    """
+    sets start and end of the nonterminal nodes of one sentence,
+    relative to its start
+    """
+    t_start = t.span[0]
+    for n in nodes:
+        n.start = n.span[0] - t_start
+        n.end = n.span[-1] - t_start
+
+
+def set_terminal_offsets(doc, t):
+    """
+    sets start and end of the terminals of one sentence, relative
+    to its start, and returns the terminals
+    """
+    terminals = doc.w_objs[t.span[0]:t.span[-1]]
+    for i, n in enumerate(terminals):
+        n.start = i
+        n.end = i + 1
+    return terminals
+
+
+def build_tree(doc, t, nodes, node_offsets=True):
+    """
+    fills in terminals, roots and children of one sentence.
+
+    :param t: the :py:class:`tree.Tree` object
+    :param nodes: the nonterminal nodes of this sentence,
+       ordered by start position
+    :param node_offsets: if false, start and end of the nodes
+       have already been set by :py:func:`set_node_offsets`
+    """
+    if node_offsets:
+        set_node_offsets(t, nodes)
+    terminals = set_terminal_offsets(doc, t)
+    t.terminals = terminals
+    for n in nodes:
+        n.children = []
+    roots = []
+    # merge nonterminals and terminals by their start position;
+    # since siblings never share a start position, children and
+    # roots are appended in span order and need no sorting.
+    j = 0
+    n_nodes = len(nodes)
+    for i, n in enumerate(terminals):
+        while j < n_nodes and nodes[j].start <= i:
+            _attach_tree_node(nodes[j], roots)
+            j += 1
+        _attach_tree_node(n, roots)
+    while j < n_nodes:
+        _attach_tree_node(nodes[j], roots)
+        j += 1
+    t.roots = roots
+    for n in nodes:
+        assert n.children, (n.span, n.cat, n.xml_id, t.span, t.xml_id)
+
+
+def postprocess_doc(doc, start=0, end=None, lazy=False, markables=None):
+    """
+    reconstructs the tree structure of all sentences in the given range
+    in a single sweep over the markables, assigning each nonterminal node
+    to the sentence it starts in.
+
+    :param lazy: if true, only remember the nodes of each sentence and
+       build roots, terminals and children on first access; start
+       and end of the nonterminal nodes are set right away, those of
+       the terminals when the tree is built
+    :param markables: (position, [(mlevel, obj), ...]) pairs in
+       order of position, to sweep over instead of the markable
+       index of doc
+    :return: the list of processed :py:class:`tree.Tree` objects
+    """
+    if end is None:
+        end = len(doc.words)
+    if lazy:
+        def finish_tree(t, nodes):
+            # node offsets are cheap and widely used, so they are
+            # not deferred with the structure
+            set_node_offsets(t, nodes)
+            t.set_builder(partial(build_tree, doc, nodes=nodes,
+                                  node_offsets=False), nodes)
+    else:
+        def finish_tree(t, nodes):
+            build_tree(doc, t, nodes)
+    if markables is None:
+        objs_by_start = doc.markables_by_start
+        markables = [(posn, objs_by_start[posn]) for posn in
+                     objs_by_start.irange(start, end, inclusive=(True, False))]
+    trees = []
+    t = None
+    nodes = []
+    for posn, o_here in markables:
+        if t is not None and posn >= t.span[-1]:
+            finish_tree(t, nodes)
+            t = None
+        for mlevel, obj in o_here:
+            if isinstance(obj, tree.Tree):
+                if t is not None:
+                    finish_tree(t, nodes)
+                t = obj
+                nodes = []
+                trees.append(t)
+        if t is None:
+            continue
+        for mlevel, obj in o_here:
+            if isinstance(obj, tree.NontermNode):
+                nodes.append(obj)
+    if t is not None:
+        finish_tree(t, nodes)
+    return trees
 
 
 def read_json_doc(f_in, make_schema=None):
@@ -1574,30 +2420,48 @@ class XMLCorpusReader(object):
     This is currently considered experimental.
     """
 
-    def __init__(self, doc, fname, encoding='UTF-8'):
+    def __init__(self, doc, fname, encoding='UTF-8', window=None,
+                 window_unit='sentence', parser='etree'):
         """
         
         :param doc: a exmldoc.Document
         :type doc: Document
-        :param fname: a filename
+        :param fname: a filename, or a file object opened in binary mode
         :param encoding: the encoding for the corpus
+        :param window: if given, addNext also returns after this many
+           markables of the level window_unit (or tokens, if
+           window_unit is 'token') inside a text. References to
+           objects that have not been read yet are then
+           :py:class:`PendingRef` objects until their targets arrive.
+        :param parser: the parser backend, 'etree' or 'expat'
+           (see :py:mod:`exmldoc.parsers`)
         """
         self.doc = doc
-        self.fname = fname
-        if fname.endswith('.gz'):
+        if hasattr(fname, 'read'):
+            f_in = fname
+            fname = getattr(f_in, 'name', None)
+        elif fname.endswith('.gz'):
             f_in = gzip.open(fname, 'rb')
         else:
             f_in = open(fname, 'rb')
-        if have_lxml:
-            # try to recover from XML problems
-            self.parse = etree.iterparse(f_in, events=('start', 'end',), recover=True)
-        else:
-            self.parse = etree.iterparse(f_in, events=('start', 'end',))
+        self.fname = fname
+        self.parse = parsers.iterparse(f_in, parser)
         self.state = 'BEFORE_HEAD'
         self.encoding = normalize_encoding(encoding)
         self.markable_stack = []
         self.old_posn = 0
         self.at_end = False
+        self.window = window
+        self.window_unit = window_unit
+        self.window_count = 0
+        # the open elements inside the body, outermost first
+        self.elem_stack = []
+        # markables that were open when addNext returned
+        self.open_history = []
+        # objects with PendingRef values, by the ID they wait for
+        self.ref_holders = defaultdict(list)
+        if window is not None and doc.pending_refs is None:
+            doc.pending_refs = set()
 
     def read_header(self):
         # read until end of header
@@ -1611,19 +2475,132 @@ class XMLCorpusReader(object):
                 return
 
     def addNext(self):
-        # read until end-of-text or end-of-body and return last_stop
+        # read until end-of-text, end-of-window or end-of-body
+        # and return last_stop
+        start = len(self.doc.words)
+        result = self.read_next()
+        self.end_window(start, len(self.doc.words))
+        return result
+
+    def end_window(self, start, end):
+        """
+        remembers the open markables and patches references to
+        the objects that arrived in start..end-1
+        """
+        history = self.open_history
+        for m in self.markable_stack:
+            if not [m1 for m1 in history if m1[1] is m[1]]:
+                history.append(m)
+        self.window_count = 0
+        if self.doc.pending_refs:
+            self.patch_refs(start, end)
+
+    def window_markables(self, start, end):
+        """
+        returns the (mlevel, obj) pairs of the markables that
+        overlap start..end-1 across a window boundary: those that
+        start earlier, and those that end later or are still open.
+        Pass them as open_markables to
+        :py:meth:`Document.write_inline_xml` or
+        :py:meth:`Document.inline_events` when writing windows.
+        Ranges have to be asked for in order.
+        """
+        result = []
+        history = []
+        for m in self.open_history:
+            m_start, m_end = m[1].span[0], m[1].span[-1]
+            if m_end is not None and m_end <= start:
+                continue
+            history.append(m)
+            if m_start < end and (m_start < start or m_end is None or
+                                  m_end > end):
+                result.append(m)
+        self.open_history = history
+        return result
+
+    def patch_refs(self, start, end):
+        doc = self.doc
+        holders = self.ref_holders
+        objs = [n for n in doc.w_objs[start:end] if n is not None]
+        mbs = doc.markables_by_start
+        for pos in mbs.irange(start, end, inclusive=(True, False)):
+            objs += [obj for (mlevel, obj) in mbs[pos]]
+        objs += [obj for (mlevel, obj) in self.open_history]
+        object_by_id = doc.object_by_id
+        for obj in objs:
+            for k in replace_pending_refs(obj, object_by_id):
+                holders[k].append(obj)
+        for k in [k for k in holders if k in object_by_id]:
+            for obj in holders.pop(k):
+                replace_pending_refs(obj, object_by_id)
+        doc.pending_refs = set(holders)
+
+    def fill_window(self, last_elem, encoding):
+        """
+        fills in the attributes of the words and markables that were
+        completed since the last window, up to last_elem, and drops
+        their elements; the open markables get the attributes of
+        their own element
+        """
+        doc = self.doc
+        elem_stack = self.elem_stack
+        for i, elem in enumerate(elem_stack):
+            if i + 1 < len(elem_stack):
+                inner = elem_stack[i + 1]
+            else:
+                inner = None
+            # the parser may have built elements further on already
+            for chld in list(elem):
+                if chld is inner:
+                    break
+                if chld.tag != 'word':
+                    try:
+                        doc.schema_by_name(chld.tag)
+                    except KeyError:
+                        # edges are read with their parent
+                        continue
+                fill_attributes(chld, doc, encoding)
+                elem.remove(chld)
+                if chld is last_elem:
+                    break
+            if elem.tag != 'word' and 'span' not in elem.attrib:
+                try:
+                    schema = doc.schema_by_name(elem.tag)
+                except KeyError:
+                    continue
+                schema.fill_from_xml(doc.object_by_id[elem.attrib[
+                    QNAME_XML_ID]], elem, doc, encoding)
+
+    def read_next(self):
         if self.state in ['BEFORE_HEAD']:
             self.read_header()
         doc = self.doc
         markable_stack = self.markable_stack
+        elem_stack = self.elem_stack
+        window = self.window
+        window_unit = self.window_unit
         encoding = self.encoding
         last_stop = len(doc.words)
         cur_pos = last_stop
         temp_ids = []
+        in_word = False
+        # terminals and markables are added to the document in
+        # batches, before attributes are filled in and on return
+        new_words = []
+        new_markables = defaultdict(list)
+
+        def flush():
+            if new_words:
+                doc.add_terminals(new_words)
+                del new_words[:]
+            if new_markables:
+                doc.merge_markables(new_markables)
+                new_markables.clear()
         while self.state == 'BEFORE_BODY':
             evt, elem = next(self.parse)
             if evt == 'start' and elem.tag == 'body':
                 self.state = 'IN_BODY'
+                self.elem_stack.append(elem)
         if self.state == 'AT_END':
             self.at_end = True
             raise StopIteration()
@@ -1632,15 +2609,18 @@ class XMLCorpusReader(object):
                 evt, elem = next(self.parse)
             except StopIteration:
                 self.state = 'AT_END'
+                flush()
                 return len(doc.words)
             if evt == 'end' and elem.tag == 'body':
                 # wrap up any loose ends
+                flush()
                 for chld in elem.getchildren():
                     fill_attributes(chld, doc, encoding)
                 if last_stop != self.old_posn:
                     self.old_posn = last_stop
                     return last_stop
             elif evt == 'start':
+                elem_stack.append(elem)
                 # create markable
                 # if a markable or word does not have an XML-id,
                 # assign one by default
@@ -1648,9 +2628,9 @@ class XMLCorpusReader(object):
                     schema = doc.t_schema
                     obj = schema.create_from_xml(elem, doc, encoding)
                     obj.span = [cur_pos, None]
-                    #print >>sys.stderr, "found word: %s"%(obj.word,)
-                    doc.add_terminal(obj)
+                    new_words.append(obj)
                     doc.object_by_id[obj.xml_id] = obj
+                    last_word = obj
                     in_word = True
                 else:
                     # set start point
@@ -1659,7 +2639,7 @@ class XMLCorpusReader(object):
                     except KeyError:
                         # assume it's an edge; we'll deal with it later
                         if in_word:
-                            (schema, obj) = (doc.t_schema, doc.words[-1])
+                            (schema, obj) = (doc.t_schema, last_word)
                         elif markable_stack:
                             (schema, obj) = markable_stack[-1]
                         else:
@@ -1679,10 +2659,15 @@ class XMLCorpusReader(object):
                         markable_stack.append((schema, obj))
             elif evt == 'end':
                 # print elem.tag, markable_stack
+                if elem_stack and elem_stack[-1] is elem:
+                    elem_stack.pop()
                 if elem.tag == 'word':
                     in_word = False
                     cur_pos += 1
+                    if window_unit == 'token':
+                        self.window_count += 1
                 elif elem.tag == 'body':
+                    flush()
                     for chld in elem.getchildren():
                         fill_attributes(chld, doc, encoding)
                     elem.clear()
@@ -1693,12 +2678,20 @@ class XMLCorpusReader(object):
                     # set end point of markable
                     (schema, obj) = markable_stack.pop()
                     obj.span[1] = cur_pos
-                    doc.register_object(obj, schema)
+                    new_markables[obj.span[0]].append((schema, obj))
+                    if schema.name == window_unit:
+                        self.window_count += 1
                 if elem.tag in ['text', 'doc']:
+                    flush()
                     fill_attributes(elem, doc, encoding)
                     elem.clear()
                     self.old_posn = last_stop
                     return last_stop
+                if window is not None and self.window_count >= window:
+                    flush()
+                    self.fill_window(elem, encoding)
+                    self.old_posn = last_stop
+                    return last_stop
 
     def inline_events(self, levels=None, clean=True):
         """
@@ -1714,14 +2707,19 @@ class XMLCorpusReader(object):
             try:
                 new_stop = self.addNext()
                 #print("InEv from:", last_stop, "to:", new_stop)
-                for ev in self.doc.inline_events(last_stop, new_stop, levels):
+                for ev in self.doc.inline_events(
+                        last_stop, new_stop, levels,
+                        self.window_markables(last_stop, new_stop)):
                     yield ev
                 if clean:
                     self.doc.clear_markables(last_stop, new_stop)
                 last_stop = new_stop
             except StopIteration:
                 #print("InEvStop from:", last_stop, "to:", new_stop)
-                for ev in self.doc.inline_events(last_stop, len(self.doc.words), levels):
+                end = len(self.doc.words)
+                for ev in self.doc.inline_events(
+                        last_stop, end, levels,
+                        self.window_markables(last_stop, end)):
                     yield ev
                 break
 
@@ -1743,12 +2741,15 @@ class JSONCorpusReader:
         # TODO: basic consistency check to ensure
         # that JSON offsets are right
         l = self.f.readline()
-        if l == '':
+        if not l:
             raise StopIteration
-        last_stop = len(self.doc.words)
         obj = json.loads(l)
         self.doc.json_insert(obj)
-        return last_stop
+        return len(self.doc.words)
+
+    def window_markables(self, start, end):
+        # JSON chunks are complete texts
+        return []
 
 
 def read_trees_exml(fname):
@@ -1763,21 +2764,9 @@ def read_trees_exml(fname):
     while True:
         try:
             new_stop = reader.addNext()
-            print("last_stop=%d new_stop=%d" % (
-                last_stop, new_stop), file=sys.stderr)
             if new_stop != last_stop:
-                trees = doc.get_objects_by_class(
-                    tree.Tree, last_stop, new_stop)
-                print("%d sentences in %d tokens" % (
-                    len(trees), new_stop - last_stop), file=sys.stderr)
+                trees = postprocess_doc(doc, last_stop, new_stop)
                 for t in trees:
-                    # TODO fill terminals
-                    t.terminals = doc.w_objs[t.span[0]:t.span[-1]]
-                    for i, n in enumerate(t.terminals):
-                        n.start = i
-                        n.end = i + 1
-                    # TODO fill roots
-                    # TODO set start/end of NT nodes
                     yield t
                 last_stop = new_stop
         except StopIteration:
@@ -1786,8 +2775,13 @@ def read_trees_exml(fname):
             assert len(trees) == 0
             break
 
-def create_doc(extra_word_attrs=None, extra_levels=None, **extra):
+def create_doc(extra_word_attrs=None, extra_levels=None,
+               dense_markables=False, edge_store=False, **extra):
     doc = make_syntax_doc(want_deps=True)
+    if dense_markables:
+        doc.set_dense_markables()
+    if edge_store:
+        doc.use_edge_store()
     if extra_word_attrs is not None:
         t_schema = doc.t_schema
         for att in extra_word_attrs:
@@ -1802,24 +2796,59 @@ def create_doc(extra_word_attrs=None, extra_levels=None, **extra):
                 level.add_attribute(att)
     return doc
 
-def load(fname, extra_word_attrs=None, extra_levels=None, encoding=None, **extra):
+def load(fname, extra_word_attrs=None, extra_levels=None, encoding=None,
+         lazy_trees=False, cache=None, parser='etree', **extra):
     """
     reads an EXML document as produced by ExmlPipe
 
     :param fname: the filename of the EXML document 
+    :param lazy_trees: if true, the roots, terminals and children of
+       each sentence are only computed when they are first accessed
+    :param dense_markables: if true, keep markables in a position-indexed
+       :py:class:`DenseBag`, which is cheaper for syntax-heavy documents
+    :param edge_store: if true, keep edges in an :py:class:`EdgeStore`
+       instead of lists on each object
+    :param cache: a :py:class:`exmldoc.loadcache.LoadCache` (or the
+       name of its directory) that keeps parsed documents
+    :param parser: the parser backend, see :py:mod:`exmldoc.parsers`;
+       'expat' does not need lxml, but is slower than the default
+       and does not recover from XML errors
     :return: an exmldoc.Document
     """
+    if cache is not None:
+        from .loadcache import LoadCache
+        if not isinstance(cache, LoadCache):
+            cache = LoadCache(cache)
+        return cache.load(fname, extra_word_attrs, extra_levels, encoding,
+                          lazy_trees, parser=parser, **extra)
     doc = create_doc(extra_word_attrs, extra_levels, **extra)
-    reader = XMLCorpusReader(doc, fname, encoding)
+    reader = XMLCorpusReader(doc, fname, encoding, parser=parser)
     last_stop = len(doc.words)
     while True:
         try:
             reader.addNext()
         except StopIteration:
-            postprocess_doc(doc)
+            postprocess_doc(doc, lazy=lazy_trees)
             return doc
 
 
+def open_lazy(fname, cache_size=16, extra_word_attrs=None, extra_levels=None,
+              encoding=None, lazy_trees=True, **extra):
+    """
+    opens an EXML document without reading it: only the schema and
+    a text index (see :py:mod:`exmldoc.textindex`) are read, and the
+    texts are loaded when they are accessed.
+
+    :param cache_size: the number of texts to keep in memory
+    :return: an :py:class:`exmldoc.lazy.LazyDocument`
+    """
+    from .lazy import LazyDocument
+    return LazyDocument(fname, cache_size, encoding=encoding,
+                        lazy_trees=lazy_trees,
+                        extra_word_attrs=extra_word_attrs,
+                        extra_levels=extra_levels, **extra)
+
+
 def write_corpus_xml(doc, reader, f_out, encoding="ISO-8859-15"):
     """
     writes a corpus as an ExportXMLv2 xml file
@@ -1834,12 +2863,17 @@ def write_corpus_xml(doc, reader, f_out, encoding="ISO-8859-15"):
         try:
             new_stop = reader.addNext()
             if (new_stop != last_stop):
-                doc.write_inline_xml(f_out, last_stop, new_stop)
+                doc.write_inline_xml(
+                    f_out, last_stop, new_stop,
+                    open_markables=reader.window_markables(
+                        last_stop, new_stop))
                 doc.clear_markables(last_stop, new_stop)
                 last_stop = new_stop
         except StopIteration:
             break
-    doc.write_inline_xml(f_out, last_stop)
+    doc.write_inline_xml(
+        f_out, last_stop,
+        open_markables=reader.window_markables(last_stop, len(doc.words)))
     print('</body>', file=f_out)
     print('</exml-doc>', file=f_out)
 
@@ -1990,7 +3024,10 @@ def fill_attributes(elem, doc, encoding=None):
                 c_schema = doc.schema_by_name(chld.tag)
             except KeyError:
                 e_schema = schema.edge_by_name(chld.tag)
-                edges = e_schema.get_edges(obj, doc)
+                if hasattr(e_schema, 'add_edge'):
+                    edges = None
+                else:
+                    edges = e_schema.get_edges(obj, doc)
                 val = []
                 for att in e_schema.attributes:
                     if att.name in chld.attrib:
@@ -2001,8 +3038,11 @@ def fill_attributes(elem, doc, encoding=None):
                             schema.name, e_schema.name, att.name))
                         val.append(None)
                 # print e_schema.name, val
-                edges.append(val)
-                e_schema.set_edges(obj, edges, doc)
+                if hasattr(e_schema, 'add_edge'):
+                    e_schema.add_edge(obj, val, doc)
+                else:
+                    edges.append(val)
+                    e_schema.set_edges(obj, edges, doc)
                 continue
             else:
                 fill_attributes(chld, doc, encoding)
@@ -12,6 +12,21 @@ class PythonAlphabet(object):
             self.obj2int[k] = n
             return n
 
+    def add_new(self, objs):
+        """
+        appends objects that are not in the alphabet yet and returns
+        True; if any of them is already there, or occurs twice,
+        nothing is added and the result is False
+        """
+        obj2int = self.obj2int
+        if any(map(obj2int.__contains__, objs)) or \
+                len(set(objs)) != len(objs):
+            return False
+        n = len(self.int2obj)
+        self.int2obj.extend(objs)
+        obj2int.update(zip(objs, range(n, n + len(objs))))
+        return True
+
     def __len__(self):
         return len(self.int2obj)
 
@@ -2,7 +2,11 @@
 Support for the msgpack-based binary format
 """
 from msgpack import Unpacker, Packer
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, OrderedDict
+from itertools import compress, repeat
+from operator import is_not
+
+import exmldoc
 
 class MsgpackReader(object):
     def __init__(self, f):
@@ -30,7 +34,7 @@ def objects_to_packed(doc, objs, schema, want_span):
         last_offset = 0
         for i, obj in enumerate(objs):
             span_array[i] = obj.span[0] - last_offset
-            span_array[n+1] = obj.span[-1] - obj.span[0]
+            span_array[n+i] = obj.span[-1] - obj.span[0]
             last_offset = obj.span[-1]
         names.append(':span')
         data.append(span_array)
@@ -114,6 +118,254 @@ class MsgpackWriter(object):
             self.pack(schema.name)
             self.pack(objects_to_packed(doc, objs, schema, True))
 
+def attribute_tag(attr):
+    if isinstance(attr, exmldoc.EnumAttribute):
+        return 'enum-attr'
+    elif isinstance(attr, (exmldoc.RefAttribute, exmldoc.IDRefAttribute)):
+        return 'node-ref'
+    return 'text-attr'
+
+
+def attributes_to_list(attrs):
+    result = []
+    for attr in attrs:
+        tag = attribute_tag(attr)
+        if tag == 'enum-attr':
+            result.append([tag, attr.name, list(attr.alphabet.words)])
+        else:
+            result.append([tag, attr.name, None])
+    return result
+
+
+def schema_to_list(doc):
+    """
+    describes the schema of a document in a form from which
+    :py:func:`schema_element` rebuilds the EXML schema header
+    """
+    nodes = [['tnode', 'word', attributes_to_list(doc.t_schema.attributes)]]
+    edges = OrderedDict()
+    for schema in [doc.t_schema] + doc.schemas:
+        if schema is not doc.t_schema:
+            nodes.append(['node', schema.name,
+                          attributes_to_list(schema.attributes)])
+        for edge in schema.edges:
+            if edge.name not in edges:
+                edges[edge.name] = [[], attributes_to_list(
+                    getattr(edge, 'attributes', ()))]
+            edges[edge.name][0].append(schema.name)
+    for name, (parents, attrs) in edges.items():
+        nodes.append(['edge', name, attrs, '|'.join(parents)])
+    return nodes
+
+
+def schema_element(nodes):
+    """
+    turns the result of :py:func:`schema_to_list` into a schema
+    element for :py:func:`exmldoc.process_schema`
+    """
+    etree = exmldoc.etree
+    elem = etree.Element('schema')
+    for node in nodes:
+        chld = etree.SubElement(elem, node[0], name=node[1])
+        if node[0] == 'edge':
+            chld.set('parent', node[3])
+        for tag, name, vals in node[2]:
+            att = etree.SubElement(chld, tag, name=name)
+            for val in vals or ():
+                etree.SubElement(att, 'val', name=val)
+    return elem
+
+
+def map_edge(edge, val, doc):
+    return [doc.get_obj_id(v) if v is not None and
+            isinstance(att, exmldoc.RefAttribute) else v
+            for att, v in zip(edge.attributes, val)]
+
+
+def unmap_edge(edge, val, doc):
+    return [att.unmap_attr(v, doc) if v is not None and
+            isinstance(att, exmldoc.RefAttribute) else v
+            for att, v in zip(edge.attributes, val)]
+
+
+def objects_to_columns(doc, objs, schema):
+    """
+    like :py:func:`objects_to_packed`, but keeps attribute values
+    as they are in the objects (references become IDs), so that
+    :py:func:`columns_to_objects` gives back the same objects.
+    """
+    columns = OrderedDict()
+    columns[':id'] = [getattr(obj, 'xml_id', None) for obj in objs]
+    columns[':span'] = [obj.span for obj in objs]
+    for attr in schema.attributes:
+        prop = attr.prop_name
+        vals = [getattr(obj, prop, None) for obj in objs]
+        if isinstance(attr, exmldoc.RefAttribute):
+            vals = [doc.get_obj_id(v) if v is not None else None
+                    for v in vals]
+        if any([v is not None for v in vals]):
+            columns[attr.name] = vals
+    for edge in schema.edges:
+        if not hasattr(edge, 'get_edges'):
+            continue
+        vals = [[map_edge(edge, val, doc)
+                 for val in edge.get_edges(obj, doc)] for obj in objs]
+        if any(vals):
+            columns[':edge:' + edge.name] = vals
+    return columns
+
+
+def set_column(objs, prop, vals):
+    """
+    sets the attribute prop of each object to its value in vals,
+    leaving out None values
+    """
+    # the loops run in C: map for the calls, deque to consume them
+    if None in vals:
+        present = list(map(is_not, vals, repeat(None, len(vals))))
+        objs = list(compress(objs, present))
+        vals = list(compress(vals, present))
+    deque(map(setattr, objs, repeat(prop, len(objs)), vals), 0)
+
+
+def columns_to_objects(doc, n, columns, schema, terminal=False):
+    """
+    creates the objects for columns from :py:func:`objects_to_columns`
+    and registers their IDs; attributes are set, but references and
+    edges are left to :py:func:`fill_columns`
+    """
+    ids = columns[':id']
+    if terminal:
+        nones = [None] * n
+        objs = list(map(schema.cls, columns.get('pos', nones),
+                        columns.get('form', nones)))
+    else:
+        init_vals = [columns.get(att.name, [None] * n)
+                     for att in schema.init_attrs]
+        cls = schema.cls
+        objs = list(map(cls, *init_vals)) if init_vals else \
+            [cls() for i in range(n)]
+    set_column(objs, 'span', columns[':span'])
+    set_column(objs, 'xml_id', ids)
+    object_by_id = doc.object_by_id
+    object_by_id.update(zip(ids, objs))
+    if None in ids:
+        del object_by_id[None]
+    for attr in schema.attributes:
+        if attr.name not in columns or \
+                isinstance(attr, exmldoc.RefAttribute):
+            continue
+        set_column(objs, attr.prop_name, columns[attr.name])
+    return objs
+
+
+def fill_columns(doc, objs, columns, schema):
+    """
+    sets the references and edges of objects from their columns;
+    references to objects that are not in doc become
+    :py:class:`exmldoc.PendingRef` placeholders if doc.pending_refs
+    is a set.
+    """
+    get_obj = doc.object_by_id.get
+    for attr in schema.attributes:
+        if attr.name in columns and isinstance(attr, exmldoc.RefAttribute):
+            vals = columns[attr.name]
+            targets = list(map(get_obj, vals))
+            if targets.count(None) != vals.count(None):
+                targets = [attr.unmap_attr(val, doc)
+                           if target is None and val is not None
+                           else target
+                           for val, target in zip(vals, targets)]
+            set_column(objs, attr.prop_name, targets)
+    for edge in schema.edges:
+        key = ':edge:' + edge.name
+        if key not in columns:
+            continue
+        for obj, vals in zip(objs, columns[key]):
+            if vals:
+                edge.set_edges(obj, [unmap_edge(edge, val, doc)
+                                     for val in vals], doc)
+
+
+def write_snapshot(doc, f):
+    """
+    writes a document in a form that :py:func:`read_snapshot` reads
+    back into an equal document: schema, terminals, and the markables
+    of each level in the order of the markable index.
+    """
+    levels = OrderedDict()
+    order = []
+    level_nums = {}
+    for posn, entries in doc.markables_by_start.items():
+        for mlevel, obj in entries:
+            name = mlevel.name
+            if name not in levels:
+                level_nums[name] = len(levels)
+                levels[name] = []
+            order.append(level_nums[name])
+            levels[name].append(obj)
+    packer = Packer(use_bin_type=True)
+    f.write(packer.pack_array_header(5))
+    f.write(packer.pack('exml-snapshot1'))
+    f.write(packer.pack(schema_to_list(doc)))
+    f.write(packer.pack([len(doc.w_objs), objects_to_columns(
+        doc, doc.w_objs, doc.t_schema)]))
+    f.write(packer.pack_array_header(len(levels)))
+    for name, objs in levels.items():
+        f.write(packer.pack([name, len(objs), objects_to_columns(
+            doc, objs, doc.schema_by_name(name))]))
+    f.write(packer.pack(order))
+
+
+def read_snapshot(f, doc, lazy_trees=None):
+    """
+    reads a document written by :py:func:`write_snapshot` into doc,
+    which should be empty and created with the same options as the
+    original one
+
+    :param lazy_trees: if not None, the trees are also set up, as
+       by ``postprocess_doc(doc, lazy=lazy_trees)``
+    """
+    unpacker = Unpacker(f, raw=False, max_buffer_size=0)
+    if unpacker.read_array_header() != 5 or \
+            unpacker.unpack() != 'exml-snapshot1':
+        raise ValueError("not a document snapshot")
+    exmldoc.process_schema(doc, schema_element(unpacker.unpack()))
+    n, t_columns = unpacker.unpack()
+    t_schema = doc.t_schema
+    w_objs = columns_to_objects(doc, n, t_columns, t_schema, True)
+    temp_ids = [doc.assign_temp_id(n) for n in w_objs
+                if not hasattr(n, 'xml_id')]
+    doc.add_terminals(w_objs)
+    for k in temp_ids:
+        doc.clear_temp_id(doc.object_by_id[k])
+    levels = []
+    for i in range(unpacker.read_array_header()):
+        name, n, columns = unpacker.unpack()
+        schema = doc.schema_by_name(name)
+        levels.append((schema, columns, columns_to_objects(
+            doc, n, columns, schema)))
+    by_start = OrderedDict()
+    positions = [0] * len(levels)
+    for k in unpacker.unpack():
+        schema, columns, objs = levels[k]
+        obj = objs[positions[k]]
+        positions[k] += 1
+        if obj.span[0] in by_start:
+            by_start[obj.span[0]].append((schema, obj))
+        else:
+            by_start[obj.span[0]] = [(schema, obj)]
+    doc.merge_markables(by_start)
+    fill_columns(doc, w_objs, t_columns, t_schema)
+    for schema, columns, objs in levels:
+        fill_columns(doc, objs, columns, schema)
+    if lazy_trees is not None:
+        # by_start is in order already
+        exmldoc.postprocess_doc(doc, lazy=lazy_trees,
+                                markables=by_start.items())
+    return doc
+
+
 if __name__ == '__main__':
     import sys
     from exmldoc import load
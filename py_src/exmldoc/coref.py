@@ -0,0 +1,220 @@
+"""
+An index of coreference chains, built from the ``relation`` and
+``splitRelation`` edges (``anaphora_info``) of a document.
+
+Mentions are merged with a union-find structure over object IDs in
+one pass over the markables; each chain keeps its members sorted by
+position, so that the first one is its representative, and a sorted
+list of mention start positions answers range queries. Mentions whose
+objects are not in the document yet are placed once they appear::
+
+  chains = doc.coref_chains()
+  chains.chain(mention)          # all mentions, in document order
+  chains.representative(mention)
+  chains.chains_in_range(0, 100)
+"""
+import sys
+from array import array
+from bisect import insort
+
+from sortedcontainers import SortedList
+
+from .alphabet import PythonAlphabet
+
+#: relation types that put the anaphor into the chain of its antecedent
+DEFAULT_KINDS = ('anaphoric', 'cataphoric', 'coreferential')
+
+#: the position of mentions whose objects are not known
+UNRESOLVED = (sys.maxsize, 0)
+
+
+class ChainIndex(object):
+
+    """
+    coreference chains of a document.
+
+    :param kinds: the relation types that link mentions; mentions
+       with other relations (and their targets) form chains of
+       their own
+    """
+
+    def __init__(self, doc, kinds=DEFAULT_KINDS):
+        self.doc = doc
+        self.kinds = frozenset(kinds)
+        self.rebuild()
+
+    def rebuild(self):
+        """recomputes all chains from the document"""
+        from . import get_anaphora_info
+        self.ids = PythonAlphabet()
+        self.parent = array('i')
+        self.members = {}
+        self.links = {}
+        self.starts = SortedList()
+        self.max_len = 0
+        self.unresolved = set()
+        self.n_objects = len(self.doc.object_by_id)
+        self.dirty = False
+        doc = self.doc
+        for pos, entries in doc.markables_by_start.items():
+            for mlevel, obj in entries:
+                self.add_links(obj, self.link_targets(
+                    get_anaphora_info(obj, doc)))
+        for n in doc.w_objs:
+            if n is not None:
+                self.add_links(n, self.link_targets(
+                    get_anaphora_info(n, doc)))
+
+    def link_targets(self, info):
+        if info is None or info[0] not in self.kinds or not info[1]:
+            return ()
+        return tuple(info[1])
+
+    def add_links(self, obj, targets):
+        if not targets:
+            return
+        k = self.add_mention(obj.xml_id)
+        target_ks = tuple([self.add_mention(tgt) for tgt in targets])
+        self.links[k] = target_ks
+        for k2 in target_ks:
+            self.union(k, k2)
+
+    def add_mention(self, obj_id):
+        ids = self.ids
+        k = ids[obj_id]
+        if k == len(self.parent):
+            self.parent.append(k)
+            obj = self.doc.object_by_id.get(obj_id)
+            if obj is None:
+                self.unresolved.add(k)
+                self.members[k] = [(UNRESOLVED, k)]
+            else:
+                self.members[k] = [(self.add_start(k, obj), k)]
+        return k
+
+    def add_start(self, k, obj):
+        start = obj.span[0]
+        self.starts.add((start, k))
+        self.max_len = max(self.max_len, obj.span[-1] - start)
+        return (start, -obj.span[-1])
+
+    def resolve_mentions(self):
+        """places the mentions whose objects were added since"""
+        object_by_id = self.doc.object_by_id
+        words = self.ids.words
+        for k in list(self.unresolved):
+            obj = object_by_id.get(words[k])
+            if obj is not None:
+                self.unresolved.remove(k)
+                members = self.members[self.find(k)]
+                members.remove((UNRESOLVED, k))
+                insort(members, (self.add_start(k, obj), k))
+        self.n_objects = len(object_by_id)
+
+    def find(self, k):
+        parent = self.parent
+        root = k
+        while parent[root] != root:
+            root = parent[root]
+        while parent[k] != root:
+            parent[k], k = root, parent[k]
+        return root
+
+    def union(self, k1, k2):
+        r1 = self.find(k1)
+        r2 = self.find(k2)
+        if r1 == r2:
+            return r1
+        # merge the smaller member list into the larger one
+        if len(self.members[r1]) < len(self.members[r2]):
+            r1, r2 = r2, r1
+        self.parent[r2] = r1
+        members = self.members[r1]
+        for entry in self.members.pop(r2):
+            insort(members, entry)
+        return r1
+
+    def update(self, obj):
+        """
+        takes into account a changed relation of obj. Added links are
+        merged in directly; if links were removed, the chains are
+        recomputed on the next query.
+        """
+        from . import get_anaphora_info
+        k = self.ids.obj2int.get(getattr(obj, 'xml_id', None))
+        old = self.links.get(k, ()) if k is not None else ()
+        new_targets = self.link_targets(get_anaphora_info(obj, self.doc))
+        old_ids = set([self.ids.words[k2] for k2 in old])
+        if not old_ids.issubset(new_targets):
+            self.dirty = True
+        elif not self.dirty:
+            self.add_links(obj, new_targets)
+
+    def _check(self):
+        if self.dirty:
+            self.rebuild()
+        elif (self.unresolved and
+              len(self.doc.object_by_id) != self.n_objects):
+            self.resolve_mentions()
+
+    def _root(self, obj):
+        self._check()
+        k = self.ids.obj2int.get(getattr(obj, 'xml_id', obj))
+        if k is None:
+            return None
+        return self.find(k)
+
+    def _objects(self, members):
+        words = self.ids.words
+        object_by_id = self.doc.object_by_id
+        result = [object_by_id.get(words[k]) for (posn, k) in members]
+        return [obj for obj in result if obj is not None]
+
+    def chain(self, obj):
+        """returns the mentions in the chain of obj, in document order"""
+        root = self._root(obj)
+        if root is None:
+            return [obj]
+        return self._objects(self.members[root])
+
+    def representative(self, obj):
+        """returns the first mention of the chain of obj"""
+        root = self._root(obj)
+        if root is None:
+            return obj
+        first = self.members[root][0][1]
+        return self.doc.object_by_id.get(self.ids.words[first])
+
+    def same_chain(self, obj1, obj2):
+        root = self._root(obj1)
+        return root is not None and root == self._root(obj2)
+
+    def chains(self):
+        """returns all chains, as lists of mentions in document order"""
+        self._check()
+        return [self._objects(members) for members in self.members.values()]
+
+    def chains_in_range(self, start, end):
+        """
+        returns the chains that have a mention overlapping the
+        tokens start..end-1, ordered by their first mention there
+        """
+        self._check()
+        starts = self.starts
+        words = self.ids.words
+        object_by_id = self.doc.object_by_id
+        i = starts.bisect_left((start - self.max_len, -1))
+        seen = set()
+        result = []
+        while i < len(starts):
+            m_start, k = starts[i]
+            i += 1
+            if m_start >= end:
+                break
+            if object_by_id[words[k]].span[-1] <= start:
+                continue
+            root = self.find(k)
+            if root not in seen:
+                seen.add(root)
+                result.append(self._objects(self.members[root]))
+        return result
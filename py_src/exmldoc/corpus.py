@@ -0,0 +1,420 @@
+"""
+A corpus made of a directory of EXML files.
+
+The files are ordered and given global token positions by
+``offsets.txt`` in the directory, which has one line per file with
+its name (with or without ``.exml.xml``) and the position of its first token.
+Files that are not listed come after the listed ones, in sorted order;
+files that changed since ``offsets.txt`` was written are counted
+again, and ``offsets.txt`` is rewritten once the new counts are
+known. Names in ``offsets.txt`` are kept as they are written; with
+``keep_suffix=True``, files that are added to it are listed with
+their suffix, as ``exml2cqp`` has always done.
+
+Next to ``offsets.txt``, ``manifest.txt`` records the size, mtime,
+content hash (SHA-1) and token count of each file. When it exists, a
+file counts as changed only if its size or mtime differ *and* its
+content hash is different, and the token counts of unchanged files
+are taken from it. :py:class:`OutputCache` keeps the per-file output
+of an export, so that only changed files need to be exported again::
+
+  corpus = Corpus('tueba_dir')
+  for name, doc, reader in corpus.readers():
+      ...
+  doc, posn = corpus.locate(1234567)
+"""
+from __future__ import print_function
+
+import glob
+import hashlib
+import os
+import os.path
+import sys
+from io import open as file_open
+from bisect import bisect_right
+from collections import OrderedDict
+
+import exmldoc
+from .lazy import CacheInfo
+
+EXML_SUFFIXES = ('.exml.xml', '.exml.xml.gz')
+
+
+def skip_through(reader):
+    """
+    continues reading a document until the end of the document
+    :param reader: a document reader
+    :return: the number of tokens in the document
+    """
+    doc = reader.doc
+    last_stop = len(doc.words)
+    while True:
+        try:
+            next_stop = reader.addNext()
+        except StopIteration:
+            doc.clear_markables(last_stop)
+            return len(doc.words)
+        doc.clear_markables(last_stop, next_stop)
+        last_stop = next_stop
+
+
+def strip_suffix(fname):
+    for suffix in EXML_SUFFIXES:
+        if fname.endswith(suffix):
+            return fname[:-len(suffix)]
+    return fname
+
+
+def file_hash(fname, block_size=1 << 20):
+    """returns the SHA-1 hash of a file's contents, as a hex string"""
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f_in:
+        while True:
+            block = f_in.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def default_create_doc():
+    return exmldoc.make_syntax_doc(want_deps=True)
+
+
+class Corpus(object):
+
+    """
+    the EXML files in a directory, with global token offsets.
+
+    :param create_doc: a function that creates an empty document
+       for each file
+    :param cache_size: the number of documents kept in memory
+       by :py:meth:`document`
+    :param keep_suffix: whether new files are listed in offsets.txt
+       with their suffix
+    """
+
+    def __init__(self, dirname, create_doc=None, cache_size=4,
+                 keep_suffix=False):
+        self.dirname = dirname
+        self.keep_suffix = keep_suffix
+        if create_doc is None:
+            create_doc = default_create_doc
+        self.create_doc = create_doc
+        self.offsets_fname = os.path.join(dirname, 'offsets.txt')
+        self.manifest_fname = os.path.join(dirname, 'manifest.txt')
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+        self.read_offsets()
+
+    def find_file(self, name, all_files):
+        for suffix in ('',) + EXML_SUFFIXES:
+            f_path = os.path.join(self.dirname, name + suffix)
+            if f_path in all_files:
+                return f_path
+        return None
+
+    def read_offsets(self):
+        """
+        reads offsets.txt and the directory listing. Token counts
+        are taken from offsets.txt for the files that did not change,
+        and are unknown (None) for all others.
+        """
+        all_files = set()
+        for suffix in EXML_SUFFIXES:
+            all_files.update(glob.glob(os.path.join(self.dirname,
+                                                    '*' + suffix)))
+        self.names = []
+        self.labels = []
+        self.paths = []
+        self.counts = []
+        self.saved = []
+        if os.path.exists(self.offsets_fname):
+            offsets_mtime = os.path.getmtime(self.offsets_fname)
+            entries = []
+            for l in open(self.offsets_fname):
+                line = l.strip().split()
+                if line:
+                    entries.append((line[0], int(line[1])))
+            self.saved = entries
+            for i, (label, start) in enumerate(entries):
+                name = strip_suffix(label)
+                f_path = self.find_file(name, all_files)
+                if f_path is None:
+                    print("%s is in offsets.txt but does not exist" % (
+                        name,), file=sys.stderr)
+                    continue
+                all_files.remove(f_path)
+                count = None
+                if (i + 1 < len(entries) and
+                        os.path.getmtime(f_path) <= offsets_mtime):
+                    count = entries[i + 1][1] - start
+                self.add_file(name, f_path, count, label)
+        for f_path in sorted(all_files):
+            label = os.path.basename(f_path)
+            if not self.keep_suffix:
+                label = strip_suffix(label)
+            self.add_file(strip_suffix(label), f_path, label=label)
+        self.starts = None
+        self.read_manifest()
+
+    def add_file(self, name, f_path, count=None, label=None):
+        self.names.append(name)
+        self.labels.append(name if label is None else label)
+        self.paths.append(f_path)
+        self.counts.append(count)
+
+    def read_manifest(self):
+        """
+        compares the files with manifest.txt, taking the token
+        counts of unchanged files from it
+        """
+        self.stats = [None] * len(self.names)
+        self.hashes = [None] * len(self.names)
+        self.saved_manifest = []
+        if not os.path.exists(self.manifest_fname):
+            self.changed = set(range(len(self.names)))
+            return
+        manifest = {}
+        for l in open(self.manifest_fname):
+            line = l.rstrip('\n').split('\t')
+            if len(line) == 5:
+                entry = (int(line[1]), int(line[2]), line[3], int(line[4]))
+                manifest[line[0]] = entry
+                self.saved_manifest.append((line[0],) + entry)
+        self.changed = set()
+        for k, name in enumerate(self.names):
+            entry = manifest.get(name)
+            st = os.stat(self.paths[k])
+            self.stats[k] = (st.st_size, int(st.st_mtime))
+            if entry is not None:
+                if self.stats[k] == entry[:2] or self.file_hash(k) == entry[2]:
+                    self.hashes[k] = entry[2]
+                    self.counts[k] = entry[3]
+                    continue
+            self.counts[k] = None
+            self.changed.add(k)
+
+    def file_hash(self, key):
+        """returns the content hash of a file"""
+        k = self.file_number(key)
+        if self.hashes[k] is None:
+            self.hashes[k] = file_hash(self.paths[k])
+        return self.hashes[k]
+
+    def is_changed(self, key):
+        """
+        returns True if a file is new or its contents changed since
+        manifest.txt was written
+        """
+        return self.file_number(key) in self.changed
+
+    def __len__(self):
+        starts = self.get_starts()
+        if not starts:
+            return 0
+        return starts[-1] + self.count(len(starts) - 1)
+
+    def file_number(self, key):
+        """maps a file name (or number) to the file number"""
+        if isinstance(key, int):
+            return key
+        return self.names.index(strip_suffix(key))
+
+    def count(self, key):
+        """returns the number of tokens in a file, reading it if needed"""
+        k = self.file_number(key)
+        if self.counts[k] is None:
+            doc = self.create_doc()
+            self.set_count(k, skip_through(
+                exmldoc.XMLCorpusReader(doc, self.paths[k])))
+        return self.counts[k]
+
+    def set_count(self, key, count):
+        k = self.file_number(key)
+        if self.counts[k] != count:
+            self.counts[k] = count
+            self.starts = None
+
+    def get_starts(self):
+        """returns the global position of the first token of each file"""
+        if self.starts is None:
+            starts = []
+            total = 0
+            for k in range(len(self.names)):
+                starts.append(total)
+                if k + 1 < len(self.names):
+                    total += self.count(k)
+            self.starts = starts
+        return self.starts
+
+    def locate(self, posn):
+        """
+        returns the document that contains the token at the global
+        position posn, and the position of the token in it
+        """
+        starts = self.get_starts()
+        k = bisect_right(starts, posn) - 1
+        if k < 0 or posn >= starts[k] + self.count(k):
+            raise IndexError(posn)
+        return self.document(k), posn - starts[k]
+
+    def save_offsets(self):
+        """rewrites offsets.txt if any file was added, removed or changed"""
+        entries = list(zip(self.labels, self.get_starts()))
+        if entries == self.saved:
+            return
+        tmp_fname = self.offsets_fname + '.tmp'
+        with open(tmp_fname, 'w') as f_offsets:
+            for name, start in entries:
+                print("%s\t%d" % (name, start), file=f_offsets)
+        os.rename(tmp_fname, self.offsets_fname)
+        self.saved = entries
+
+    def save_manifest(self):
+        """rewrites manifest.txt if the information for any file changed"""
+        entries = []
+        for k, name in enumerate(self.names):
+            if self.stats[k] is None:
+                st = os.stat(self.paths[k])
+                self.stats[k] = (st.st_size, int(st.st_mtime))
+            entries.append((name,) + self.stats[k] +
+                           (self.file_hash(k), self.count(k)))
+        if entries == self.saved_manifest:
+            return
+        tmp_fname = self.manifest_fname + '.tmp'
+        with open(tmp_fname, 'w') as f_manifest:
+            for entry in entries:
+                print("%s\t%d\t%d\t%s\t%d" % entry, file=f_manifest)
+        os.rename(tmp_fname, self.manifest_fname)
+        self.saved_manifest = entries
+        self.changed = set()
+
+    def files(self):
+        """returns (name, path) pairs in corpus order"""
+        return list(zip(self.names, self.paths))
+
+    def load_document(self, k, lazy_trees=True):
+        doc = self.create_doc()
+        reader = exmldoc.XMLCorpusReader(doc, self.paths[k])
+        while True:
+            try:
+                reader.addNext()
+            except StopIteration:
+                break
+        exmldoc.postprocess_doc(doc, lazy=lazy_trees)
+        self.set_count(k, len(doc.words))
+        return doc
+
+    def document(self, key):
+        """returns a file as a document, from the cache if possible"""
+        k = self.file_number(key)
+        cache = self.cache
+        try:
+            doc = cache.pop(k)
+        except KeyError:
+            self.misses += 1
+            doc = self.load_document(k)
+            while len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+        cache[k] = doc
+        return doc
+
+    def documents(self):
+        """yields (name, document) pairs in corpus order"""
+        for k, name in enumerate(self.names):
+            yield name, self.document(k)
+        self.save_offsets()
+        self.save_manifest()
+
+    def readers(self):
+        """
+        yields a (name, doc, reader) triple for each file, with an
+        empty document that the caller fills using the reader. Files
+        whose size is not known yet are read to the end afterwards,
+        and offsets.txt is updated at the end.
+        """
+        for k, name in enumerate(self.names):
+            doc = self.create_doc()
+            reader = exmldoc.XMLCorpusReader(doc, self.paths[k])
+            yield name, doc, reader
+            if reader.at_end:
+                self.set_count(k, len(doc.w_objs))
+            elif self.counts[k] is None:
+                self.set_count(k, skip_through(reader))
+        self.save_offsets()
+        self.save_manifest()
+
+    def cache_info(self):
+        """returns the hit, miss and eviction counts of the document cache"""
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.cache_size, len(self.cache))
+
+
+class OutputCache(object):
+
+    """
+    keeps the output of an export for each file of a corpus in
+    cache_dir, and gives it back as long as neither the content
+    hash of the file nor the export options change.
+
+    :param options: a string that describes the export options
+    """
+
+    def __init__(self, cache_dir, options=''):
+        self.cache_dir = cache_dir
+        self.options = options
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, corpus, k):
+        h = hashlib.sha1()
+        h.update(corpus.file_hash(k).encode('ascii'))
+        h.update(self.options.encode('UTF-8'))
+        return h.hexdigest()[:16]
+
+    def path(self, name, key):
+        return os.path.join(self.cache_dir, '%s.%s.out' % (name, key))
+
+    def has(self, corpus, k):
+        return os.path.exists(self.path(corpus.names[k], self.key(corpus, k)))
+
+    def get(self, corpus, k):
+        """
+        returns the cached (text, token count) for file k, or None;
+        the text is a str, like the output of the exporters
+        """
+        fname = self.path(corpus.names[k], self.key(corpus, k))
+        if not os.path.exists(fname):
+            return None
+        with file_open(fname, 'rb') as f_in:
+            count = int(f_in.readline())
+            text = f_in.read()
+        if not isinstance(text, str):
+            # Python 3
+            text = text.decode('UTF-8')
+        return text, count
+
+    def put(self, corpus, k, text, count):
+        """
+        stores the output for file k, replacing older versions. The
+        text can be unicode or UTF-8 encoded bytes (which the
+        exporters produce with Python 2).
+        """
+        name = corpus.names[k]
+        fname = self.path(name, self.key(corpus, k))
+        for old_fname in glob.glob(self.path(name, '*')):
+            old_key = os.path.basename(old_fname)[len(name) + 1:-4]
+            if old_fname != fname and '.' not in old_key:
+                os.remove(old_fname)
+        tmp_fname = fname + '.tmp'
+        if not isinstance(text, bytes):
+            text = text.encode('UTF-8')
+        with file_open(tmp_fname, 'wb') as f_out:
+            f_out.write(('%d\n' % (count,)).encode('ascii'))
+            f_out.write(text)
+        os.rename(tmp_fname, fname)
@@ -0,0 +1,395 @@
+"""
+Writes corpora directly in the binary format of the IMS Open Corpus
+Workbench (CWB), so that they can be queried with CQP without going
+through cwb-encode and cwb-makeall.
+
+All integers in CWB data files are 32-bit big-endian.
+"""
+from __future__ import print_function
+
+import os
+import os.path
+import sys
+from array import array
+
+if sys.version_info.major >= 3:
+    xrange = range
+    unicode = str
+
+NEED_SWAP = (sys.byteorder == 'little')
+INT_SIZE = array('i').itemsize
+assert INT_SIZE == 4
+
+#: number of corpus positions that are read at a time
+CHUNK_SIZE = 1 << 16
+
+
+def write_ints(f, ints):
+    """writes a sequence of ints in CWB (big-endian) format"""
+    arr = array('i', ints)
+    if NEED_SWAP:
+        arr.byteswap()
+    arr.tofile(f)
+
+
+def read_ints(f, n):
+    """reads up to n ints in CWB format, returns an array"""
+    arr = array('i')
+    try:
+        arr.fromfile(f, n)
+    except EOFError:
+        pass
+    if NEED_SWAP:
+        arr.byteswap()
+    return arr
+
+
+def to_bytes(val, encoding):
+    if val is None:
+        return b'_'
+    if isinstance(val, unicode):
+        return val.encode(encoding)
+    if isinstance(val, bytes):
+        return val
+    return str(val).encode(encoding)
+
+
+def compute_reverse_index(corpus_fname, counts, rev_fname, rdx_fname,
+                          max_memory=1 << 24):
+    """
+    creates the reverse index (positions of each lexicon id) from a
+    corpus stream file. Positions are collected for ranges of ids whose
+    total frequency fits into max_memory ints, making one pass over the
+    corpus file per range.
+    """
+    n_ids = len(counts)
+    offsets = array('i', [0] * n_ids)
+    total = 0
+    for i in xrange(n_ids):
+        offsets[i] = total
+        total += counts[i]
+    with open(rdx_fname, 'wb') as f_rdx:
+        write_ints(f_rdx, offsets)
+    with open(rev_fname, 'wb') as f_rev:
+        lo = 0
+        while lo < n_ids:
+            hi = lo
+            seg_size = 0
+            while hi < n_ids and (hi == lo or
+                                  seg_size + counts[hi] <= max_memory):
+                seg_size += counts[hi]
+                hi += 1
+            seg = array('i', [0] * seg_size)
+            base = offsets[lo]
+            fill = array('i', offsets[lo:hi])
+            posn = 0
+            with open(corpus_fname, 'rb') as f_corpus:
+                while True:
+                    chunk = read_ints(f_corpus, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    for wid in chunk:
+                        if lo <= wid < hi:
+                            k = wid - lo
+                            seg[fill[k] - base] = posn
+                            fill[k] += 1
+                        posn += 1
+            if NEED_SWAP:
+                seg.byteswap()
+            seg.tofile(f_rev)
+            lo = hi
+
+
+def _finish_p_attribute(args):
+    (corpus_fname, counts, rev_fname, rdx_fname, max_memory) = args
+    compute_reverse_index(corpus_fname, counts, rev_fname, rdx_fname,
+                          max_memory)
+
+
+class PAttributeWriter(object):
+
+    """
+    writes the lexicon, corpus stream, frequency list and reverse
+    index of one positional attribute
+    """
+
+    def __init__(self, data_dir, name):
+        self.name = name
+        self.prefix = os.path.join(data_dir, name)
+        self.lexicon = {}
+        self.counts = array('i')
+        self.lex_offset = 0
+        self.f_lex = open(self.prefix + '.lexicon', 'wb')
+        self.f_idx = open(self.prefix + '.lexicon.idx', 'wb')
+        self.f_corpus = open(self.prefix + '.corpus', 'wb')
+        self.buf = array('i')
+
+    def add(self, val):
+        """appends a value (as bytes) to the corpus stream"""
+        try:
+            wid = self.lexicon[val]
+        except KeyError:
+            wid = len(self.counts)
+            self.lexicon[val] = wid
+            self.counts.append(0)
+            self.f_lex.write(val + b'\0')
+            write_ints(self.f_idx, [self.lex_offset])
+            self.lex_offset += len(val) + 1
+        self.counts[wid] += 1
+        buf = self.buf
+        buf.append(wid)
+        if len(buf) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            if NEED_SWAP:
+                self.buf.byteswap()
+            self.buf.tofile(self.f_corpus)
+            self.buf = array('i')
+
+    def close(self):
+        """
+        closes the streams and writes the sorted lexicon index and
+        the frequency list. Returns the arguments for the computation
+        of the reverse index.
+        """
+        self.flush()
+        self.f_lex.close()
+        self.f_idx.close()
+        self.f_corpus.close()
+        srt = sorted(self.lexicon.items())
+        with open(self.prefix + '.lexicon.srt', 'wb') as f_srt:
+            write_ints(f_srt, [wid for (val, wid) in srt])
+        with open(self.prefix + '.corpus.cnt', 'wb') as f_cnt:
+            write_ints(f_cnt, self.counts)
+        self.lexicon = None
+        return (self.prefix + '.corpus', self.counts,
+                self.prefix + '.corpus.rev',
+                self.prefix + '.corpus.rdx')
+
+
+class SAttributeWriter(object):
+
+    """
+    writes the regions of a structural attribute, and the
+    annotations of these regions as separate attributes
+    (``s_id`` for ``<s id="...">``)
+    """
+
+    def __init__(self, data_dir, name):
+        self.data_dir = data_dir
+        self.name = name
+        self.f_rng = open(os.path.join(data_dir, name + '.rng'), 'wb')
+        self.n_regions = 0
+        self.depth = 0
+        self.start = None
+        self.values = None
+        self.annotations = {}
+
+    def begin(self, posn, values):
+        """
+        opens a region at corpus position posn; values is
+        a list of (key, value) pairs with byte values
+        """
+        self.depth += 1
+        if self.depth > 1:
+            # CWB regions cannot be embedded in each other
+            return
+        self.start = posn
+        self.values = values
+
+    def end(self, posn):
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        if posn <= self.start:
+            # empty regions are dropped
+            return
+        write_ints(self.f_rng, [self.start, posn - 1])
+        for key, val in self.values:
+            if key not in self.annotations:
+                self.annotations[key] = AnnotationWriter(
+                    self.data_dir, '%s_%s' % (self.name, key))
+            self.annotations[key].add(self.n_regions, val)
+        self.n_regions += 1
+
+    def close(self):
+        self.f_rng.close()
+        rng_fname = os.path.join(self.data_dir, self.name + '.rng')
+        for key, ann in sorted(self.annotations.items()):
+            ann.close(self.n_regions, rng_fname)
+
+    def attribute_names(self):
+        return [self.name] + ['%s_%s' % (self.name, key)
+                              for key in sorted(self.annotations)]
+
+
+class AnnotationWriter(object):
+
+    """
+    writes the values of one region annotation; regions
+    without a value get the empty string
+    """
+
+    def __init__(self, data_dir, name):
+        self.prefix = os.path.join(data_dir, name)
+        self.f_avs = open(self.prefix + '.avs', 'wb')
+        self.f_avx = open(self.prefix + '.avx', 'wb')
+        self.f_avs.write(b'\0')
+        self.avs_offset = 1
+        self.n_regions = 0
+
+    def pad(self, n_regions):
+        while self.n_regions < n_regions:
+            write_ints(self.f_avx, [self.n_regions, 0])
+            self.n_regions += 1
+
+    def add(self, region, val):
+        self.pad(region)
+        write_ints(self.f_avx, [region, self.avs_offset])
+        self.f_avs.write(val + b'\0')
+        self.avs_offset += len(val) + 1
+        self.n_regions += 1
+
+    def close(self, n_regions, rng_fname):
+        self.pad(n_regions)
+        self.f_avs.close()
+        self.f_avx.close()
+        # the regions are the same as those of the
+        # structural attribute itself
+        with open(rng_fname, 'rb') as f_in:
+            with open(self.prefix + '.rng', 'wb') as f_out:
+                f_out.write(f_in.read())
+
+
+def write_registry(f, corpus, home, p_atts, s_atts, charset='utf8',
+                   language='??'):
+    """
+    writes a CWB registry entry for a corpus
+
+    :param corpus: the corpus ID
+    :param home: the data directory of the corpus
+    :param p_atts: the names of positional attributes
+    :param s_atts: the names of structural attributes
+    """
+    corpus_lower = corpus.lower()
+    print('''##
+## registry entry for corpus %(corpus_lower)s
+##
+
+# long descriptive name for the corpus
+NAME "%(corpus_lower)s"
+# corpus ID (must be lowercase in registry!)
+ID   %(corpus_lower)s
+# path to binary data files
+HOME %(home)s
+# optional info file (displayed by "info;" command in CQP)
+INFO %(home)s/.info
+
+# corpus properties provide additional information about the corpus:
+##:: charset  = "%(charset)s" # change if your corpus uses different charset
+##:: language = "%(language)s"     # insert ISO code for language (de, en, fr, ...)
+
+
+##
+## p-attributes (token annotations)
+##
+''' % {'corpus_lower': corpus_lower, 'home': home,
+       'charset': charset, 'language': language}, file=f)
+    for att in p_atts:
+        print('ATTRIBUTE %s' % (att,), file=f)
+    print('''
+
+##
+## s-attributes (structural markup)
+##
+''', file=f)
+    for att in s_atts:
+        print('STRUCTURE %-22s # [annotations]' % (att,), file=f)
+
+
+class CWBEncoder(object):
+
+    """
+    collects tokens and regions and writes them as a CWB corpus.
+
+    :param data_dir: the directory for the binary data files
+    :param p_atts: the names of the positional attributes; the
+       first one is usually ``word``
+    :param max_memory: the number of ints to use for building
+       each reverse index
+    """
+
+    def __init__(self, data_dir, p_atts, encoding='UTF-8',
+                 max_memory=1 << 24):
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+        self.data_dir = data_dir
+        self.encoding = encoding
+        self.max_memory = max_memory
+        self.p_writers = [PAttributeWriter(data_dir, name)
+                          for name in p_atts]
+        self.s_writers = {}
+        self.s_order = []
+        self.posn = 0
+
+    def add_token(self, values):
+        """adds a token with one value for each positional attribute"""
+        encoding = self.encoding
+        for writer, val in zip(self.p_writers, values):
+            writer.add(to_bytes(val, encoding))
+        self.posn += 1
+
+    def begin_region(self, name, attrs=()):
+        try:
+            writer = self.s_writers[name]
+        except KeyError:
+            writer = SAttributeWriter(self.data_dir, name)
+            self.s_writers[name] = writer
+            self.s_order.append(name)
+        encoding = self.encoding
+        writer.begin(self.posn,
+                     [(k, to_bytes(v, encoding)) for (k, v) in attrs])
+
+    def end_region(self, name):
+        self.s_writers[name].end(self.posn)
+
+    def close(self, processes=1):
+        """
+        finishes all attributes. The reverse indices of the
+        positional attributes are built with a pool of the given
+        number of worker processes.
+        """
+        jobs = [writer.close() + (self.max_memory,)
+                for writer in self.p_writers]
+        if processes > 1 and len(jobs) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes)
+            try:
+                pool.map(_finish_p_attribute, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for job in jobs:
+                _finish_p_attribute(job)
+        for name in self.s_order:
+            self.s_writers[name].close()
+
+    def p_attribute_names(self):
+        return [writer.name for writer in self.p_writers]
+
+    def s_attribute_names(self):
+        result = []
+        for name in self.s_order:
+            result += self.s_writers[name].attribute_names()
+        return result
+
+    def write_registry(self, registry_dir, corpus, charset='utf8'):
+        """writes the registry entry for the encoded corpus"""
+        fname = os.path.join(registry_dir, corpus.lower())
+        with open(fname, 'w') as f_out:
+            write_registry(f_out, corpus, os.path.abspath(self.data_dir),
+                           self.p_attribute_names(),
+                           self.s_attribute_names(), charset)
@@ -0,0 +1,211 @@
+"""
+Compact per-document storage for edges (secondary edges, coreference
+relations and other edge types), as an alternative to keeping Python
+lists on each object.
+
+For each edge type, the store keeps one row per (source, target, label)
+triple in parallel int arrays. Sources and targets are indices into an
+alphabet of object IDs, so that targets do not have to be loaded (or
+even exist) when an edge is added; labels are indices into an alphabet
+of label values. Outgoing and incoming edges are found through CSR-style
+offset tables. Edges added after the tables were built are kept in
+small per-key lists until they outnumber the indexed ones; removed
+edges are only marked as dead, and the arrays are compacted once
+at least half of their rows are dead.
+"""
+import sys
+from array import array
+
+from .alphabet import PythonAlphabet
+
+if sys.version_info.major >= 3:
+    xrange = range
+
+NO_TARGET = -1
+
+
+class EdgeTable(object):
+
+    """the edges of one type"""
+
+    def __init__(self, name):
+        self.name = name
+        self.src = array('i')
+        self.tgt = array('i')
+        self.label = array('i')
+        self.alive = bytearray()
+        self.labels = PythonAlphabet()
+        self.has_src = bytearray()
+        self.n_dead = 0
+        self.invalidate()
+
+    def __len__(self):
+        return len(self.src) - self.n_dead
+
+    def invalidate(self):
+        self._out = self._in = None
+        self.n_indexed = 0
+        self.new_out = {}
+        self.new_in = {}
+
+    def add(self, src, tgt, label):
+        """adds an edge; tgt is NO_TARGET for edges without a target"""
+        row = len(self.src)
+        self.src.append(src)
+        self.tgt.append(tgt)
+        self.label.append(self.labels[label])
+        self.alive.append(1)
+        has_src = self.has_src
+        if src >= len(has_src):
+            has_src.extend(bytearray(src + 1 - len(has_src)))
+        has_src[src] = 1
+        if self._out is not None:
+            if row >= 2 * self.n_indexed:
+                self.invalidate()
+            else:
+                self.new_out.setdefault(src, []).append(row)
+                self.new_in.setdefault(tgt, []).append(row)
+
+    def remove_from(self, src):
+        """removes all edges that start at src"""
+        if src >= len(self.has_src) or not self.has_src[src]:
+            return
+        alive = self.alive
+        for row in self.out_rows(src):
+            alive[row] = 0
+            self.n_dead += 1
+        self.has_src[src] = 0
+        if self.n_dead * 2 >= len(alive):
+            self.compact()
+
+    def compact(self):
+        """drops the rows of removed edges"""
+        alive = self.alive
+        for name in ('src', 'tgt', 'label'):
+            old = getattr(self, name)
+            setattr(self, name, array('i', [old[row]
+                                            for row in xrange(len(old))
+                                            if alive[row]]))
+        self.alive = bytearray(b'\x01' * len(self.src))
+        self.n_dead = 0
+        self.invalidate()
+
+    def build_csr(self, keys, n):
+        """
+        returns (offsets, rows) such that rows[offsets[k]:offsets[k+1]]
+        are the live rows with key k, in insertion order; keys
+        range from -1 (no target) to n-1
+        """
+        alive = self.alive
+        offsets = array('i', [0] * (n + 2))
+        for row in xrange(len(keys)):
+            if alive[row]:
+                offsets[keys[row] + 2] += 1
+        for k in xrange(2, n + 2):
+            offsets[k] += offsets[k - 1]
+        rows = array('i', [0] * offsets[n + 1])
+        for row in xrange(len(keys)):
+            if alive[row]:
+                k = keys[row] + 1
+                rows[offsets[k]] = row
+                offsets[k] += 1
+        # the fill cursor for key k ends at the start of key k+1,
+        # so offsets[k] is now the start of key k
+        return offsets, rows
+
+    def n_keys(self):
+        n = 0
+        if self.src:
+            n = max(n, max(self.src) + 1)
+        if self.tgt:
+            n = max(n, max(self.tgt) + 1)
+        return n
+
+    def reindex(self):
+        n = self.n_keys()
+        self._out = self.build_csr(self.src, n)
+        self._in = self.build_csr(self.tgt, n)
+        self.n_indexed = len(self.src)
+        self.new_out = {}
+        self.new_in = {}
+
+    def find_rows(self, csr, new_rows, key):
+        offsets, rows = csr
+        alive = self.alive
+        if key + 1 < len(offsets):
+            result = [row for row in rows[offsets[key]:offsets[key + 1]]
+                      if alive[row]]
+        else:
+            result = []
+        if key in new_rows:
+            result += [row for row in new_rows[key] if alive[row]]
+        return result
+
+    def out_rows(self, src):
+        if self._out is None:
+            self.reindex()
+        return self.find_rows(self._out, self.new_out, src)
+
+    def in_rows(self, tgt):
+        if self._in is None:
+            self.reindex()
+        return self.find_rows(self._in, self.new_in, tgt)
+
+
+class EdgeStore(object):
+
+    """
+    the edges of a document, as one :py:class:`EdgeTable` per
+    edge type; objects are referred to by their IDs
+    """
+
+    def __init__(self):
+        self.ids = PythonAlphabet()
+        self.tables = {}
+
+    def table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            table = EdgeTable(name)
+            self.tables[name] = table
+            return table
+
+    def index(self, obj_id):
+        if obj_id is None:
+            return NO_TARGET
+        return self.ids[obj_id]
+
+    def add_edge(self, name, src_id, tgt_id, label):
+        self.table(name).add(self.ids[src_id], self.index(tgt_id), label)
+
+    def set_edges(self, name, src_id, edges):
+        """replaces the edges starting at src_id by (tgt_id, label) pairs"""
+        table = self.table(name)
+        src = self.ids[src_id]
+        table.remove_from(src)
+        for tgt_id, label in edges:
+            table.add(src, self.index(tgt_id), label)
+
+    def edges_from(self, name, src_id):
+        """returns the (tgt_id, label) pairs of the edges starting at src_id"""
+        table = self.tables.get(name)
+        src = self.ids.obj2int.get(src_id)
+        if table is None or src is None:
+            return []
+        words = self.ids.words
+        labels = table.labels.words
+        return [(None if table.tgt[row] < 0 else words[table.tgt[row]],
+                 labels[table.label[row]])
+                for row in table.out_rows(src)]
+
+    def edges_to(self, name, tgt_id):
+        """returns the (src_id, label) pairs of the edges ending at tgt_id"""
+        table = self.tables.get(name)
+        tgt = self.ids.obj2int.get(tgt_id)
+        if table is None or tgt is None:
+            return []
+        words = self.ids.words
+        labels = table.labels.words
+        return [(words[table.src[row]], labels[table.label[row]])
+                for row in table.in_rows(tgt)]
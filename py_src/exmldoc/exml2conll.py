@@ -1,70 +1,174 @@
 #!/usr/bin/env python
 # -*- coding: iso-8859-1 -*-
 '''
-Creates a CQP-style column output from a EXML file.
+Creates CoNLL-U (or CoNLL-X) dependency output from a EXML file
+or a directory of EXML files.
 
 Usage:
-export2cqp [-f format] [-o output.txt] inputfile.exml.xml
+exml2conll [-f conllu|conll] [-j processes] [-o output.txt] inputfile.exml.xml
+exml2conll [-f conllu|conll] [-j processes] [-o output.txt] [-I cache_dir] corpus_dir
+
+With -I, the output for each file of a corpus directory is kept in
+cache_dir, and only files that changed are converted again. The
+dependency heads are computed with numpy.
 '''
 from __future__ import print_function
 
 import sys
 import os.path
 import getopt
-import glob
 
-import exml
+import exmldoc
+from exmldoc import tree
+from exmldoc.corpus import Corpus, OutputCache
+from exmldoc.exml2cqp import to_text, BLOCK_SIZE, OUTPUT_BUFFER
 
 
 class ExportToCoNLL:
     """
-    writes CoNLL-U (
+    writes CoNLL-U (or, with format='conll', CoNLL-X) output
+    for the sentences of a corpus
     """
 
-    def __init__(self, format='conllu', opts=None):
+    def __init__(self, format='conllu'):
         self.format = format
 
-        self.p_atts = []
+    def sentence_lines(self, t, terminals, heads):
+        """
+        returns the lines for one sentence
+
+        :param heads: the head of each terminal, as from
+          :py:meth:`exmldoc.Document.dependency_heads`
+        """
+        lines = []
+        if self.format == 'conllu':
+            if hasattr(t, 'sent_no'):
+                lines.append("# sent_id = %s" % (t.sent_no,))
+            elif hasattr(t, 'xml_id'):
+                lines.append("# sent_id = %s" % (t.xml_id,))
+            lines.append("# text = %s" % (
+                ' '.join([to_text(n.word) for n in terminals]),))
+        # roots (-1) get the head 0
+        heads = (heads + 1).tolist()
+        conllu = (self.format == 'conllu')
+        root_label = 'root' if conllu else 'ROOT'
+        for i, n in enumerate(terminals):
+            pos = to_text(n.cat)
+            head = heads[i]
+            label = getattr(n, 'syn_label', None)
+            if label is None and head == 0:
+                label = root_label
+            cols = [str(i + 1), to_text(n.word),
+                    to_text(getattr(n, 'lemma', None)),
+                    '_' if conllu else pos, pos, to_text(n.morph),
+                    str(head), to_text(label), '_', '_']
+            lines.append('\t'.join(cols))
+        lines.append('')
+        return lines
 
-    def write_conll(self, fname, f_out=None):
+    def write_conll(self, reader, f_out=None, doc_id=None):
+        """
+        writes all sentences that the reader produces, one window
+        (usually one text) at a time.
+
+        :return: the number of tokens
+        """
         if f_out is None:
             f_out = sys.stdout
-        count = 0
-        if self.format == 'conllu':
-            print("# document: %s"%(fname,), file=f_out)
-        for t in exml.read_trees_exml(fname):
-            if self.format == 'conllu':
-                if hasattr(t, 'sent_no'):
-                    print("# sentence id: %s" % (t.sent_no,), file=f_out)
-                elif hasattr(t, 'xml_id'):
-                    print("# sentence id: %s" % (t.xml_id,), file=f_out)
-                print("# sentence-text: %s"%(' '.join([n.word for n in t.terminals])))
-            count += len(t.terminals)
-            sent_start = t.terminals[0].span[0]
-            for i, n in enumerate(t.terminals):
-                print("%d\t%s\t%s\t%s\t%s" % (
-                    i+1,
-                    n.word, n.cat, n.lemma, n.morph), file=f_out)
-            if self.want_deprels:
-                for n in t.terminals:
-                    lbl = getattr(n, 'syn_label', None)
-                    if not hasattr(n, 'syn_parent') or n.syn_parent is None:
-                        attach = 'ROOT'
-                        lbl = 'ROOT'
-                    else:
-                        attach = '%+d' % (n.syn_parent.start - n.start)
-                    if not hasattr(n, 'lemma') or n.lemma is None:
-                        lemma = '_'
-                    else:
-                        lemma = n.lemma
-                    print("%s\t%s\t%s\t%s\t%s\t%s" % (
-                        n.word, n.cat, lemma, n.morph, lbl, attach), file=f_out)
+        doc = reader.doc
+        buf = []
+        if doc_id is not None and self.format == 'conllu':
+            buf.append("# newdoc id = %s" % (doc_id,))
+        last_stop = len(doc.words)
+        while True:
+            try:
+                new_stop = reader.addNext()
+            except StopIteration:
+                new_stop = len(doc.words)
+                at_end = True
+            else:
+                at_end = False
+            w_objs = doc.w_objs
+            for t in doc.get_objects_by_class(tree.Tree, last_stop, new_stop):
+                sent_start, sent_end = t.span[0], t.span[-1]
+                buf += self.sentence_lines(
+                    t, w_objs[sent_start:sent_end],
+                    doc.dependency_heads(sent_start, sent_end))
+                if len(buf) >= BLOCK_SIZE:
+                    buf.append('')
+                    f_out.write('\n'.join(buf))
+                    buf = []
+            doc.clear_markables(last_stop, new_stop)
+            last_stop = new_stop
+            if at_end:
+                break
+        if buf:
+            buf.append('')
+            f_out.write('\n'.join(buf))
+        return len(doc.words)
+
+
+def convert_file(args):
+    """
+    converts one file into a string; used by the worker
+    processes in directory mode
+    """
+    (f_path, doc_id, format) = args
+    if sys.version_info[0] >= 3:
+        from io import StringIO
+    else:
+        from StringIO import StringIO
+    f_out = StringIO()
+    doc = exmldoc.make_syntax_doc(want_deps=True)
+    reader = exmldoc.XMLCorpusReader(doc, f_path)
+    count = ExportToCoNLL(format).write_conll(reader, f_out, doc_id)
+    return doc_id, f_out.getvalue(), count
+
+
+def process_directory(app, dirname, f_out, processes=1, cache_dir=None):
+    """
+    converts all files in a directory, using a pool of worker
+    processes, and keeps offsets.txt up to date. With a cache_dir,
+    only files that changed are converted.
+
+    :return: the number of files that were converted
+    """
+    if f_out is None:
+        f_out = sys.stdout
+    corpus = Corpus(dirname)
+    cache = None
+    cached = set()
+    if cache_dir is not None:
+        cache = OutputCache(cache_dir, 'conll %s' % (app.format,))
+        cached = set([k for k in range(len(corpus.names))
+                      if cache.has(corpus, k)])
+    jobs = [(f_path, fname0, app.format)
+            for k, (fname0, f_path) in enumerate(corpus.files())
+            if k not in cached]
+    if processes > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(convert_file, jobs)
+    else:
+        pool = None
+        results = (convert_file(job) for job in jobs)
+    try:
+        for k in range(len(corpus.names)):
+            if k in cached:
+                text, count = cache.get(corpus, k)
             else:
-                for n in t.terminals:
-                    print("%s\t%s\t%s\t%s" % (
-                        n.word, n.cat, n.lemma, n.morph), file=f_out)
-            print("</s>", file=f_out)
-        return count
+                fname0, text, count = next(results)
+                if cache is not None:
+                    cache.put(corpus, k, text, count)
+            f_out.write(text)
+            corpus.set_count(k, count)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    corpus.save_offsets()
+    corpus.save_manifest()
+    return len(jobs)
 
 
 def usage():
@@ -73,7 +177,7 @@ def usage():
 
 def main():
     try:
-        opts, args = getopt.gnu_getopt(sys.argv[1:], 'P:S:o:')
+        opts, args = getopt.gnu_getopt(sys.argv[1:], 'f:o:j:I:')
     except getopt.GetoptError:
         usage()
         sys.exit(1)
@@ -81,59 +185,25 @@ def main():
         usage()
         sys.exit(1)
     f_out = None
+    format = 'conllu'
+    processes = 1
+    cache_dir = None
     for k, v in opts:
         if k == '-o':
-            f_out = file(v, 'w')
-    app = ExportToCoNLL(opts)
+            f_out = open(v, 'w', OUTPUT_BUFFER)
+        elif k == '-f':
+            format = v
+        elif k == '-j':
+            processes = int(v)
+        elif k == '-I':
+            cache_dir = v
+    app = ExportToCoNLL(format)
     if os.path.isdir(args[0]):
-        # TODO do something sensible
-        offsets_fname = os.path.join(args[0], 'offsets.txt')
-        all_exml_fnames = glob.glob(os.path.join(args[0], '*.exml.xml'))
-        if os.path.exists(offsets_fname):
-            # Case 1: offsets.txt already exists
-            # iterate over the files in offsets.txt, making sure
-            # (i) no files are missed, (ii) the offsets still match
-            all_files = set(all_exml_fnames)
-            count_total = 0
-            old_fname = '(START)'
-            for l in open(offsets_fname, 'rb'):
-                line = l.strip().split()
-                fname = fname0 = line[0]
-                if not fname.endswith('.exml.xml'):
-                    fname = fname + '.exml.xml'
-                f_path = os.path.join(args[0], fname)
-                all_files.remove(f_path)
-                print("<doc id=%s>" % (fname0,), file=f_out)
-                count_file = app.write_conll(f_path, f_out)
-                print("</doc>", file=f_out)
-                posn_offset = int(line[1])
-                if posn_offset != count_total:
-                    print("ERROR: %s at position %d, should be %d" % (
-                        fname, count_total, posn_offset), file=sys.stderr)
-                    print("before: %s" % (old_fname,), file=sys.stderr)
-                count_total = posn_offset + count_file
-                old_fname = fname
-            if all_files:
-                # TODO: append new files to offsets.txt?
-                for fname in sorted(all_files):
-                    print("ERROR: %s is missing in offsets.txt" % (
-                        fname,), file=sys.stderr)
-        else:
-            # Case 2: create offsets.txt
-            f_offsets = open(offsets_fname, 'wb')
-            count_total = 0
-            for f_path in all_exml_fnames:
-                fname0 = os.path.basename(f_path)
-                if fname0.endswith('.exml.xml'):
-                    fname0 = fname0[:-9]
-                print("<doc id=%s>" % (fname0,), file=f_out)
-                count_file = app.write_conll(f_path, f_out)
-                print("</doc>", file=f_out)
-                print("%s\t%d" % (
-                    fname0, count_total), file=f_offsets)
-                count_total += count_file
+        process_directory(app, args[0], f_out, processes, cache_dir)
     else:
-        app.write_conll(args[0], f_out)
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        reader = exmldoc.XMLCorpusReader(doc, args[0])
+        app.write_conll(reader, f_out)
 
 if __name__ == '__main__':
     main()
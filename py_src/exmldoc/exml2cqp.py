@@ -5,84 +5,238 @@ Creates a CQP-style column output from a EXML file.
 
 Usage:
 export2cqp [-P att] [-S satt] [-o output.txt] inputfile.exml.xml
+export2cqp [-P att] [-S satt] [-o output.txt] [-I cache_dir] corpus_dir
+export2cqp [-P att] [-S satt] -B data_dir [-R registry_dir] [-N corpus]
+           [-j processes] inputfile.exml.xml
+
+Sentences are written as <s> regions; other levels, such as text,
+are only written when they are named with -S.
+
+With -B, the corpus is written directly as CWB binary files into
+data_dir instead of as vertical text. With -I, the output for each
+file of a corpus directory is kept in cache_dir and reused as long as
+the file does not change.
 '''
 from __future__ import print_function
 
 import sys
 import os.path
 import getopt
-import glob
+from operator import attrgetter
 
 import exmldoc
+from exmldoc.corpus import Corpus, OutputCache, skip_through
+from exmldoc.cwb import CWBEncoder, write_registry
 
 if sys.version_info[0] >= 3:
+    from io import StringIO
     xrange = range
 
+    def to_text(val):
+        if val is None:
+            return '_'
+        elif isinstance(val, bytes):
+            return val.decode('UTF-8')
+        return str(val)
+else:
+    from StringIO import StringIO
+
+    def to_text(val):
+        if val is None:
+            return '_'
+        elif isinstance(val, unicode):
+            return val.encode('UTF-8')
+        return str(val)
+
+DEFAULT_P_ATTS = ['word', 'pos', 'lemma', 'morph']
+
+#: number of lines collected before they are written out
+BLOCK_SIZE = 4096
+#: buffer size for output files
+OUTPUT_BUFFER = 1 << 20
+
+
+def dependency_columns(n):
+    parent = getattr(n, 'syn_parent', None)
+    if parent is None:
+        return ('ROOT', 'ROOT')
+    return (getattr(n, 'syn_label', None),
+            '%+d' % (parent.span[0] - n.span[0]))
+
+
+class ColumnSpec(object):
+    """
+    the positional attributes of the output, compiled once into a
+    function that extracts the column values from a terminal.
+
+    Column names are the attribute names of the terminal schema
+    (with ``word`` for the word form); ``deprel`` and ``attach``
+    are computed from the dependency head.
+    """
+
+    def __init__(self, names, t_schema=None):
+        self.names = list(names)
+        props = []
+        dep_cols = []
+        for i, name in enumerate(self.names):
+            if name in ('deprel', 'attach'):
+                dep_cols.append((i, name == 'attach'))
+            else:
+                props.append(self.prop_name(name, t_schema))
+        self.props = props
+        self.dep_cols = dep_cols
+        if not props:
+            plain = lambda n: ()
+        elif len(props) == 1:
+            get_one = attrgetter(props[0])
+            plain = lambda n: (get_one(n),)
+        else:
+            plain = attrgetter(*props)
+        self._plain = plain
+        if dep_cols:
+            self.extract = self._extract_with_deps
+        else:
+            self.extract = self._extract_plain
+
+    @staticmethod
+    def prop_name(name, t_schema):
+        if t_schema is not None:
+            if name == 'word':
+                name = 'form'
+            try:
+                return t_schema.attribute_by_name(name).prop_name
+            except KeyError:
+                pass
+        return name
+
+    def _extract_plain(self, n):
+        try:
+            return self._plain(n)
+        except AttributeError:
+            return [getattr(n, prop, None) for prop in self.props]
+
+    def _extract_with_deps(self, n):
+        vals = list(self._extract_plain(n))
+        deps = dependency_columns(n)
+        for i, is_attach in self.dep_cols:
+            vals.insert(i, deps[is_attach])
+        return vals
+
+
 class ExportToCQP:
 
-    def __init__(self, opts=None):
+    def __init__(self, opts=None, t_schema=None):
         self.p_atts = []
         self.s_atts = []
-        if opts is None:
-            self.want_deprels = False
-        else:
+        if opts is not None:
             # add p_atts and s_atts etc.
             for k, v in opts:
                 if k == '-S':
                     self.s_atts.append(v)
                 elif k == '-P':
                     self.p_atts.append(v)
-            self.want_deprels = False
+        if self.p_atts:
+            self.names = ['word'] + [att for att in self.p_atts
+                                     if att != 'word']
+        else:
+            self.names = DEFAULT_P_ATTS[:]
+        if t_schema is None:
+            t_schema = exmldoc.make_syntax_doc(want_deps=True).t_schema
+        self.t_schema = t_schema
+        # adds deprel and attach columns, as before -P existed
+        self.want_deprels = False
+        self.columns = None
 
-    def write_cqp(self, reader, f_out=None):
-        if f_out is None:
-            f_out = sys.stdout
-        count = 0
+    def p_attribute_names(self):
+        names = list(self.names)
+        if self.want_deprels:
+            names += [name for name in ('deprel', 'attach')
+                      if name not in names]
+        return names
+
+    def column_spec(self):
+        """returns the ColumnSpec for the current columns"""
+        names = self.p_attribute_names()
+        if self.columns is None or self.columns.names != names:
+            self.columns = ColumnSpec(names, self.t_schema)
+        return self.columns
+
+    def options_key(self):
+        """describes the options that influence the output"""
+        return 'cqp %r %r' % (self.p_attribute_names(), self.s_atts)
+
+    def region_attrs(self, attrs):
+        parts = []
+        for k,v in attrs:
+            if k == 'xml:id':
+                k = 'id'
+                # try to spot auto-generated IDs
+                if (v[0] == 'm' and len(v) == 7 or
+                        v.startswith('__tmp_')):
+                    continue
+            parts.append((k, v))
+        return parts
+
+    def level_map(self):
         level_map = {
             'sentence': ('s', None)
         }
         for s_att in self.s_atts:
             level_map[s_att] = (s_att, None)
+        return level_map
+
+    def write_cqp(self, reader, f_out=None):
+        if f_out is None:
+            f_out = sys.stdout
+        count = 0
+        level_map = self.level_map()
+        extract = self.column_spec().extract
+        buf = []
         for ev in reader.inline_events(level_map):
-            if ev[0] == 'start':
+            if ev[0] == 'terminal':
+                buf.append('\t'.join([to_text(x) for x in extract(ev[1])]))
+                count += 1
+                if len(buf) >= BLOCK_SIZE:
+                    buf.append('')
+                    f_out.write('\n'.join(buf))
+                    buf = []
+            elif ev[0] == 'start':
                 # start S-attribute
                 tag = ev[1]
                 mapped_tag, write_fn = level_map[tag]
                 attrs = ev[2]
-                parts = []
                 if write_fn is not None:
                     write_fn(tag, attrs)
                 else:
-                    for k,v in attrs:
-                        if k == 'xml:id':
-                            k = 'id'
-                            # try to spot auto-generated IDs
-                            if (v[0] == 'm' and len(v) == 7 or
-                                    v.startswith('__tmp_')):
-                                continue
-                        parts.append(' %s="%s"'%(k, v))
-                    print('<%s%s>'%(mapped_tag, ''.join(parts)), file=f_out)
+                    parts = [' %s="%s"'%(k, to_text(v))
+                             for (k, v) in self.region_attrs(attrs)]
+                    buf.append('<%s%s>'%(mapped_tag, ''.join(parts)))
             elif ev[0] == 'end':
                 # end S-attribute
                 tag = ev[1]
                 mapped_tag, write_fn = level_map[tag]
-                print('</%s>'%(mapped_tag), file=f_out)
+                buf.append('</%s>'%(mapped_tag))
+        if buf:
+            buf.append('')
+            f_out.write('\n'.join(buf))
+        return count
+
+    def encode_cwb(self, reader, encoder):
+        """
+        like write_cqp, but adds tokens and regions to
+        a :py:class:`exmldoc.cwb.CWBEncoder`
+        """
+        count = 0
+        level_map = self.level_map()
+        extract = self.column_spec().extract
+        for ev in reader.inline_events(level_map):
+            if ev[0] == 'start':
+                mapped_tag = level_map[ev[1]][0]
+                encoder.begin_region(mapped_tag, self.region_attrs(ev[2]))
+            elif ev[0] == 'end':
+                encoder.end_region(level_map[ev[1]][0])
             elif ev[0] == 'terminal':
-                n = ev[1]
-                if not hasattr(n, 'lemma') or n.lemma is None:
-                    lemma = '_'
-                else:
-                    lemma = n.lemma
-                columns = [n.word, n.cat, lemma, n.morph]
-                if self.want_deprels:
-                    lbl = getattr(n, 'syn_label', '_')
-                    if not hasattr(n, 'syn_parent') or n.syn_parent is None:
-                        attach = 'ROOT'
-                        lbl = 'ROOT'
-                    else:
-                        attach = '%+d'%(n.syn_parent.span[0] - n.span[0])
-                    columns += [lbl, attach]
-                print('\t'.join([str(x) for x in columns]), file=f_out)
+                encoder.add_token(extract(ev[1]))
                 count += 1
         return count
 
@@ -90,85 +244,55 @@ class ExportToCQP:
 def usage():
     print(__doc__)
 
-def skip_through(reader):
-    """
-    continues reading a document until the end of the document
-    :param reader: a document reader
-    :param doc:    the document in question
-    :return: the number of tokens in the document
-    """
-    last_stop = 0
-    while True:
-        try:
-            next_stop = reader.addNext()
-        except StopIteration:
-            return len(reader.doc.words)
-
-
 def process_directory(dirname, create_doc=None):
     """
     processes a directory of EXML files, consuming or creating an offsets.txt file
     :param dirname:
     :param create_doc:
-    :return: an iterable of (fname, doc, reader) tuples
+    :return: an iterable of (fname, doc, reader) tuples, with fname
+      as written in offsets.txt
     """
-    if create_doc is None:
-        create_doc = lambda: exmldoc.make_syntax_doc(want_deps=True)
-    offsets_fname = os.path.join(dirname, 'offsets.txt')
-    all_exml_fnames = set(
-        glob.glob(os.path.join(dirname, '*.exml.xml')) +
-        glob.glob(os.path.join(dirname, '*.exml.xml.gz')))
-    count_total = 0
-    count_file = 0
-    reader = None
-    old_fname = '(START)'
-    if os.path.exists(offsets_fname):
-        for l in open(offsets_fname):
-            line = l.strip().split()
-            fname = fname0 = line[0]
-            if not fname.endswith('.exml.xml') and not fname.endswith('.exml.xml.gz'):
-                fname = fname + '.exml.xml'
-            if count_file is not None:
-                count_total += count_file
-                posn_offset = int(line[1])
-                if posn_offset != count_total:
-                    print("ERROR: %s at position %d, should be %d" % (
-                        fname, count_total, posn_offset), file=sys.stderr)
-                    print("before: %s" % (old_fname,), file=sys.stderr)
-            else:
-                count_total = int(line[1])
-            f_path = os.path.join(dirname, fname)
-            all_exml_fnames.remove(f_path)
-            doc = create_doc()
-            reader = exmldoc.XMLCorpusReader(doc, f_path)
-            yield fname0, doc, reader
-            if reader.at_end:
-                count_file = len(doc.w_objs)
-            else:
-                count_file = None
-            old_fname = fname
-    if all_exml_fnames:
-        if count_file is None:
-            count_file = skip_through(reader)
-        count_total += count_file
-        print("New exml", all_exml_fnames)
-        with open(offsets_fname, 'a') as f_offsets:
-            for fname in sorted(all_exml_fnames):
-                fname0 = os.path.basename(fname)
-                f_path = fname
-                print("%s\t%s"%(fname0, count_total), file=f_offsets)
-                doc = create_doc()
-                reader = exmldoc.XMLCorpusReader(doc, f_path)
-                yield fname0, doc, reader
-                if reader.at_end:
-                    count_file = len(doc.w_objs)
-                else:
-                    count_file = skip_through(reader)
-                count_total += count_file
+    corpus = Corpus(dirname, create_doc, keep_suffix=True)
+    for k, (name, doc, reader) in enumerate(corpus.readers()):
+        yield corpus.labels[k], doc, reader
+
+
+def write_directory_incremental(app, dirname, cache_dir, f_out=None):
+    """
+    writes the vertical text for a corpus directory, exporting only
+    the files that changed and reusing the cached output of the others
+
+    :return: the number of files that were exported again
+    """
+    if f_out is None:
+        f_out = sys.stdout
+    corpus = Corpus(dirname, keep_suffix=True)
+    cache = OutputCache(cache_dir, app.options_key())
+    n_exported = 0
+    for k, name in enumerate(corpus.labels):
+        entry = cache.get(corpus, k)
+        if entry is None:
+            buf = StringIO()
+            doc = corpus.create_doc()
+            reader = exmldoc.XMLCorpusReader(doc, corpus.paths[k])
+            print("<doc id=%s>" % (name,), file=buf)
+            count = app.write_cqp(reader, buf)
+            print("</doc>", file=buf)
+            text = buf.getvalue()
+            cache.put(corpus, k, text, count)
+            n_exported += 1
+        else:
+            text, count = entry
+        corpus.set_count(k, count)
+        f_out.write(text)
+    corpus.save_offsets()
+    corpus.save_manifest()
+    return n_exported
+
 
 def main():
     try:
-        opts, args = getopt.gnu_getopt(sys.argv[1:], 'P:S:o:')
+        opts, args = getopt.gnu_getopt(sys.argv[1:], 'P:S:o:B:R:N:j:I:')
     except getopt.GetoptError:
         usage()
         sys.exit(1)
@@ -176,11 +300,31 @@ def main():
         usage()
         sys.exit(1)
     f_out = None
+    data_dir = None
+    registry_dir = None
+    corpus_name = None
+    processes = 1
+    cache_dir = None
     for k, v in opts:
         if k == '-o':
-            f_out = open(v, 'w')
+            f_out = open(v, 'w', OUTPUT_BUFFER)
+        elif k == '-I':
+            cache_dir = v
+        elif k == '-B':
+            data_dir = v
+        elif k == '-R':
+            registry_dir = v
+        elif k == '-N':
+            corpus_name = v
+        elif k == '-j':
+            processes = int(v)
     app = ExportToCQP(opts)
-    if os.path.isdir(args[0]):
+    if data_dir is not None:
+        encode_main(app, args[0], data_dir, registry_dir, corpus_name,
+                    processes)
+    elif os.path.isdir(args[0]) and cache_dir is not None:
+        write_directory_incremental(app, args[0], cache_dir, f_out)
+    elif os.path.isdir(args[0]):
         for fname, doc, reader in process_directory(args[0]):
             print("<doc id=%s>" % (fname,), file=f_out)
             app.write_cqp(reader, f_out)
@@ -191,6 +335,29 @@ def main():
         app.write_cqp(reader, f_out)
 
 
+def encode_main(app, path, data_dir, registry_dir=None, corpus_name=None,
+                processes=1):
+    """
+    encodes a file or directory into CWB binary files in data_dir,
+    optionally writing a registry entry
+    """
+    encoder = CWBEncoder(data_dir, app.p_attribute_names())
+    if os.path.isdir(path):
+        for fname, doc, reader in process_directory(path):
+            encoder.begin_region('doc', [('id', fname)])
+            app.encode_cwb(reader, encoder)
+            encoder.end_region('doc')
+    else:
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        reader = exmldoc.XMLCorpusReader(doc, path)
+        app.encode_cwb(reader, encoder)
+    encoder.close(processes)
+    if registry_dir is not None:
+        if corpus_name is None:
+            corpus_name = os.path.basename(os.path.normpath(data_dir))
+        encoder.write_registry(registry_dir, corpus_name)
+
+
 def write_cqp_entry(args=None):
     if args is None:
         args = sys.argv[1:]
@@ -202,56 +369,16 @@ def write_cqp_entry(args=None):
             env['want_deprels'] = True
         elif k == '-c':
             env['cqp_dir'] = v
-    env['corpus'] = args[0].upper()
-    env['corpus_lower'] = args[0].lower()
+    corpus_lower = args[0].lower()
     if env['cqp_dir'][-1] == '/':
         env['cqp_dir'] = env['cqp_dir'][:-1]
-    print('''##
-## registry entry for corpus %(corpus_lower)s
-##
-
-# long descriptive name for the corpus
-NAME "%(corpus_lower)s"
-# corpus ID (must be lowercase in registry!)
-ID   %(corpus_lower)s
-# path to binary data files
-HOME %(cqp_dir)s/%(corpus_lower)s
-# optional info file (displayed by "info;" command in CQP)
-INFO %(cqp_dir)s/%(corpus_lower)s/.info
-
-# corpus properties provide additional information about the corpus:
-##:: charset  = "latin1" # change if your corpus uses different charset
-##:: language = "??"     # insert ISO code for language (de, en, fr, ...)
-
-
-##
-## p-attributes (token annotations)
-##
-
-ATTRIBUTE word
-ATTRIBUTE pos
-ATTRIBUTE lemma
-ATTRIBUTE morph
-''' % env)
+    p_atts = ['word', 'pos', 'lemma', 'morph']
     if env['want_deprels']:
-        print('''ATTRIBUTE deprel
-ATTRIBUTE attach
-
-''')
-    print('''##
-## s-attributes (structural markup)
-##
-
-# <s id=".."> ... </s>
-# (no recursive embedding allowed)
-STRUCTURE s                    # [annotations]
-STRUCTURE s_id                 # [annotations]
-
-# <text id=".."> ... </text>
-# (no recursive embedding allowed)
-STRUCTURE text                 # [annotations]
-STRUCTURE text_id              # [annotations]
-''')
+        p_atts += ['deprel', 'attach']
+    write_registry(sys.stdout, corpus_lower,
+                   '%s/%s' % (env['cqp_dir'], corpus_lower),
+                   p_atts, ['s', 's_id', 'text', 'text_id'],
+                   charset='latin1')
 
 
 if __name__ == '__main__':
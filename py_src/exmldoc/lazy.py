@@ -0,0 +1,287 @@
+"""
+A lazily loaded, read-only view of an EXML file.
+
+:py:func:`exmldoc.open_lazy` reads only the schema header and the text
+index of :py:mod:`exmldoc.textindex`; the texts themselves are read
+when they are first accessed and kept in a bounded LRU cache::
+
+  doc = exmldoc.open_lazy('huge.exml.xml', cache_size=8)
+  doc.words[120000:120010]
+  doc.get_objects_by_level('sentence', 120000, 121000)
+  doc.cache_info()
+
+Each text is read into a :py:class:`exmldoc.Document` of its own,
+whose spans count tokens from the start of the text (see
+:py:meth:`LazyDocument.text_start`). The markables that
+get_objects_by_level and get_objects_by_class return have spans in
+positions of the whole file, so that ``doc.words[s.span[0]:s.span[1]]``
+works as for a Document: they are :py:class:`OffsetMarkable`
+wrappers, as are the tokens of w_objs and the objects reached through
+their attributes (parents, terminals of trees). The documents returned
+by :py:meth:`ChunkedDocument.text` keep the spans of their text.
+"""
+from collections import OrderedDict, namedtuple
+
+import exmldoc
+from .textindex import TextIndex
+from .tree import Node
+
+CacheInfo = namedtuple('CacheInfo',
+                       ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class LazyColumn(object):
+
+    """
+    a read-only sequence over all tokens of a LazyDocument, giving
+    one attribute (words or w_objs) of the text documents; with
+    wrap, the values are :py:class:`OffsetMarkable` objects
+    """
+
+    def __init__(self, lazy_doc, attr, wrap=False):
+        self.lazy_doc = lazy_doc
+        self.attr = attr
+        self.wrap = wrap
+
+    def __len__(self):
+        return len(self.lazy_doc)
+
+    def __getitem__(self, k):
+        lazy_doc = self.lazy_doc
+        if isinstance(k, slice):
+            start, stop, step = k.indices(len(lazy_doc))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            result = []
+            for doc, a, b, first in lazy_doc.text_ranges(start, stop, True):
+                values = getattr(doc, self.attr)[a:b]
+                if self.wrap:
+                    values = offset_markables(values, first)
+                result += values
+            return result
+        if k < 0:
+            k += len(lazy_doc)
+        doc, posn = lazy_doc.locate(k)
+        value = getattr(doc, self.attr)[posn]
+        if self.wrap:
+            value = OffsetMarkable(value, k - posn)
+        return value
+
+    def __iter__(self):
+        lazy_doc = self.lazy_doc
+        for doc, a, b, first in lazy_doc.text_ranges(0, len(lazy_doc), True):
+            values = getattr(doc, self.attr)[a:b]
+            if self.wrap:
+                values = offset_markables(values, first)
+            for x in values:
+                yield x
+
+
+class OffsetMarkable(object):
+
+    """
+    a markable or tree node of a text document, seen with its
+    span in positions of the whole document. Other
+    attributes are read from (and written to) the object itself,
+    which is in obj; markables and nodes reached through them
+    (terminals, children, parents) are wrapped in the same way.
+    """
+    __slots__ = ['obj', 'offset']
+
+    def __init__(self, obj, offset):
+        object.__setattr__(self, 'obj', obj)
+        object.__setattr__(self, 'offset', offset)
+
+    def __getattr__(self, name):
+        value = getattr(self.obj, name)
+        if name == 'span':
+            offset = self.offset
+            return [None if x is None else x + offset for x in value]
+        return wrap_value(value, self.offset)
+
+    def __setattr__(self, name, value):
+        if name == 'span':
+            offset = self.offset
+            value = [None if x is None else x - offset for x in value]
+        setattr(self.obj, name, value)
+
+    def __eq__(self, other):
+        return self.obj is getattr(other, 'obj', other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.obj)
+
+    def __repr__(self):
+        return 'OffsetMarkable(%r, %d)' % (self.obj, self.offset)
+
+
+def wrap_value(value, offset):
+    """
+    wraps a markable or node, or the markables and nodes in a
+    list, into :py:class:`OffsetMarkable` objects
+    """
+    if isinstance(value, (list, tuple)):
+        if value and is_positioned(value[0]):
+            return [OffsetMarkable(x, offset) for x in value]
+        return value
+    if is_positioned(value):
+        return OffsetMarkable(value, offset)
+    return value
+
+
+def is_positioned(value):
+    return isinstance(value, Node) or (
+        hasattr(value, 'span') and not isinstance(value, OffsetMarkable))
+
+
+def offset_markables(objs, offset):
+    """returns the markables with spans shifted by offset"""
+    return [OffsetMarkable(obj, offset) for obj in objs]
+
+
+class ChunkedDocument(object):
+
+    """
+    the parts of :py:class:`LazyDocument` that do not depend on where
+    the texts come from: subclasses set token_starts and n_tokens and
+    implement text_number, text_at, text_size and load_text.
+
+    :param cache_size: the number of texts to keep in memory
+    """
+
+    def __init__(self, cache_size=16):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+        self.words = LazyColumn(self, 'words')
+        self.w_objs = LazyColumn(self, 'w_objs', True)
+
+    def __len__(self):
+        return self.n_tokens
+
+    def size(self):
+        return self.n_tokens
+
+    def text(self, key):
+        """returns the document for one text, by number or ID"""
+        k = self.text_number(key)
+        cache = self.cache
+        try:
+            doc = cache.pop(k)
+        except KeyError:
+            self.misses += 1
+            doc = self.load_text(k)
+            while len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+        cache[k] = doc
+        return doc
+
+    def text_start(self, key):
+        """returns the position of the first token of a text"""
+        return self.token_starts[self.text_number(key)]
+
+    def locate(self, posn):
+        """
+        returns the document of the text that contains the
+        token at posn, and the position of the token in it
+        """
+        k = self.text_at(posn)
+        return self.text(k), posn - self.token_starts[k]
+
+    def text_ranges(self, start, end, with_offset=False):
+        """
+        yields (doc, local_start, local_end) for the texts that
+        overlap the tokens start..end-1, with the position of the
+        first token of the text if with_offset is true
+        """
+        if start >= end:
+            return
+        token_starts = self.token_starts
+        k = self.text_at(start)
+        while k < len(token_starts) and token_starts[k] < end:
+            first = token_starts[k]
+            part = (self.text(k), max(start, first) - first,
+                    min(end, first + self.text_size(k)) - first)
+            if with_offset:
+                part += (first,)
+            yield part
+            k += 1
+
+    def get_objects_by_class(self, cls, start=0, end=None):
+        if end is None:
+            end = len(self)
+        result = []
+        for doc, a, b, first in self.text_ranges(start, end, True):
+            result += offset_markables(
+                doc.get_objects_by_class(cls, a, b), first)
+        return result
+
+    def get_objects_by_level(self, level, start=0, end=None):
+        if end is None:
+            end = len(self)
+        result = []
+        for doc, a, b, first in self.text_ranges(start, end, True):
+            result += offset_markables(
+                doc.get_objects_by_level(level, a, b), first)
+        return result
+
+    def cache_info(self):
+        """returns the hit, miss and eviction counts of the text cache"""
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.cache_size, len(self.cache))
+
+    def cache_clear(self):
+        self.cache.clear()
+
+
+class LazyDocument(ChunkedDocument):
+
+    """
+    gives access to the tokens and markables of an EXML file,
+    reading its texts on demand.
+
+    :param cache_size: the number of texts to keep in memory
+    """
+
+    def __init__(self, fname, cache_size=16, encoding=None,
+                 lazy_trees=True, **doc_args):
+        ChunkedDocument.__init__(self, cache_size)
+        self.index = TextIndex(fname, encoding=encoding)
+        self.lazy_trees = lazy_trees
+        self.doc_args = doc_args
+        self.schema_doc = self.make_doc()
+        self.t_schema = self.schema_doc.t_schema
+        self.schemas = self.schema_doc.schemas
+        self.token_starts = self.index.token_starts
+        if self.index.texts:
+            last = self.index.texts[-1]
+            self.n_tokens = last[3] + last[4]
+        else:
+            self.n_tokens = 0
+
+    def make_doc(self):
+        doc = exmldoc.create_doc(**self.doc_args)
+        exmldoc.process_schema(doc, self.index.get_header()[1])
+        return doc
+
+    def schema_by_name(self, name):
+        return self.schema_doc.schema_by_name(name)
+
+    def text_number(self, key):
+        return self.index.text_number(key)
+
+    def text_at(self, posn):
+        return self.index.text_at(posn)
+
+    def text_size(self, k):
+        return self.index.texts[k][4]
+
+    def load_text(self, k):
+        return self.index.load_text(k, self.make_doc(),
+                                    lazy_trees=self.lazy_trees)
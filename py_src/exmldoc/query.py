@@ -0,0 +1,588 @@
+"""
+Structural queries over syntax trees, in a subset of the TIGERSearch
+query language::
+
+  #np:[cat="NX" & func="ON"] & #np > #w & #w:[pos="ART"]
+  [cat="SIMPX"] >* [lemma=/[Hh]und/]
+
+Node descriptions are conjunctions of attribute constraints that use
+the XML attribute names of the schema (``cat``, ``func``, ``pos``,
+``lemma``, ...), with ``=`` or ``!=`` and a quoted string or a
+/regular expression/. ``T`` and ``NT`` restrict a description to
+terminals or nonterminals. The relations are
+
+  ``>`` (``>LABEL``)   direct dominance (with the edge label of the child)
+  ``>*``               dominance
+  ``>~`` (``>~LABEL``) secondary edge from the left to the right node
+  ``.``                direct precedence
+  ``.*``               precedence
+  ``$``                siblings
+
+A :py:class:`TreebankIndex` maps attribute values to the token
+positions of the nodes carrying them, so that only sentences that can
+possibly match are looked at.
+"""
+from __future__ import print_function
+
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import partial
+
+import msgpack
+
+from . import tree
+from .alphabet import PythonAlphabet
+
+if sys.version_info.major >= 3:
+    xrange = range
+
+    def array_to_bytes(arr):
+        return arr.tobytes()
+
+    def array_from_bytes(typecode, buf):
+        arr = array(typecode)
+        arr.frombytes(buf)
+        return arr
+else:
+    def array_to_bytes(arr):
+        return arr.tostring()
+
+    def array_from_bytes(typecode, buf):
+        return array(typecode, buf)
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class Constraint(object):
+
+    """
+    a single attribute test in a node description
+    """
+
+    def __init__(self, name, value, negated=False, regex=False):
+        self.name = name
+        self.value = value
+        self.negated = negated
+        if regex:
+            self.pattern = re.compile('(?:%s)$' % (value,))
+        else:
+            self.pattern = None
+
+    def test(self, val):
+        if val is None:
+            result = False
+        elif self.pattern is not None:
+            result = self.pattern.match(val) is not None
+        else:
+            result = (val == self.value)
+        return result != self.negated
+
+
+class NodeDescription(object):
+
+    """
+    a conjunction of constraints that a single node has to fulfil
+    """
+
+    def __init__(self):
+        self.constraints = []
+        self.terminal = None
+
+    def update(self, other):
+        self.constraints += other.constraints
+        if other.terminal is not None:
+            if self.terminal is not None and self.terminal != other.terminal:
+                raise QuerySyntaxError('node cannot be both T and NT')
+            self.terminal = other.terminal
+
+    def matches(self, node, props):
+        """
+        :param props: maps attribute names to property names
+           for the kind of node at hand
+        """
+        for c in self.constraints:
+            if c.name not in props:
+                return False
+            if not c.test(getattr(node, props[c.name], None)):
+                return False
+        return True
+
+    def index_keys(self):
+        """the (attribute, value) pairs that any matching node must carry"""
+        return [(c.name, c.value) for c in self.constraints
+                if not c.negated and c.pattern is None]
+
+
+def dominates_direct(t, a, b, label):
+    return b.parent is a and (label is None or b.edge_label == label)
+
+
+def dominates(t, a, b, label):
+    return t.dominates(a, b)
+
+
+def secondary_edge(t, a, b, label):
+    secedges = getattr(b, 'secedge', None)
+    if not secedges:
+        return False
+    for edge in secedges:
+        if edge[1] is a and (label is None or edge[0] == label):
+            return True
+    return False
+
+
+def stored_secondary_edge(doc, t, a, b, label):
+    """secondary_edge for documents that keep edges in an edge store"""
+    if not hasattr(b, 'xml_id') or not hasattr(a, 'xml_id'):
+        return False
+    for (tgt, edge_label) in doc.edge_store.edges_from('secEdge', b.xml_id):
+        if tgt == a.xml_id and (label is None or edge_label == label):
+            return True
+    return False
+
+
+def precedes_direct(t, a, b, label):
+    return a.end == b.start
+
+
+def precedes(t, a, b, label):
+    return a.end <= b.start
+
+
+def siblings(t, a, b, label):
+    return a is not b and a.parent is not None and a.parent is b.parent
+
+
+relation_fns = {
+    '>': dominates_direct,
+    '>*': dominates,
+    '>~': secondary_edge,
+    '.': precedes_direct,
+    '.*': precedes,
+    '$': siblings
+}
+
+token_re = re.compile(r'''\s*(?:
+  (?P<var>\#[A-Za-z0-9_]+) |
+  (?P<string>"(?:[^"\\]|\\.)*") |
+  (?P<regex>/(?:[^/\\]|\\.)*/) |
+  (?P<rel>>\*|>~[A-Za-z0-9_\-]*|>[A-Za-z0-9_\-]*|\.\*|\.|\$) |
+  (?P<op>!=|=|&|\[|\]|:) |
+  (?P<name>[A-Za-z_][A-Za-z0-9_\-]*)
+  )''', re.X)
+
+
+def tokenize(s):
+    tokens = []
+    pos = 0
+    s = s.rstrip()
+    while pos < len(s):
+        m = token_re.match(s, pos)
+        if m is None or m.end() == pos:
+            raise QuerySyntaxError('cannot parse query at: %s' % (s[pos:],))
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    return tokens
+
+
+def unquote(s):
+    return re.sub(r'\\(.)', r'\1', s[1:-1])
+
+
+class Query(object):
+
+    """
+    a parsed query, consisting of node variables with their
+    descriptions and binary relations between them
+    """
+
+    def __init__(self):
+        self.variables = OrderedDict()
+        self.relations = []
+
+    def describe(self, var, desc):
+        if var in self.variables:
+            self.variables[var].update(desc)
+        else:
+            self.variables[var] = desc
+
+
+class QueryParser(object):
+
+    def __init__(self, s):
+        self.tokens = tokenize(s)
+        self.pos = 0
+        self.query = Query()
+        self.anon = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def expect(self, kind, val=None):
+        tok = self.peek()
+        if tok[0] != kind or (val is not None and tok[1] != val):
+            raise QuerySyntaxError('expected %s, found %s' % (
+                val or kind, tok[1]))
+        self.pos += 1
+        return tok[1]
+
+    def parse(self):
+        self.parse_term()
+        while self.peek() == ('op', '&'):
+            self.pos += 1
+            self.parse_term()
+        if self.peek()[0] is not None:
+            raise QuerySyntaxError('unexpected %s' % (self.peek()[1],))
+        return self.query
+
+    def parse_term(self):
+        left = self.parse_operand()
+        kind, val = self.peek()
+        if kind == 'rel':
+            self.pos += 1
+            right = self.parse_operand()
+            if val.startswith('>~'):
+                op, label = '>~', val[2:]
+            elif val in relation_fns:
+                op, label = val, ''
+            else:
+                op, label = '>', val[1:]
+            self.query.relations.append((op, label or None, left, right))
+
+    def parse_operand(self):
+        kind, val = self.peek()
+        if kind == 'var':
+            self.pos += 1
+            if self.peek() == ('op', ':'):
+                self.pos += 1
+                self.query.describe(val, self.parse_description())
+            elif val not in self.query.variables:
+                self.query.describe(val, NodeDescription())
+            return val
+        self.anon += 1
+        var = '#_%d' % (self.anon,)
+        self.query.describe(var, self.parse_description())
+        return var
+
+    def parse_description(self):
+        desc = NodeDescription()
+        self.expect('op', '[')
+        if self.peek() == ('op', ']'):
+            self.pos += 1
+            return desc
+        while True:
+            name = self.expect('name')
+            kind, val = self.peek()
+            if name in ('T', 'NT') and kind == 'op' and val in '&]':
+                desc.terminal = (name == 'T')
+            else:
+                op = self.expect('op')
+                if op not in ('=', '!='):
+                    raise QuerySyntaxError('expected = or !=, found %s' % (op,))
+                kind, val = self.peek()
+                if kind == 'string':
+                    desc.constraints.append(
+                        Constraint(name, unquote(val), op == '!='))
+                elif kind == 'regex':
+                    desc.constraints.append(
+                        Constraint(name, val[1:-1], op == '!=', regex=True))
+                else:
+                    raise QuerySyntaxError('expected value, found %s' % (val,))
+                self.pos += 1
+            if self.expect('op') == ']':
+                return desc
+
+
+def parse_query(s):
+    """parses a query string into a :py:class:`Query` object"""
+    return QueryParser(s).parse()
+
+
+def schema_props(schema):
+    if schema is None:
+        return {}
+    return dict((att.name, att.prop_name) for att in schema.attributes)
+
+
+class QueryMatcher(object):
+
+    """
+    matches a query against single trees of a document
+    """
+
+    def __init__(self, doc, query):
+        if not isinstance(query, Query):
+            query = parse_query(query)
+        self.query = query
+        self.t_props = schema_props(doc.t_schema)
+        self.nt_props = schema_props(doc.mlevel_for_class(tree.NontermNode))
+        rels_by_var = dict((var, []) for var in query.variables)
+        for rel in query.relations:
+            rels_by_var[rel[2]].append(rel)
+            rels_by_var[rel[3]].append(rel)
+        self.rels_by_var = rels_by_var
+        self.relation_fns = relation_fns
+        if getattr(doc, 'edge_store', None) is not None:
+            self.relation_fns = dict(relation_fns)
+            self.relation_fns['>~'] = partial(stored_secondary_edge, doc)
+
+    def candidates(self, t, desc):
+        result = []
+        for n in t.topdown_enumeration():
+            if n.isTerminal():
+                if desc.terminal is False:
+                    continue
+                props = self.t_props
+            else:
+                if desc.terminal is True:
+                    continue
+                props = self.nt_props
+            if desc.matches(n, props):
+                result.append(n)
+        return result
+
+    def match_tree(self, t):
+        """
+        yields all variable bindings (as dicts from variable names
+        to nodes) that fulfil the query in tree t
+        """
+        cands = []
+        for var, desc in self.query.variables.items():
+            nodes = self.candidates(t, desc)
+            if not nodes:
+                return
+            cands.append((len(nodes), var, nodes))
+        cands.sort(key=lambda x: x[0])
+        order = [(var, nodes) for (n, var, nodes) in cands]
+        for binding in self._extend(t, order, 0, {}):
+            yield binding
+
+    def _extend(self, t, order, i, binding):
+        if i == len(order):
+            yield dict(binding)
+            return
+        var, nodes = order[i]
+        for n in nodes:
+            binding[var] = n
+            ok = True
+            for (op, label, a, b) in self.rels_by_var[var]:
+                if a in binding and b in binding:
+                    if not self.relation_fns[op](t, binding[a], binding[b],
+                                                 label):
+                        ok = False
+                        break
+            if ok:
+                for result in self._extend(t, order, i + 1, binding):
+                    yield result
+        del binding[var]
+
+
+class TreebankIndex(object):
+
+    """
+    an inverted index from attribute values of nonterminals and
+    terminals to the (sorted) token positions where such nodes start.
+    Values of enum attributes are coded with the codes of the
+    attribute's alphabet.
+    """
+
+    def __init__(self):
+        self.sent_starts = array('i')
+        self.sent_ends = array('i')
+        # (attribute name) -> (alphabet, {code: array of positions})
+        self.postings = {}
+
+    @classmethod
+    def build(cls, doc, node_attrs=('cat', 'func'),
+              word_attrs=('pos', 'lemma', 'func')):
+        """
+        creates an index for all sentences in the document
+        """
+        index = cls()
+        for t in doc.get_objects_by_class(tree.Tree):
+            index.sent_starts.append(t.span[0])
+            index.sent_ends.append(t.span[-1])
+        nt_schema = doc.mlevel_for_class(tree.NontermNode)
+        levels = [(doc.t_schema, word_attrs,
+                   [(i, n) for (i, n) in enumerate(doc.w_objs)])]
+        if nt_schema is not None:
+            levels.append((nt_schema, node_attrs,
+                           [(n.span[0], n) for n in
+                            doc.get_objects_by_class(tree.NontermNode)]))
+        for schema, attr_names, objs in levels:
+            for name in attr_names:
+                try:
+                    att = schema.attribute_by_name(name)
+                except KeyError:
+                    continue
+                alph, postings = index.attribute_postings(att)
+                prop_name = att.prop_name
+                for posn, obj in objs:
+                    val = getattr(obj, prop_name, None)
+                    if val is None:
+                        continue
+                    code = alph[val]
+                    try:
+                        postings[code].append(posn)
+                    except KeyError:
+                        postings[code] = array('i', [posn])
+        # positions from nonterminals and terminals are interleaved
+        # for attributes that both have
+        for alph, postings in index.postings.values():
+            for code in postings:
+                postings[code] = array('i', sorted(postings[code]))
+        return index
+
+    def attribute_postings(self, att):
+        if att.name not in self.postings:
+            alph = PythonAlphabet()
+            if hasattr(att, 'alphabet'):
+                for val in att.alphabet:
+                    alph[val]
+            self.postings[att.name] = (alph, {})
+        return self.postings[att.name]
+
+    def lookup(self, name, value):
+        """returns the positions of nodes where attribute name has value"""
+        try:
+            alph, postings = self.postings[name]
+        except KeyError:
+            return None
+        code = alph.obj2int.get(value)
+        if code is None:
+            return array('i')
+        return postings.get(code, array('i'))
+
+    def sentences_with(self, positions):
+        starts = self.sent_starts
+        ends = self.sent_ends
+        result = set()
+        for posn in positions:
+            k = bisect_right(starts, posn) - 1
+            if k >= 0 and posn < ends[k]:
+                result.add(k)
+        return result
+
+    def candidate_sentences(self, query):
+        """
+        returns the numbers of the sentences that may match the query,
+        based on the equality constraints on indexed attributes
+        """
+        if not isinstance(query, Query):
+            query = parse_query(query)
+        result = None
+        for desc in query.variables.values():
+            for name, value in desc.index_keys():
+                positions = self.lookup(name, value)
+                if positions is None:
+                    continue
+                sents = self.sentences_with(positions)
+                if result is None:
+                    result = sents
+                else:
+                    result.intersection_update(sents)
+                if not result:
+                    return []
+        if result is None:
+            return list(xrange(len(self.sent_starts)))
+        return sorted(result)
+
+    def save(self, fname):
+        attrs = []
+        for name, (alph, postings) in self.postings.items():
+            attrs.append([name, list(alph.words),
+                          [[code, array_to_bytes(postings[code])]
+                           for code in sorted(postings)]])
+        data = {'version': 1,
+                'byteorder': sys.byteorder,
+                'sent_starts': list(self.sent_starts),
+                'sent_ends': list(self.sent_ends),
+                'attrs': attrs}
+        with open(fname, 'wb') as f_out:
+            f_out.write(msgpack.packb(data, use_bin_type=True))
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, 'rb') as f_in:
+            data = msgpack.unpackb(f_in.read(), raw=False)
+        index = cls()
+        index.sent_starts = array('i', data['sent_starts'])
+        index.sent_ends = array('i', data['sent_ends'])
+        swap = (data['byteorder'] != sys.byteorder)
+        for name, values, postings_data in data['attrs']:
+            alph = PythonAlphabet()
+            for val in values:
+                alph[val]
+            postings = {}
+            for code, buf in postings_data:
+                positions = array_from_bytes('i', buf)
+                if swap:
+                    positions.byteswap()
+                postings[code] = positions
+            index.postings[name] = (alph, postings)
+        return index
+
+
+def search(doc, query, index=None):
+    """
+    finds all matches of a query in a document.
+
+    The document can also be one that reads its texts on demand
+    (from :py:func:`exmldoc.open_lazy` or an
+    :py:class:`exmldoc.sqlstore.SQLiteDocument`). With an index, only
+    the texts that contain candidate sentences are then read; without
+    one, every text is.
+
+    :param index: a :py:class:`TreebankIndex` for this document; if given,
+       only the candidate sentences from the index are matched
+    :return: a sequence of (tree, bindings) pairs
+    """
+    if not isinstance(query, Query):
+        query = parse_query(query)
+    if hasattr(doc, 'text_at'):
+        parts = text_parts(doc, index, query)
+    elif index is None:
+        parts = [(doc, doc.get_objects_by_class(tree.Tree))]
+    else:
+        trees = []
+        for k in index.candidate_sentences(query):
+            start = index.sent_starts[k]
+            trees += doc.get_objects_by_class(tree.Tree, start, start + 1)
+        parts = [(doc, trees)]
+    for part_doc, trees in parts:
+        matcher = QueryMatcher(part_doc, query)
+        for t in trees:
+            for binding in matcher.match_tree(t):
+                yield t, binding
+
+
+def text_parts(doc, index, query):
+    """
+    yields (text document, trees) for the texts of a document
+    that reads texts on demand
+    """
+    if index is None:
+        for k in xrange(len(doc.token_starts)):
+            text_doc = doc.text(k)
+            yield text_doc, text_doc.get_objects_by_class(tree.Tree)
+        return
+    by_text = OrderedDict()
+    for k in index.candidate_sentences(query):
+        start = index.sent_starts[k]
+        by_text.setdefault(doc.text_at(start), []).append(start)
+    for k, starts in by_text.items():
+        text_doc = doc.text(k)
+        offset = doc.token_starts[k]
+        trees = []
+        for start in starts:
+            trees += text_doc.get_objects_by_class(
+                tree.Tree, start - offset, start - offset + 1)
+        yield text_doc, trees
@@ -0,0 +1,527 @@
+"""
+Spilling finished parts of a document to disk.
+
+Pipelines that look back at earlier texts (for coreference across
+texts, say) cannot clear the markables of the texts they are done
+with. Instead, they can mark those ranges as finished::
+
+  spill = doc.enable_spill(max_tokens=500000)
+  while True:
+      new_stop = reader.addNext()
+      ...
+      spill.finish(last_stop, new_stop)
+  print(spill.stats())
+
+Once the finished windows in memory hold more than max_tokens tokens,
+the least recently used ones are pickled to a spill file, and their
+terminals, markables and entries in ``object_by_id`` are removed from
+the document. They are read back in when they are accessed through
+``w_objs``, ``object_by_id`` or the range methods of the document
+(:py:meth:`exmldoc.Document.get_objects_by_level`,
+:py:meth:`exmldoc.Document.write_inline_xml` and so on).
+
+Objects that are read back in are new copies of the ones that were
+spilled. So that the old copies can be freed, references to them from
+the terminals and markables that stay in memory are replaced by
+:py:class:`exmldoc.PendingRef` placeholders when a window is spilled,
+and by the new copies when it is read back in. A placeholder is
+looked up with ``doc.object_by_id[ref.xml_id]``, which reads its
+window back in. References held outside the document still point
+to the old copies. Which objects refer to a window is noted when
+the window is finished or read back in, so spilling it does not
+have to look at the rest of the document.
+
+The space of windows that have been read back in is reused for
+later spills, so the spill file only grows with the amount of
+text that is spilled at the same time.
+"""
+import pickle
+import tempfile
+from collections import OrderedDict, namedtuple
+from io import BytesIO, open as file_open
+
+from sortedcontainers import SortedDict
+
+import exmldoc
+from .parallel import schema_classes
+
+SpillStats = namedtuple('SpillStats',
+                        ['spills', 'page_ins', 'resident_tokens',
+                         'spilled_tokens', 'spilled_windows', 'file_bytes'])
+
+
+def slot_names(cls, cache={}):
+    """returns the names of the slots of cls and its base classes"""
+    try:
+        return cache[cls]
+    except KeyError:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, str):
+                slots = [slots]
+            names += [name for name in slots
+                      if name not in ('__dict__', '__weakref__')]
+        cache[cls] = names
+        return names
+
+
+def replace_values(obj, fn):
+    """
+    replaces the values in the attributes (and slots) of obj, and in
+    lists in them such as edges, by fn(value); returns True if any
+    changed
+    """
+    changed = []
+
+    def replace(val):
+        if isinstance(val, list):
+            val[:] = [replace(x) for x in val]
+            return val
+        new_val = fn(val)
+        if new_val is not val:
+            changed.append(val)
+        return new_val
+    d = getattr(obj, '__dict__', None)
+    if d:
+        for k, val in list(d.items()):
+            d[k] = replace(val)
+    for name in slot_names(type(obj)):
+        val = getattr(obj, name, None)
+        if val is not None:
+            new_val = replace(val)
+            if new_val is not val:
+                setattr(obj, name, new_val)
+    return bool(changed)
+
+
+def iter_values(obj):
+    """yields the values of the attributes and slots of obj"""
+    d = getattr(obj, '__dict__', None)
+    values = list(d.values()) if d else []
+    values += [getattr(obj, name, None) for name in slot_names(type(obj))]
+    while values:
+        val = values.pop()
+        if isinstance(val, list):
+            values += val
+        elif val is not None:
+            yield val
+
+
+class PagedList(list):
+
+    """the w_objs of a document with spilling, see :py:class:`Spill`"""
+
+    def __init__(self, items, spill):
+        list.__init__(self, items)
+        self.spill = spill
+
+    def __getitem__(self, k):
+        val = list.__getitem__(self, k)
+        if isinstance(k, slice):
+            if any([x is None for x in val]):
+                start, stop, step = k.indices(len(self))
+                if self.spill.page_in(min(start, stop), max(start, stop) + 1):
+                    val = list.__getitem__(self, k)
+        elif val is None:
+            if k < 0:
+                k += len(self)
+            if self.spill.page_in(k, k + 1):
+                val = list.__getitem__(self, k)
+        return val
+
+    def __iter__(self):
+        for i, val in enumerate(list.__iter__(self)):
+            if val is None:
+                val = self[i]
+            yield val
+
+
+class PagedDict(dict):
+
+    """the object_by_id of a document with spilling"""
+
+    def __init__(self, items, spill):
+        dict.__init__(self, items)
+        self.spill = spill
+
+    def __missing__(self, key):
+        self.spill.page_in_id(key)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.spill.id_index
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class Spill(object):
+
+    """
+    keeps the finished windows of a document under a token budget
+    by writing the least recently used ones to a file.
+
+    :param max_tokens: the number of tokens of finished windows that
+       are kept in memory
+    :param fname: the spill file; a temporary file is used if None
+    """
+
+    def __init__(self, doc, max_tokens=1000000, fname=None):
+        self.doc = doc
+        self.max_tokens = max_tokens
+        if fname is None:
+            self.f = tempfile.TemporaryFile()
+        else:
+            self.f = file_open(fname, 'w+b')
+        self.file_size = 0
+        # unused parts of the spill file, as offset: length
+        self.free = SortedDict()
+        # all finished windows, as start: end
+        self.windows = SortedDict()
+        # finished windows in memory, as start: end in LRU order
+        self.resident = OrderedDict()
+        self.resident_tokens = 0
+        # spilled windows, as start: (end, offset, length, ids)
+        self.spilled = SortedDict()
+        self.spilled_tokens = 0
+        self.id_index = {}
+        # objects in memory that refer to a window, as
+        # holders[window][holder window] = [obj, ...]; the holder
+        # window is None for objects that were not finished yet
+        self.holders = {}
+        # the windows that the objects of a window refer to
+        self.targets = {}
+        self.spills = self.page_ins = 0
+        self.loading = 0
+        self.classes = schema_classes(doc)
+        self.classes_by_name = dict([(name, cls) for (cls, name)
+                                     in self.classes.items()])
+
+    def finish(self, start, end):
+        """
+        marks the tokens start..end-1 and the markables that start
+        there as finished, so that they can be spilled
+        """
+        if end <= start:
+            return
+        if start in self.resident:
+            self.resident_tokens -= self.resident.pop(start) - start
+        self.resident[start] = end
+        self.resident_tokens += end - start
+        self.windows[start] = end
+        objs = self.window_objects(start, end)
+        self.forget_refs(start)
+        self.record_refs(start, objs)
+        # the objects of the window are now recorded as its holders
+        finished = set([id(obj) for obj in objs])
+        for by_window in self.holders.values():
+            if by_window.get(None):
+                by_window[None] = [obj for obj in by_window[None]
+                                   if id(obj) not in finished]
+        self.evict()
+
+    def window_objects(self, start, end):
+        """returns the terminals and markables in memory in start..end-1"""
+        doc = self.doc
+        mbs = doc.markables_by_start
+        objs = [n for n in list.__getitem__(doc.w_objs, slice(start, end))
+                if n is not None]
+        for pos in mbs.irange(start, end, inclusive=(True, False)):
+            objs += [obj for (mlevel, obj) in mbs[pos]]
+        return objs
+
+    def window_of(self, val):
+        """returns the finished window that val lies in, or None"""
+        if isinstance(val, exmldoc.PendingRef):
+            return self.id_index.get(val.xml_id)
+        span = getattr(val, 'span', None)
+        if not span or getattr(val, 'xml_id', None) is None:
+            return None
+        windows = self.windows
+        k = windows.bisect_right(span[0]) - 1
+        if k < 0:
+            return None
+        start, end = windows.peekitem(k)
+        if span[0] < end:
+            return start
+        return None
+
+    def record_refs(self, window, objs):
+        """notes the objects among objs that refer to other windows"""
+        holders = self.holders
+        targets = self.targets.setdefault(window, set())
+        window_of = self.window_of
+        # only terminals, markables and placeholders can be in a window
+        ref_types = set(self.classes)
+        ref_types.add(exmldoc.PendingRef)
+        for obj in objs:
+            found = set()
+            for val in iter_values(obj):
+                if type(val) not in ref_types:
+                    continue
+                target = window_of(val)
+                if target is not None and target != window:
+                    found.add(target)
+            for target in found:
+                holders.setdefault(target, {}).setdefault(
+                    window, []).append(obj)
+            targets.update(found)
+
+    def forget_refs(self, window):
+        """drops the holders recorded for the objects of a window"""
+        for target in self.targets.pop(window, ()):
+            by_window = self.holders.get(target)
+            if by_window is not None:
+                by_window.pop(window, None)
+
+    def evict(self, keep=(0, 0)):
+        """
+        spills windows until the budget is kept, except for those
+        that overlap the range keep and the most recently used one
+        """
+        if self.loading:
+            return
+        for start, end in list(self.resident.items())[:-1]:
+            if self.resident_tokens <= self.max_tokens:
+                break
+            if start < keep[1] and end > keep[0]:
+                continue
+            del self.resident[start]
+            self.resident_tokens -= end - start
+            self.spill_window(start, end)
+
+    def allocate(self, length):
+        """returns the offset of an unused part of the spill file"""
+        free = self.free
+        for offset, size in free.items():
+            if size >= length:
+                del free[offset]
+                if size > length:
+                    free[offset + length] = size - length
+                return offset
+        offset = self.file_size
+        self.file_size += length
+        return offset
+
+    def release(self, offset, length):
+        """marks a part of the spill file as unused"""
+        free = self.free
+        k = free.bisect_left(offset)
+        if k < len(free):
+            next_offset, next_size = free.peekitem(k)
+            if offset + length == next_offset:
+                del free[next_offset]
+                length += next_size
+        if k > 0:
+            prev_offset, prev_size = free.peekitem(k - 1)
+            if prev_offset + prev_size == offset:
+                del free[prev_offset]
+                offset = prev_offset
+                length += prev_size
+        if offset + length == self.file_size:
+            self.file_size = offset
+            self.f.truncate(offset)
+        else:
+            free[offset] = length
+
+    def spill_window(self, start, end):
+        doc = self.doc
+        mbs = doc.markables_by_start
+        w_objs = list.__getitem__(doc.w_objs, slice(start, end))
+        markables = [(pos, mbs[pos]) for pos in
+                     list(mbs.irange(start, end, inclusive=(True, False)))]
+        objs = [n for n in w_objs if n is not None]
+        for pos, entries in markables:
+            objs += [obj for (mlevel, obj) in entries]
+        local = set([id(obj) for obj in objs])
+        object_by_id = doc.object_by_id
+        id_index = self.id_index
+        classes = self.classes
+
+        def persistent_id(obj):
+            if obj is doc:
+                return ('doc',)
+            if isinstance(obj, type):
+                name = classes.get(obj)
+                return name and ('cls', name)
+            if isinstance(obj, exmldoc.PendingRef):
+                return ('ref', obj.xml_id)
+            if id(obj) in local:
+                return None
+            xml_id = getattr(obj, 'xml_id', None)
+            if xml_id is not None and (
+                    dict.get(object_by_id, xml_id) is obj or
+                    xml_id in id_index):
+                return ('ref', xml_id)
+            return None
+        f = BytesIO()
+        pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump((w_objs, [(pos, [(mlevel.name, obj)
+                                      for (mlevel, obj) in entries])
+                               for (pos, entries) in markables]))
+        data = f.getvalue()
+        offset = self.allocate(len(data))
+        self.f.seek(offset)
+        self.f.write(data)
+        ids = [obj.xml_id for obj in objs if hasattr(obj, 'xml_id') and
+               dict.get(object_by_id, obj.xml_id) is obj]
+        for k in ids:
+            del object_by_id[k]
+            self.id_index[k] = start
+        list.__setitem__(doc.w_objs, slice(start, end), [None] * (end - start))
+        mbs.clear_range(start, end)
+        # unlink the objects that stay in memory from the spilled ones
+        id_set = set(ids)
+        targets = dict([(id(obj), obj.xml_id) for obj in objs
+                        if getattr(obj, 'xml_id', None) in id_set])
+
+        def unlink(val):
+            xml_id = targets.get(id(val))
+            if xml_id is None:
+                return val
+            return exmldoc.PendingRef(xml_id)
+        self.forget_refs(start)
+        by_window = self.holders.setdefault(start, {})
+        for holders in by_window.values():
+            for obj in holders:
+                replace_values(obj, unlink)
+        # objects that have not been finished yet were not recorded
+        unfinished_start = self.windows.peekitem(-1)[1]
+        by_window[None] = [
+            obj for obj in self.window_objects(unfinished_start,
+                                               len(doc.w_objs))
+            if replace_values(obj, unlink)]
+        self.spilled[start] = (end, offset, len(data), ids)
+        self.spilled_tokens += end - start
+        self.spills += 1
+
+    def load_window(self, start):
+        doc = self.doc
+        end, offset, length, ids = self.spilled.pop(start)
+        ids = set(ids)
+        self.spilled_tokens -= end - start
+        for k in ids:
+            if self.id_index.get(k) == start:
+                del self.id_index[k]
+        self.f.seek(offset)
+        data = self.f.read(length)
+        self.release(offset, length)
+        object_by_id = doc.object_by_id
+        schemas = dict([(schema.name, schema) for schema in doc.schemas])
+        pending = []
+
+        def persistent_load(pid):
+            if pid[0] == 'doc':
+                return doc
+            elif pid[0] == 'cls':
+                return self.classes_by_name[pid[1]]
+            obj = dict.get(object_by_id, pid[1])
+            if obj is None:
+                # read in once this window is in place
+                obj = exmldoc.PendingRef(pid[1])
+                pending.append(obj)
+            return obj
+        unpickler = pickle.Unpickler(BytesIO(data))
+        unpickler.persistent_load = persistent_load
+        w_objs, markables = unpickler.load()
+        objs = [n for n in w_objs if n is not None]
+        by_start = {}
+        for pos, entries in markables:
+            objs += [obj for (name, obj) in entries]
+            by_start[pos] = [(schemas[name], obj) for (name, obj) in entries]
+        for obj in objs:
+            if hasattr(obj, 'xml_id') and obj.xml_id in ids:
+                dict.__setitem__(object_by_id, obj.xml_id, obj)
+        list.__setitem__(doc.w_objs, slice(start, end), w_objs)
+        doc.merge_markables(by_start)
+        self.resident[start] = end
+        self.resident_tokens += end - start
+        self.page_ins += 1
+        if pending:
+            for obj in objs:
+                exmldoc.replace_pending_refs(obj, object_by_id)
+        self.record_refs(start, objs)
+
+        def link(val):
+            if isinstance(val, exmldoc.PendingRef) and val.xml_id in ids:
+                return dict.get(object_by_id, val.xml_id, val)
+            return val
+        by_window = self.holders.get(start, {})
+        for holders in by_window.values():
+            for obj in holders:
+                replace_values(obj, link)
+        by_window.pop(None, None)
+
+    def windows_in(self, start, end):
+        """returns the starts of the spilled windows overlapping start..end-1"""
+        spilled = self.spilled
+        keys = spilled.keys()
+        k = max(0, spilled.bisect_right(start) - 1)
+        result = []
+        while k < len(keys) and keys[k] < end:
+            if spilled[keys[k]][0] > start:
+                result.append(keys[k])
+            k += 1
+        return result
+
+    def page_in(self, start, end):
+        """
+        reads the spilled windows that overlap start..end-1 back in;
+        returns True if there were any
+        """
+        if not self.spilled:
+            return False
+        starts = self.windows_in(start, end)
+        if not starts:
+            return False
+        self.loading += 1
+        try:
+            for k in starts:
+                if k in self.spilled:
+                    self.load_window(k)
+        finally:
+            self.loading -= 1
+        # what is being accessed stays in memory until the next access
+        self.evict(keep=(start, end))
+        return True
+
+    def page_in_id(self, xml_id):
+        """reads back the window with the object xml_id, or raises KeyError"""
+        try:
+            start = self.id_index[xml_id]
+        except KeyError:
+            raise KeyError(xml_id)
+        self.page_in(start, start + 1)
+
+    def discard(self, start, end):
+        """forgets the spilled and finished windows in start..end-1"""
+        for k in self.windows_in(start, end):
+            w_end, offset, length, ids = self.spilled.pop(k)
+            self.spilled_tokens -= w_end - k
+            for xml_id in ids:
+                if self.id_index.get(xml_id) == k:
+                    del self.id_index[xml_id]
+            self.release(offset, length)
+        for k, w_end in list(self.resident.items()):
+            if k < end and w_end > start:
+                del self.resident[k]
+                self.resident_tokens -= w_end - k
+        for k, w_end in list(self.windows.items()):
+            if k < end and w_end > start:
+                del self.windows[k]
+                self.forget_refs(k)
+                self.holders.pop(k, None)
+
+    def stats(self):
+        """returns the spill, page-in and size counts"""
+        return SpillStats(self.spills, self.page_ins, self.resident_tokens,
+                          self.spilled_tokens, len(self.spilled),
+                          self.file_size)
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,465 @@
+"""
+Out-of-core storage of EXML documents in an SQLite database.
+
+:py:func:`import_xml` reads an EXML file one text at a time and
+writes its terminals and markables to the database, so that only one
+text is in memory at any time. :py:class:`SQLiteDocument` gives
+read access to the database, like :py:class:`exmldoc.lazy.LazyDocument`
+does for an EXML file::
+
+  sqlstore.import_xml('huge.exml.xml', 'huge.db')
+  doc = sqlstore.SQLiteDocument('huge.db', cache_size=8)
+  doc.words[120000:120010]
+  doc.get_objects_by_level('sentence', 120000, 121000)
+  with io.open('copy.exml.xml', 'w', encoding='UTF-8') as f_out:
+      doc.write_xml(f_out)
+
+Terminals have one row per token, markables one row per object with
+its level and span; the attributes and edges of each object are kept
+in a msgpack blob, with references as XML IDs. Level and range
+queries are answered from the indexes on the span columns, and the
+texts that contain the results are read into documents of their own
+(kept in an LRU cache), so the spans of the objects count tokens from
+the start of their text. References to objects in other texts are
+:py:class:`exmldoc.PendingRef` placeholders that
+:py:meth:`SQLiteDocument.get_object` resolves.
+"""
+from __future__ import print_function
+
+import sqlite3
+import sys
+from bisect import bisect_right
+from collections import OrderedDict
+
+from msgpack import packb, unpackb
+
+import exmldoc
+from .alphabet import PythonAlphabet
+from .binary import schema_to_list, schema_element, \
+    objects_to_columns, columns_to_objects, fill_columns
+from .lazy import ChunkedDocument, OffsetMarkable
+
+TABLES = '''
+CREATE TABLE IF NOT EXISTS meta (
+  name TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS levels (
+  level INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS texts (
+  text INTEGER PRIMARY KEY, span_start INTEGER, span_end INTEGER);
+CREATE TABLE IF NOT EXISTS terminals (
+  posn INTEGER PRIMARY KEY, xml_id TEXT, word TEXT, attrs BLOB);
+CREATE TABLE IF NOT EXISTS markables (
+  id INTEGER PRIMARY KEY, text INTEGER, level INTEGER,
+  span_start INTEGER, span_end INTEGER, xml_id TEXT,
+  span BLOB, attrs BLOB);
+'''
+
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS terminals_xml_id ON terminals (xml_id);
+CREATE INDEX IF NOT EXISTS markables_level ON markables (level, span_start);
+CREATE INDEX IF NOT EXISTS markables_start ON markables (span_start);
+CREATE INDEX IF NOT EXISTS markables_text ON markables (text);
+CREATE INDEX IF NOT EXISTS markables_xml_id ON markables (xml_id);
+'''
+
+
+def row_attrs(columns, i):
+    """
+    the attribute values and edges of object i in columns from
+    :py:func:`exmldoc.binary.objects_to_columns`, without empty ones
+    """
+    result = {}
+    for key, col in columns.items():
+        val = col[i]
+        if key.startswith(':edge:'):
+            if val:
+                result[key] = val
+        elif key[0] != ':' and val is not None:
+            result[key] = val
+    return result
+
+
+def rows_to_columns(rows):
+    """turns (xml_id, span, attrs) rows into columns, one per attribute"""
+    n = len(rows)
+    columns = {':id': [row[0] for row in rows],
+               ':span': [row[1] for row in rows]}
+    for i, row in enumerate(rows):
+        for key, val in row[2].items():
+            if key not in columns:
+                columns[key] = [None] * n
+            columns[key][i] = val
+    return columns
+
+
+def clear_doc(doc):
+    """empties a document after its text has been written"""
+    doc.words = []
+    doc.w_objs = []
+    doc.word_ids = PythonAlphabet()
+    doc.object_by_id = {}
+    doc.temp_ids = {}
+    doc.markables_by_start.clear()
+    doc.pending_refs = set()
+
+
+class SQLiteWriter(object):
+
+    """
+    writes the texts of a document to a database, see
+    :py:func:`import_xml`
+    """
+
+    def __init__(self, db):
+        self.db = db
+        db.executescript(TABLES)
+        if db.execute('SELECT count(*) FROM terminals').fetchone()[0]:
+            raise ValueError("the database is not empty")
+        self.n_texts = 0
+        self.n_tokens = 0
+        self.n_markables = 0
+        self.level_nums = {}
+
+    def level_num(self, name):
+        try:
+            return self.level_nums[name]
+        except KeyError:
+            k = self.level_nums[name] = len(self.level_nums)
+            self.db.execute('INSERT INTO levels VALUES (?, ?)', (k, name))
+            return k
+
+    def write_text(self, doc):
+        """writes the terminals and markables in doc as the next text"""
+        db = self.db
+        offset = self.n_tokens
+        w_objs = doc.w_objs
+        columns = objects_to_columns(doc, w_objs, doc.t_schema)
+        db.executemany('INSERT INTO terminals VALUES (?, ?, ?, ?)', [
+            (offset + i, columns[':id'][i], doc.words[i],
+             packb(row_attrs(columns, i), use_bin_type=True))
+            for i in range(len(w_objs))])
+        # rows are numbered in the order of the markable index, so
+        # that reading them back in row order gives the same order
+        by_level = OrderedDict()
+        for posn, entries in doc.markables_by_start.items():
+            for mlevel, obj in entries:
+                if mlevel.name not in by_level:
+                    by_level[mlevel.name] = ([], [])
+                objs, row_ids = by_level[mlevel.name]
+                objs.append(obj)
+                row_ids.append(self.n_markables)
+                self.n_markables += 1
+        rows = []
+        for name, (objs, row_ids) in by_level.items():
+            level = self.level_num(name)
+            columns = objects_to_columns(doc, objs, doc.schema_by_name(name))
+            for i, obj in enumerate(objs):
+                span = obj.span
+                if len(span) > 2:
+                    s_span = packb([offset + x for x in span])
+                else:
+                    s_span = None
+                rows.append((row_ids[i], self.n_texts, level,
+                             offset + span[0], offset + span[-1],
+                             columns[':id'][i], s_span,
+                             packb(row_attrs(columns, i), use_bin_type=True)))
+        db.executemany('INSERT INTO markables VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       rows)
+        db.execute('INSERT INTO texts VALUES (?, ?, ?)',
+                   (self.n_texts, offset, offset + len(w_objs)))
+        self.n_texts += 1
+        self.n_tokens += len(w_objs)
+
+    def finish(self, doc):
+        """writes the schema of doc and creates the indexes"""
+        db = self.db
+        db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                   ('schema', packb(schema_to_list(doc), use_bin_type=True)))
+        db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                   ('size', self.n_tokens))
+        db.executescript(INDEXES)
+        db.commit()
+
+
+def import_xml(fname, db_fname, encoding=None, **doc_args):
+    """
+    reads an EXML file into a new SQLite database, one text at a time.
+    References between texts are stored as IDs like all others.
+
+    :param doc_args: options for :py:func:`exmldoc.create_doc`; pass
+       the same ones when opening the database
+    :return: an :py:class:`SQLiteDocument` for the database
+    """
+    doc = exmldoc.create_doc(**doc_args)
+    doc.pending_refs = set()
+    reader = exmldoc.XMLCorpusReader(doc, fname, encoding)
+    db = sqlite3.connect(db_fname)
+    try:
+        writer = SQLiteWriter(db)
+        while True:
+            try:
+                reader.addNext()
+            except StopIteration:
+                break
+            # markables that enclose several texts keep the
+            # document until they are closed
+            if not reader.markable_stack and (
+                    doc.w_objs or len(doc.markables_by_start)):
+                writer.write_text(doc)
+                clear_doc(doc)
+                reader.ref_holders.clear()
+        if doc.w_objs or len(doc.markables_by_start):
+            writer.write_text(doc)
+        writer.finish(doc)
+    finally:
+        db.close()
+    return SQLiteDocument(db_fname, **doc_args)
+
+
+class WordColumn(object):
+
+    """the words of an SQLiteDocument, read from the terminals table"""
+
+    def __init__(self, sql_doc):
+        self.sql_doc = sql_doc
+
+    def __len__(self):
+        return len(self.sql_doc)
+
+    def __getitem__(self, k):
+        db = self.sql_doc.db
+        if isinstance(k, slice):
+            start, stop, step = k.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return [row[0] for row in db.execute(
+                'SELECT word FROM terminals WHERE posn >= ? AND posn < ?'
+                ' ORDER BY posn', (start, stop))]
+        if k < 0:
+            k += len(self)
+        row = db.execute('SELECT word FROM terminals WHERE posn = ?',
+                         (k,)).fetchone()
+        if row is None:
+            raise IndexError(k)
+        return row[0]
+
+    def __iter__(self):
+        for row in self.sql_doc.db.execute(
+                'SELECT word FROM terminals ORDER BY posn'):
+            yield row[0]
+
+
+class SQLiteDocument(ChunkedDocument):
+
+    """
+    gives access to an EXML document in a database written by
+    :py:func:`import_xml`, reading its texts on demand.
+
+    :param cache_size: the number of texts to keep in memory
+    """
+
+    def __init__(self, db_fname, cache_size=16, lazy_trees=True,
+                 **doc_args):
+        ChunkedDocument.__init__(self, cache_size)
+        self.db = db = sqlite3.connect(db_fname)
+        self.lazy_trees = lazy_trees
+        self.doc_args = doc_args
+        try:
+            row = db.execute('SELECT value FROM meta WHERE name = ?',
+                             ('schema',)).fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row is None:
+            raise ValueError("%s is not an EXML database" % (db_fname,))
+        self.schema_list = unpackb(row[0], raw=False)
+        self.schema_doc = self.make_doc()
+        self.t_schema = self.schema_doc.t_schema
+        self.schemas = self.schema_doc.schemas
+        self.level_nums = dict((name, k) for (k, name) in db.execute(
+            'SELECT level, name FROM levels'))
+        self.level_names = dict((k, name) for (name, k)
+                                in self.level_nums.items())
+        self.token_starts = []
+        self.text_sizes = []
+        for start, end in db.execute(
+                'SELECT span_start, span_end FROM texts ORDER BY text'):
+            self.token_starts.append(start)
+            self.text_sizes.append(end - start)
+        self.n_tokens = sum(self.text_sizes)
+        self.words = WordColumn(self)
+
+    def close(self):
+        self.db.close()
+
+    def make_doc(self):
+        doc = exmldoc.create_doc(**self.doc_args)
+        exmldoc.process_schema(doc, schema_element(self.schema_list))
+        return doc
+
+    def schema_by_name(self, name):
+        return self.schema_doc.schema_by_name(name)
+
+    def text_number(self, key):
+        """maps a text number, or the ID of any object in it, to the number"""
+        if isinstance(key, int):
+            return key
+        row = self.db.execute('SELECT text FROM markables WHERE xml_id = ?',
+                              (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def text_at(self, posn):
+        k = bisect_right(self.token_starts, posn) - 1
+        if k < 0 or posn >= self.token_starts[k] + self.text_sizes[k]:
+            raise IndexError(posn)
+        return k
+
+    def text_size(self, k):
+        return self.text_sizes[k]
+
+    def load_text(self, k):
+        """
+        reads one text into a new document; its row_objects attribute
+        maps the row numbers of its markables to the objects
+        """
+        db = self.db
+        doc = self.make_doc()
+        doc.pending_refs = set()
+        start = self.token_starts[k]
+        rows = [(xml_id, [i, i + 1], unpackb(attrs, raw=False))
+                for i, (xml_id, attrs) in enumerate(db.execute(
+                    'SELECT xml_id, attrs FROM terminals'
+                    ' WHERE posn >= ? AND posn < ? ORDER BY posn',
+                    (start, start + self.text_sizes[k])))]
+        t_schema = doc.t_schema
+        t_columns = rows_to_columns(rows)
+        w_objs = columns_to_objects(doc, len(rows), t_columns, t_schema, True)
+        temp_ids = [doc.assign_temp_id(n) for n in w_objs
+                    if not hasattr(n, 'xml_id')]
+        doc.add_terminals(w_objs)
+        for obj_id in temp_ids:
+            doc.clear_temp_id(doc.object_by_id[obj_id])
+        by_level = OrderedDict()
+        row_ids = []
+        for row_id, level, span_start, span_end, xml_id, s_span, attrs in \
+                db.execute('SELECT id, level, span_start, span_end, xml_id,'
+                           ' span, attrs FROM markables WHERE text = ?'
+                           ' ORDER BY id', (k,)):
+            if s_span is None:
+                span = [span_start - start, span_end - start]
+            else:
+                span = [x - start for x in unpackb(s_span)]
+            if level not in by_level:
+                by_level[level] = []
+            by_level[level].append((xml_id, span, unpackb(attrs, raw=False)))
+            row_ids.append((row_id, level))
+        levels = {}
+        for level, rows in by_level.items():
+            schema = doc.schema_by_name(self.level_names[level])
+            columns = rows_to_columns(rows)
+            levels[level] = (schema, columns, columns_to_objects(
+                doc, len(rows), columns, schema))
+        row_objects = {}
+        by_start = OrderedDict()
+        positions = dict((level, 0) for level in levels)
+        for row_id, level in row_ids:
+            schema, columns, objs = levels[level]
+            obj = objs[positions[level]]
+            positions[level] += 1
+            row_objects[row_id] = obj
+            if obj.span[0] in by_start:
+                by_start[obj.span[0]].append((schema, obj))
+            else:
+                by_start[obj.span[0]] = [(schema, obj)]
+        doc.merge_markables(by_start)
+        fill_columns(doc, w_objs, t_columns, t_schema)
+        for schema, columns, objs in levels.values():
+            fill_columns(doc, objs, columns, schema)
+        exmldoc.postprocess_doc(doc, lazy=self.lazy_trees)
+        doc.row_objects = row_objects
+        return doc
+
+    def rows_to_objects(self, rows, corpus_spans=False):
+        """
+        maps (text, row number) pairs of markables to the objects;
+        with corpus_spans, to :py:class:`exmldoc.lazy.OffsetMarkable`
+        wrappers with spans in positions of the whole document
+        """
+        result = []
+        for k, row_id in rows:
+            obj = self.text(k).row_objects[row_id]
+            if corpus_spans:
+                obj = OffsetMarkable(obj, self.token_starts[k])
+            result.append(obj)
+        return result
+
+    def query_levels(self, level_nums, start, end):
+        if not level_nums:
+            return []
+        return self.rows_to_objects(self.db.execute(
+            'SELECT text, id FROM markables WHERE level IN (%s)'
+            ' AND span_start >= ? AND span_start < ?'
+            ' ORDER BY span_start, id' % (','.join('?' * len(level_nums))),
+            tuple(level_nums) + (start, end)).fetchall(), True)
+
+    def get_objects_by_level(self, level, start=0, end=None):
+        if end is None:
+            end = len(self)
+        if level not in self.level_nums:
+            return []
+        return self.query_levels([self.level_nums[level]], start, end)
+
+    def get_objects_by_class(self, cls, start=0, end=None):
+        if end is None:
+            end = len(self)
+        level_nums = [self.level_nums[schema.name]
+                      for schema in self.schemas
+                      if schema.name in self.level_nums and
+                      schema.cls is not None and issubclass(schema.cls, cls)]
+        return self.query_levels(level_nums, start, end)
+
+    def get_object(self, xml_id):
+        """
+        returns the terminal or markable with the given XML ID,
+        for example to resolve a :py:class:`exmldoc.PendingRef`
+        """
+        db = self.db
+        row = db.execute('SELECT text, id FROM markables WHERE xml_id = ?',
+                         (xml_id,)).fetchone()
+        if row is not None:
+            return self.rows_to_objects([row], True)[0]
+        row = db.execute('SELECT posn FROM terminals WHERE xml_id = ?',
+                         (xml_id,)).fetchone()
+        if row is None:
+            raise KeyError(xml_id)
+        return self.w_objs[row[0]]
+
+    def write_xml(self, f_out, encoding='UTF-8'):
+        """
+        writes the document as an ExportXMLv2 file, one text at
+        a time, like :py:func:`exmldoc.write_corpus_xml`
+        """
+        print('<?xml version="1.0" encoding="%s"?>' % (encoding,), file=f_out)
+        print('<exml-doc>', file=f_out)
+        self.schema_doc.describe_schema(f_out)
+        print('<body serialization="inline">', file=f_out)
+        for k in range(len(self.token_starts)):
+            self.text(k).write_inline_xml(f_out)
+        print('</body>', file=f_out)
+        print('</exml-doc>', file=f_out)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 2:
+        print("Usage: python -m exmldoc.sqlstore file.exml.xml file.db",
+              file=sys.stderr)
+        sys.exit(1)
+    doc = import_xml(argv[0], argv[1])
+    print("%d tokens in %d texts" % (len(doc), len(doc.token_starts)))
+
+
+if __name__ == '__main__':
+    main()
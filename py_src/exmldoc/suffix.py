@@ -0,0 +1,321 @@
+"""
+A suffix array over the token ids of a corpus, for counting and
+locating phrases (n-grams) and for listing their most frequent
+continuations.
+
+The index directory contains, for one terminal attribute,
+
+  ``<attr>.lexicon``  the token values, separated by NUL bytes,
+                      in the order of their ids
+  ``<attr>.seq``      the token id of each corpus position
+  ``<attr>.sa``       the suffix array (corpus positions, sorted
+                      by the token ids of the suffix starting there)
+  ``<attr>.lcp``      the length of the longest common prefix of each
+                      suffix in the array with the preceding one
+
+together with ``offsets.txt``. Integers are stored as 32-bit
+big-endian numbers, as in :py:mod:`exmldoc.cwb`, and memory-mapped
+when the index is opened.
+"""
+from __future__ import print_function
+
+import os
+import os.path
+import struct
+import sys
+from array import array
+from collections import defaultdict
+
+from .alphabet import PythonAlphabet
+from .cwb import write_ints, to_bytes
+from .tokindex import map_file
+
+if sys.version_info.major >= 3:
+    xrange = range
+    unicode = str
+
+
+def suffix_array(seq):
+    """
+    computes the suffix array of a sequence of non-negative ints
+    by prefix doubling (Larsson and Sadakane): each round sorts
+    only the groups of suffixes whose prefixes are still equal,
+    by the group of the suffix k positions further on, so the
+    suffixes that are already in place drop out of the work.
+    Besides the result, one rank array and the list of open
+    groups are kept in memory.
+    """
+    n = len(seq)
+    if n == 0:
+        return array('i')
+    # the first round is a counting sort on the first symbol
+    n_symbols = max(seq) + 1
+    counts = array('i', [0]) * n_symbols
+    for c in seq:
+        counts[c] += 1
+    bucket_start = array('i', [0]) * n_symbols
+    groups = []
+    lo = 0
+    for c in xrange(n_symbols):
+        bucket_start[c] = lo
+        if counts[c] > 1:
+            groups.append((lo, lo + counts[c]))
+        lo += counts[c]
+    # rank[i] is the first position in sa of the group of suffix i
+    rank = array('i', map(bucket_start.__getitem__, seq))
+    sa = array('i', [0]) * n
+    fill = bucket_start
+    for i in xrange(n):
+        c = seq[i]
+        sa[fill[c]] = i
+        fill[c] += 1
+    k = 1
+    while groups:
+        open_groups = []
+        for lo, hi in groups:
+            if hi - lo == 2:
+                # most groups are pairs, compared without sorting
+                a = sa[lo]
+                b = sa[lo + 1]
+                key_a = rank[a + k] if a + k < n else -1
+                key_b = rank[b + k] if b + k < n else -1
+                if key_a == key_b:
+                    open_groups.append((lo, hi))
+                else:
+                    if key_a > key_b:
+                        sa[lo] = b
+                        sa[lo + 1] = a
+                    rank[sa[lo + 1]] = lo + 1
+                continue
+            # suffixes that end before i+k come first
+            keyed = sorted([(rank[i + k] if i + k < n else -1, i)
+                            for i in sa[lo:hi]])
+            start = lo
+            last = keyed[0][0]
+            for j, (key, i) in enumerate(keyed, lo):
+                sa[j] = i
+                if key != last:
+                    if j - start > 1:
+                        open_groups.append((start, j))
+                    start = j
+                    last = key
+                # refined ranks can be used at once, as the
+                # order of the groups stays the same
+                rank[i] = start
+            if hi - start > 1:
+                open_groups.append((start, hi))
+        groups = open_groups
+        k *= 2
+    return sa
+
+
+def lcp_array(seq, sa):
+    """
+    computes the LCP array with Kasai's algorithm; lcp[i] is the
+    common prefix length of the suffixes at sa[i-1] and sa[i]
+    """
+    n = len(seq)
+    rank = array('i', [0] * n)
+    for i in xrange(n):
+        rank[sa[i]] = i
+    lcp = array('i', [0] * n)
+    h = 0
+    for i in xrange(n):
+        r = rank[i]
+        if r > 0:
+            j = sa[r - 1]
+            while i + h < n and j + h < n and seq[i + h] == seq[j + h]:
+                h += 1
+            lcp[r] = h
+            if h > 0:
+                h -= 1
+        else:
+            h = 0
+    return lcp
+
+
+class SuffixIndexBuilder(object):
+
+    """
+    collects the token ids of one terminal attribute from
+    corpus readers and writes the suffix array index when closed
+    """
+
+    def __init__(self, index_dir, attr='form', encoding='UTF-8'):
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        self.index_dir = index_dir
+        self.attr = attr
+        self.encoding = encoding
+        self.alphabet = PythonAlphabet()
+        self.seq = array('i')
+        self.files = []
+        self.prop = None
+
+    def add_document(self, fname, reader):
+        """
+        reads all tokens of a document from an XMLCorpusReader
+        or JSONCorpusReader
+        """
+        self.files.append((fname, len(self.seq)))
+        doc = reader.doc
+        if self.prop is None:
+            try:
+                self.prop = doc.t_schema.attribute_by_name(self.attr).prop_name
+            except KeyError:
+                self.prop = self.attr
+        last_stop = len(doc.words)
+        while True:
+            try:
+                new_stop = reader.addNext()
+            except StopIteration:
+                new_stop = len(doc.words)
+                at_end = True
+            else:
+                at_end = False
+            self.add_tokens(doc.w_objs[last_stop:new_stop])
+            doc.clear_markables(last_stop, new_stop)
+            last_stop = new_stop
+            if at_end:
+                break
+
+    def add_tokens(self, w_objs):
+        alphabet = self.alphabet
+        encoding = self.encoding
+        prop = self.prop
+        self.seq.extend([alphabet[to_bytes(getattr(n, prop, None), encoding)]
+                         for n in w_objs])
+
+    def close(self):
+        prefix = os.path.join(self.index_dir, self.attr)
+        with open(prefix + '.lexicon', 'wb') as f_out:
+            for val in self.alphabet.words:
+                f_out.write(val + b'\0')
+        with open(prefix + '.seq', 'wb') as f_out:
+            write_ints(f_out, self.seq)
+        sa = suffix_array(self.seq)
+        with open(prefix + '.sa', 'wb') as f_out:
+            write_ints(f_out, sa)
+        lcp = lcp_array(self.seq, sa)
+        sa = None
+        with open(prefix + '.lcp', 'wb') as f_out:
+            write_ints(f_out, lcp)
+        with open(os.path.join(self.index_dir, 'offsets.txt'), 'w') as f_out:
+            for fname, posn in self.files:
+                print("%s\t%d" % (fname, posn), file=f_out)
+
+
+class SuffixIndex(object):
+
+    """
+    read-only access to an index created by :py:class:`SuffixIndexBuilder`.
+    Phrases are sequences of token values (bytes or unicode strings).
+    """
+
+    def __init__(self, index_dir, attr='form', encoding='UTF-8'):
+        prefix = os.path.join(index_dir, attr)
+        self.encoding = encoding
+        self.alphabet = PythonAlphabet()
+        with open(prefix + '.lexicon', 'rb') as f_lex:
+            for val in f_lex.read().split(b'\0')[:-1]:
+                self.alphabet[val]
+        self.seq = map_file(prefix + '.seq')
+        self.sa = map_file(prefix + '.sa')
+        self.lcp = map_file(prefix + '.lcp')
+        self.n = len(self.seq) // 4
+
+    def __len__(self):
+        return self.n
+
+    def phrase_ids(self, phrase):
+        """returns the token ids of a phrase, or None for unknown tokens"""
+        obj2int = self.alphabet.obj2int
+        result = []
+        for val in phrase:
+            if isinstance(val, unicode):
+                val = val.encode(self.encoding)
+            try:
+                result.append(obj2int[val])
+            except KeyError:
+                return None
+        return tuple(result)
+
+    def suffix_prefix(self, posn, m):
+        m = min(m, self.n - posn)
+        return struct.unpack_from('>%di' % (m,), self.seq, 4 * posn)
+
+    def suffix_at(self, i):
+        return struct.unpack_from('>i', self.sa, 4 * i)[0]
+
+    def find_range(self, ids):
+        """
+        returns the range [lo, hi) of the suffix array whose
+        suffixes start with ids, in O(m log n) time
+        """
+        m = len(ids)
+        lo = 0
+        hi = self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.suffix_prefix(self.suffix_at(mid), m) < ids:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        hi = self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.suffix_prefix(self.suffix_at(mid), m) <= ids:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+
+    def count(self, phrase):
+        """returns the number of occurrences of a phrase"""
+        ids = self.phrase_ids(phrase)
+        if not ids:
+            return 0
+        lo, hi = self.find_range(ids)
+        return hi - lo
+
+    def locations(self, phrase):
+        """returns the sorted start positions of a phrase"""
+        ids = self.phrase_ids(phrase)
+        if not ids:
+            return array('i')
+        lo, hi = self.find_range(ids)
+        result = array('i', struct.unpack_from('>%di' % (hi - lo,),
+                                               self.sa, 4 * lo))
+        return array('i', sorted(result))
+
+    def continuations(self, phrase, k=10):
+        """
+        returns the k most frequent tokens following a phrase, as
+        (value, count) pairs. Suffixes that share the continuation
+        are adjacent in the array and linked by LCP values > m,
+        so only the first suffix of each group needs to be read.
+        """
+        ids = self.phrase_ids(phrase)
+        if not ids:
+            return []
+        m = len(ids)
+        lo, hi = self.find_range(ids)
+        if hi == lo:
+            return []
+        lcps = struct.unpack_from('>%di' % (hi - lo,), self.lcp, 4 * lo)
+        counts = defaultdict(int)
+        group_start = None
+        for i in xrange(lo, hi):
+            if group_start is None or lcps[i - lo] <= m:
+                posn = self.suffix_at(i)
+                if posn + m >= self.n:
+                    # the phrase ends the corpus
+                    group_start = None
+                    continue
+                group_start = struct.unpack_from(
+                    '>i', self.seq, 4 * (posn + m))[0]
+            counts[group_start] += 1
+        words = self.alphabet.words
+        result = sorted(counts.items(), key=lambda x: (-x[1], x[0]))[:k]
+        return [(words[wid], cnt) for (wid, cnt) in result]
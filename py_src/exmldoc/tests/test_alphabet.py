@@ -15,4 +15,13 @@ class TestAlphabet(unittest.TestCase):
         self.assertEqual(idx3 + 1, len(alph),
                          'length should be last index plus one')
         self.assertEqual(list(alph), [1, 'a', (1, 2)],
-                         'iteration should return objects in the correct order')
\ No newline at end of file
+                         'iteration should return objects in the correct order')
+
+    def test_add_new(self):
+        alph = PythonAlphabet()
+        alph['a']
+        self.assertTrue(alph.add_new(['b', 'c']))
+        self.assertEqual(alph['c'], 2)
+        self.assertFalse(alph.add_new(['d', 'a']))
+        self.assertFalse(alph.add_new(['d', 'd']))
+        self.assertEqual(list(alph), ['a', 'b', 'c'])
@@ -0,0 +1,85 @@
+import unittest
+from exmldoc.alphabet import PythonAlphabet
+from exmldoc.tests.test_tree import load_tree_doc
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestArrays(unittest.TestCase):
+    def test_terminals(self):
+        doc = load_tree_doc()
+        pos = doc.terminal_array('pos')
+        self.assertEqual(pos.dtype, numpy.int32)
+        words = doc.t_schema.attribute_by_name('pos').alphabet.words
+        self.assertEqual([words[k] for k in pos],
+                         ['ART', 'NN', 'VVFIN', 'ART', 'NN', '$.',
+                          'ART', 'NN', '$.'])
+        vocab = PythonAlphabet()
+        self.assertEqual(list(doc.terminal_array('lemma', vocab, 6, 9)),
+                         [0, 1, 2])
+        self.assertEqual(list(doc.terminal_array('lemma', vocab, 0, 4)),
+                         [3, 4, 5, 0])
+        self.assertRaises(ValueError, doc.terminal_array, 'lemma')
+
+    def test_unknown_value(self):
+        doc = load_tree_doc()
+        att = doc.t_schema.attribute_by_name('pos')
+        alphabet = att.alphabet
+        n_values = len(alphabet.words)
+        setattr(doc.w_objs[0], att.prop_name, 'XY')
+        self.assertEqual(doc.terminal_array('pos', end=1)[0], -1)
+        self.assertEqual(len(alphabet.words), n_values)
+
+    def test_markables(self):
+        doc = load_tree_doc()
+        nodes = doc.markable_array('node', 'cat', start=6)
+        cats = doc.schema_by_name('node').attribute_by_name('cat').alphabet
+        self.assertEqual(nodes.tolist(), [[0, 2, cats['NX']]])
+        self.assertEqual(doc.markable_array('sentence').tolist(),
+                         [[0, 6, -1], [6, 9, -1]])
+        self.assertEqual(doc.sentence_offsets().tolist(), [0, 6, 9])
+
+    def test_heads(self):
+        doc = load_tree_doc()
+        self.assertEqual(doc.dependency_heads().tolist(),
+                         [1, 2, -1, 4, 2, -1, 7, -1, -1])
+        self.assertEqual(doc.dependency_heads(1, 5).tolist(),
+                         [1, -1, 3, 1])
+
+
+class TestWriteBack(unittest.TestCase):
+    def test_terminal_column(self):
+        doc = load_tree_doc()
+        doc.set_terminal_column('lemma', ['d', 'K', '.'], start=6)
+        self.assertEqual([n.lemma for n in doc.w_objs[5:9]],
+                         ['.', 'd', 'K', '.'])
+        vocab = PythonAlphabet()
+        vocab['X']
+        doc.set_terminal_column('form', [0, 0], start=7, vocab=vocab)
+        self.assertEqual(doc.words[6:9], ['Die', 'X', 'X'])
+        self.assertEqual(doc.w_objs[8].word, 'X')
+        self.assertRaises(IndexError, doc.set_terminal_column,
+                          'lemma', ['a', 'b'], 8)
+
+    def test_replace_level(self):
+        doc = load_tree_doc()
+        doc.replace_level('ne', [0, 3], [2, 5], {'type': ['ANIM', 'ANIM']})
+        vocab = PythonAlphabet()
+        vocab['ORG']
+        new_objs = doc.replace_level('ne', [6], [8], {'type': [0]},
+                                     start=6, vocabs={'type': vocab})
+        self.assertEqual(new_objs[0].kind, 'ORG')
+        nes = doc.get_objects_by_level('ne')
+        self.assertEqual([(ne.span, ne.kind) for ne in nes],
+                         [([0, 2], 'ANIM'), ([3, 5], 'ANIM'),
+                          ([6, 8], 'ORG')])
+        doc.replace_level('ne', [1], [2], {'type': ['PER']}, end=6)
+        nes = doc.get_objects_by_level('ne')
+        self.assertEqual([(ne.span, ne.kind) for ne in nes],
+                         [([1, 2], 'PER'), ([6, 8], 'ORG')])
+        self.assertRaises(ValueError, doc.replace_level, 'ne', [7], [8],
+                          end=6)
@@ -0,0 +1,15 @@
+import unittest
+from exmldoc.binary import objects_to_packed
+from exmldoc.tests.test_tree import load_tree_doc
+
+
+class TestBinary(unittest.TestCase):
+    def test_packed_spans(self):
+        doc = load_tree_doc()
+        schema = doc.schema_by_name('sentence')
+        sents = doc.get_objects_by_level('sentence')
+        self.assertEqual([s.span for s in sents], [[0, 6], [6, 9]])
+        n, names, data = objects_to_packed(doc, sents, schema, True)
+        self.assertEqual(n, 2)
+        # gaps before each object, then the lengths of all objects
+        self.assertEqual(data[names.index(':span')], [0, 0, 6, 3])
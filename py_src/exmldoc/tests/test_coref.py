@@ -0,0 +1,45 @@
+import unittest
+from exmldoc.tests.test_edges import load_edge_doc
+
+
+class TestChainIndex(unittest.TestCase):
+    def check_chains(self, doc):
+        np1, np2, np3 = [doc.object_by_id[k]
+                         for k in ('s1_500', 's1_502', 's2_500')]
+        chains = doc.coref_chains()
+        self.assertEqual(chains.chain(np3), [np2, np3])
+        self.assertIs(chains.representative(np3), np2)
+        self.assertTrue(chains.same_chain(np2, np3))
+        self.assertFalse(chains.same_chain(np1, np3))
+        self.assertEqual(chains.chain(np1), [np1])
+        self.assertEqual(chains.chains_in_range(7, 9), [[np2, np3]])
+        self.assertEqual(chains.chains_in_range(0, 3), [])
+        relation = doc.schema_by_name('node').edge_by_name('relation')
+        relation.set_edges(np1, [['coreferential', 's1_502']], doc)
+        self.assertIs(doc.coref_chains(), chains)
+        self.assertEqual(chains.chain(np3), [np1, np2, np3])
+        self.assertIs(chains.representative(np2), np1)
+        self.assertEqual(chains.chains_in_range(0, 1), [[np1, np2, np3]])
+        relation.set_edges(np3, [['expletive', None]], doc)
+        self.assertEqual(chains.chain(np1), [np1, np2])
+        self.assertEqual(chains.chain(np3), [np3])
+        self.assertEqual(len(doc.coref_chains(['coreferential']).chains()), 1)
+
+    def test_chains(self):
+        self.check_chains(load_edge_doc())
+
+    def test_chains_edge_store(self):
+        self.check_chains(load_edge_doc(edge_store=True))
+
+    def test_late_mention(self):
+        doc = load_edge_doc()
+        np2 = doc.object_by_id.pop('s1_502')
+        np3 = doc.object_by_id['s2_500']
+        chains = doc.coref_chains()
+        self.assertEqual(chains.chain(np3), [np3])
+        self.assertEqual(chains.chains_in_range(3, 5), [])
+        # the antecedent appears, e.g. when a later text is merged
+        doc.object_by_id['s1_502'] = np2
+        self.assertEqual(chains.chains_in_range(3, 5), [[np2, np3]])
+        self.assertEqual(chains.chain(np3), [np2, np3])
+        self.assertIs(chains.representative(np3), np2)
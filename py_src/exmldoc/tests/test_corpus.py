@@ -0,0 +1,123 @@
+import io
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+from exmldoc.corpus import Corpus, OutputCache
+from exmldoc import exml2cqp
+from exmldoc.exml2conll import ExportToCoNLL, process_directory
+from exmldoc.tests.test_textindex import head, text1, text2, tail
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.write('b', head + text1 + tail)
+        self.write('a', head + text2 + text1 + tail)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        fname = os.path.join(self.tmpdir, name + '.exml.xml')
+        with open(fname, 'wb') as f_out:
+            f_out.write(data)
+
+    def read_offsets(self):
+        with open(os.path.join(self.tmpdir, 'offsets.txt')) as f:
+            return f.read().split()
+
+    def test_offsets(self):
+        corpus = Corpus(self.tmpdir, cache_size=1)
+        self.assertEqual(corpus.names, ['a', 'b'])
+        names = [name for (name, doc, reader) in corpus.readers()]
+        self.assertEqual(names, ['a', 'b'])
+        self.assertEqual(self.read_offsets(), ['a', '0', 'b', '18'])
+        self.assertEqual(len(corpus), 27)
+        doc, posn = corpus.locate(19)
+        self.assertEqual(doc.words[posn], b'Hund')
+        doc, posn = corpus.locate(1)
+        self.assertEqual(doc.words[posn], b'Vogel')
+        corpus.locate(2)
+        info = corpus.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions),
+                         (1, 2, 1))
+        self.assertRaises(IndexError, corpus.locate, 27)
+
+    def test_update(self):
+        Corpus(self.tmpdir).save_offsets()
+        self.assertEqual(self.read_offsets(), ['a', '0', 'b', '18'])
+        os.utime(os.path.join(self.tmpdir, 'offsets.txt'), (1, 1))
+        self.write('a', head + text2 + tail)
+        self.write('0', head + text1 + tail)
+        corpus = Corpus(self.tmpdir)
+        self.assertEqual(corpus.names, ['a', 'b', '0'])
+        self.assertEqual(corpus.counts, [None, None, None])
+        self.assertEqual(corpus.get_starts(), [0, 9, 18])
+        corpus.save_offsets()
+        self.assertEqual(self.read_offsets(), ['a', '0', 'b', '9', '0', '18'])
+        os.remove(os.path.join(self.tmpdir, 'b.exml.xml'))
+        corpus = Corpus(self.tmpdir)
+        self.assertEqual(corpus.counts, [9, None])
+        self.assertEqual(len(corpus), 18)
+
+    def test_cqp_names(self):
+        names = [name for (name, doc, reader)
+                 in exml2cqp.process_directory(self.tmpdir)]
+        self.assertEqual(names, ['a.exml.xml', 'b.exml.xml'])
+        self.assertEqual(self.read_offsets(),
+                         ['a.exml.xml', '0', 'b.exml.xml', '18'])
+        with open(os.path.join(self.tmpdir, 'offsets.txt'), 'w') as f:
+            f.write('b\t0\na.exml.xml\t9\n')
+        names = [name for (name, doc, reader)
+                 in exml2cqp.process_directory(self.tmpdir)]
+        self.assertEqual(names, ['b', 'a.exml.xml'])
+        self.assertEqual(self.read_offsets(),
+                         ['b', '0', 'a.exml.xml', '9'])
+
+    def test_manifest(self):
+        Corpus(self.tmpdir).save_manifest()
+        corpus = Corpus(self.tmpdir)
+        self.assertEqual(corpus.counts, [18, 9])
+        self.assertFalse(corpus.is_changed('a'))
+        # same contents, new mtime
+        self.write('b', head + text1 + tail)
+        os.utime(os.path.join(self.tmpdir, 'b.exml.xml'), (1, 1))
+        self.write('a', head + text2 + tail)
+        corpus = Corpus(self.tmpdir)
+        self.assertEqual(corpus.counts, [None, 9])
+        self.assertEqual(corpus.changed, set([0]))
+        self.assertEqual(corpus.get_starts(), [0, 9])
+
+    def test_incremental(self):
+        app = ExportToCoNLL()
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        f_out = io.StringIO()
+        self.assertEqual(process_directory(app, self.tmpdir, f_out,
+                                           cache_dir=cache_dir), 2)
+        expected = f_out.getvalue()
+        f_out = io.StringIO()
+        self.assertEqual(process_directory(app, self.tmpdir, f_out,
+                                           cache_dir=cache_dir), 0)
+        self.assertEqual(f_out.getvalue(), expected)
+        self.write('a', head + text2 + tail)
+        f_out = io.StringIO()
+        self.assertEqual(process_directory(app, self.tmpdir, f_out,
+                                           cache_dir=cache_dir), 1)
+        self.assertEqual(self.read_offsets(), ['a', '0', 'b', '9'])
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_output_cache(self):
+        corpus = Corpus(self.tmpdir)
+        cache = OutputCache(os.path.join(self.tmpdir, 'cache'))
+        self.assertIsNone(cache.get(corpus, 0))
+        # bytes, as the exporters write them with Python 2
+        cache.put(corpus, 0, u'K\xe4tzchen\n'.encode('UTF-8'), 1)
+        cache.put(corpus, 1, u'Hund\n', 1)
+        text, count = cache.get(corpus, 0)
+        self.assertIsInstance(text, str)
+        self.assertEqual(count, 1)
+        if not isinstance(text, bytes):
+            self.assertEqual(text, u'K\xe4tzchen\n')
+        self.assertEqual(cache.get(corpus, 1), ('Hund\n', 1))
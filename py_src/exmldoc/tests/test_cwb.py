@@ -0,0 +1,64 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+from mock import mock_open, patch
+import exmldoc
+from exmldoc import cwb
+from exmldoc.exml2cqp import ExportToCQP
+from exmldoc.tests.test_tree import tree_doc
+
+
+def read_file(fname):
+    with open(fname, 'rb') as f:
+        return f.read()
+
+
+def read_all_ints(fname):
+    with open(fname, 'rb') as f:
+        return list(cwb.read_ints(f, 1 << 20))
+
+
+class TestCWB(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_encode(self):
+        data_dir = os.path.join(self.tmpdir, 'data')
+        app = ExportToCQP()
+        encoder = cwb.CWBEncoder(data_dir, app.p_attribute_names(),
+                                 max_memory=4)
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        m = mock_open(read_data=tree_doc)
+        with patch('exmldoc.open', m):
+            reader = exmldoc.XMLCorpusReader(doc, 'fake_trees.exml.xml')
+            self.assertEqual(app.encode_cwb(reader, encoder), 9)
+        encoder.close()
+        encoder.write_registry(self.tmpdir, 'TEST')
+        prefix = os.path.join(data_dir, 'word')
+        lexicon = read_file(prefix + '.lexicon').split(b'\0')[:-1]
+        words = [lexicon[i] for i in read_all_ints(prefix + '.corpus')]
+        self.assertEqual(words, b'Der Hund sieht die Katze . Die Katze .'.split())
+        offsets = read_all_ints(prefix + '.lexicon.idx')
+        self.assertEqual(offsets[1], len(b'Der') + 1)
+        srt = [lexicon[i] for i in read_all_ints(prefix + '.lexicon.srt')]
+        self.assertEqual(srt, sorted(lexicon))
+        counts = read_all_ints(prefix + '.corpus.cnt')
+        self.assertEqual(counts[lexicon.index(b'Katze')], 2)
+        rdx = read_all_ints(prefix + '.corpus.rdx')
+        rev = read_all_ints(prefix + '.corpus.rev')
+        k = lexicon.index(b'.')
+        self.assertEqual(rev[rdx[k]:rdx[k] + counts[k]], [5, 8])
+        self.assertEqual(sorted(rev), list(range(9)))
+        self.assertEqual(read_all_ints(os.path.join(data_dir, 's.rng')),
+                         [0, 5, 6, 8])
+        avs = read_file(os.path.join(data_dir, 's_id.avs'))
+        avx = read_all_ints(os.path.join(data_dir, 's_id.avx'))
+        self.assertEqual([avs[avx[i]:].split(b'\0')[0] for i in (1, 3)],
+                         [b's1', b's2'])
+        registry = read_file(os.path.join(self.tmpdir, 'test')).decode('ascii')
+        self.assertTrue('ATTRIBUTE lemma' in registry)
+        self.assertTrue('STRUCTURE s_id' in registry)
@@ -0,0 +1,111 @@
+import io
+import unittest
+from mock import mock_open, patch
+import exmldoc
+from exmldoc.edges import EdgeStore
+from exmldoc.tests.test_tree import tree_doc
+
+edge_doc = tree_doc.replace(
+    b'<node xml:id="s1_501" cat="VXFIN" func="HD" parent="s1_503">',
+    b'<node xml:id="s1_501" cat="VXFIN" func="HD" parent="s1_503">\n'
+    b'<secEdge cat="refint" parent="s1_500"/>').replace(
+    b'<node xml:id="s2_500" cat="NX" func="--">',
+    b'<node xml:id="s2_500" cat="NX" func="--">\n'
+    b'<relation type="anaphoric" target="s1_502"/>')
+
+
+def load_edge_doc(**kw):
+    m = mock_open(read_data=edge_doc)
+    with patch('exmldoc.open', m):
+        doc = exmldoc.load('fake_edges.exml.xml', **kw)
+    return doc
+
+
+def inline_xml(doc):
+    f = io.StringIO()
+    doc.write_inline_xml(f, 0, len(doc.words))
+    return f.getvalue()
+
+
+class TestEdgeStore(unittest.TestCase):
+    def test_store(self):
+        store = EdgeStore()
+        store.add_edge('rel', 'a', 'b', 'x')
+        store.add_edge('rel', 'c', 'b', 'y')
+        store.add_edge('rel', 'a', None, 'z')
+        self.assertEqual(store.edges_from('rel', 'a'),
+                         [('b', 'x'), (None, 'z')])
+        self.assertEqual(store.edges_to('rel', 'b'), [('a', 'x'), ('c', 'y')])
+        store.set_edges('rel', 'a', [('c', 'w')])
+        self.assertEqual(store.edges_from('rel', 'a'), [('c', 'w')])
+        self.assertEqual(store.edges_to('rel', 'b'), [('c', 'y')])
+        self.assertEqual(store.edges_to('rel', 'c'), [('a', 'w')])
+        self.assertEqual(len(store.tables['rel']), 2)
+        self.assertEqual(store.edges_from('other', 'a'), [])
+
+    def test_updates(self):
+        store = EdgeStore()
+        for i in range(8):
+            store.add_edge('rel', 'n%d' % i, 'n%d' % (i + 1), 'x')
+        table = store.tables['rel']
+        self.assertEqual(store.edges_to('rel', 'n1'), [('n0', 'x')])
+        csr = table._out
+        store.set_edges('rel', 'n0', [('n2', 'y')])
+        store.add_edge('rel', 'n9', 'n2', 'z')
+        self.assertIs(table._out, csr)
+        self.assertEqual(store.edges_from('rel', 'n0'), [('n2', 'y')])
+        self.assertEqual(store.edges_to('rel', 'n1'), [])
+        self.assertEqual(store.edges_to('rel', 'n2'),
+                         [('n1', 'x'), ('n0', 'y'), ('n9', 'z')])
+        for i in range(1, 5):
+            store.set_edges('rel', 'n%d' % i, [])
+        self.assertEqual((len(table.src), len(table)), (5, 5))
+        self.assertEqual(store.edges_to('rel', 'n2'),
+                         [('n0', 'y'), ('n9', 'z')])
+        self.assertEqual(store.edges_from('rel', 'n5'), [('n6', 'x')])
+
+    def test_document(self):
+        doc = load_edge_doc(edge_store=True)
+        plain_doc = load_edge_doc()
+        self.assertEqual(inline_xml(doc), inline_xml(plain_doc))
+        np1, vxfin, np2 = [doc.object_by_id[k]
+                           for k in ('s1_500', 's1_501', 's1_502')]
+        self.assertFalse(hasattr(vxfin, 'secedge'))
+        self.assertEqual(doc.incoming_edges(np1, 'secEdge'),
+                         [(vxfin, 'refint')])
+        self.assertEqual(doc.incoming_edges(np2, 'anaphora_info'),
+                         [(doc.object_by_id['s2_500'], 'anaphoric')])
+        self.assertEqual(exmldoc.get_anaphora_info(
+            doc.object_by_id['s2_500'], doc), ['anaphoric', ['s1_502']])
+
+    def test_unary(self):
+        # two nodes over the same tokens are ordered by get_updown
+        data = edge_doc.replace(
+            b'<node xml:id="s1_502" cat="NX" func="OA" parent="s1_503">',
+            b'<node xml:id="s1_504" cat="NX" func="OA" parent="s1_503">\n'
+            b'<node xml:id="s1_502" cat="NX" func="HD" parent="s1_504">'
+        ).replace(b'deprel="OBJA"/>\n</node>',
+                  b'deprel="OBJA"/>\n</node>\n</node>')
+        m = mock_open(read_data=data)
+        with patch('exmldoc.open', m):
+            doc = exmldoc.load('fake_unary.exml.xml')
+        result = inline_xml(doc)
+        self.assertTrue(result.index('"s1_504"') < result.index('"s1_502"'))
+
+    def test_migrate(self):
+        doc = load_edge_doc()
+        expected = inline_xml(doc)
+        doc.use_edge_store()
+        self.assertFalse(hasattr(doc.object_by_id['s2_500'], 'anaphora_info'))
+        self.assertEqual(inline_xml(doc), expected)
+
+    def test_duplicate_relation(self):
+        data = edge_doc.replace(
+            b'<relation type="anaphoric" target="s1_502"/>',
+            b'<relation type="anaphoric" target="s1_502"/>\n'
+            b'<relation type="coreferential" target="s1_500"/>')
+        for kw in ({}, {'edge_store': True}):
+            m = mock_open(read_data=data)
+            with patch('exmldoc.open', m):
+                self.assertRaises(ValueError, exmldoc.load,
+                                  'fake_duplicate.exml.xml', **kw)
@@ -1,4 +1,5 @@
 # coding=utf-8
+import io
 import unittest
 from mock import mock_open, patch
 import exmldoc
@@ -121,3 +122,15 @@ class TestEXML(unittest.TestCase):
             [term.word for term in doc.w_objs],
             sample_text_ascii.split(),
             'ascii mode should produce ascii term.words')
+
+    @unittest.skipIf(str is bytes, 'Python 2 writes attributes as bytes')
+    def test_open_tag(self):
+        items = [('form', u'Müller & <Söhne>'), ('lemma', None)]
+        f = io.StringIO()
+        exmldoc.open_tag(f, 'word', items, 2)
+        self.assertEqual(f.getvalue(),
+                         u'  <word form="M&#252;ller &amp; &lt;S&#246;hne&gt;"')
+        f = io.StringIO()
+        exmldoc.open_tag(f, 'word', items, 0, 'utf-8')
+        self.assertEqual(f.getvalue(),
+                         u'<word form="Müller &amp; &lt;Söhne&gt;"')
@@ -0,0 +1,36 @@
+import io
+import unittest
+from mock import mock_open, patch
+import exmldoc
+from exmldoc.exml2conll import ExportToCoNLL
+from exmldoc.tests.test_tree import tree_doc
+
+
+class TestExportToCoNLL(unittest.TestCase):
+    def test_conllu(self):
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        f_out = io.StringIO()
+        m = mock_open(read_data=tree_doc)
+        with patch('exmldoc.open', m):
+            reader = exmldoc.XMLCorpusReader(doc, 'fake_trees.exml.xml')
+            count = ExportToCoNLL().write_conll(reader, f_out, 'trees')
+        self.assertEqual(count, 9)
+        lines = f_out.getvalue().splitlines()
+        self.assertEqual(lines[:3], ['# newdoc id = trees',
+                                     '# sent_id = s1',
+                                     '# text = Der Hund sieht die Katze .'])
+        self.assertEqual([line.split('\t')[6] for line in lines[3:9]],
+                         ['2', '3', '0', '5', '3', '0'])
+        self.assertEqual(lines[5].split('\t')[7], 'root')
+        self.assertEqual(lines[10:12], ['# sent_id = s2',
+                                        '# text = Die Katze .'])
+
+    def test_conll(self):
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        f_out = io.StringIO()
+        m = mock_open(read_data=tree_doc)
+        with patch('exmldoc.open', m):
+            reader = exmldoc.XMLCorpusReader(doc, 'fake_trees.exml.xml')
+            ExportToCoNLL('conll').write_conll(reader, f_out, 'trees')
+        cols = f_out.getvalue().splitlines()[2].split('\t')
+        self.assertEqual(cols[3:8], ['VVFIN', 'VVFIN', '_', '0', 'ROOT'])
@@ -0,0 +1,42 @@
+import io
+import unittest
+from mock import mock_open, patch
+import exmldoc
+from exmldoc.exml2cqp import ExportToCQP
+from exmldoc.tests.test_tree import tree_doc
+
+
+class TestExportToCQP(unittest.TestCase):
+    def write_cqp(self, opts, app=None):
+        if app is None:
+            app = ExportToCQP(opts)
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        f_out = io.StringIO()
+        m = mock_open(read_data=tree_doc)
+        with patch('exmldoc.open', m):
+            reader = exmldoc.XMLCorpusReader(doc, 'fake_trees.exml.xml')
+            count = app.write_cqp(reader, f_out)
+        self.assertEqual(count, 9)
+        return f_out.getvalue().splitlines()
+
+    def test_default_columns(self):
+        lines = self.write_cqp([])
+        self.assertEqual(lines[0], '<s id="s1">')
+        self.assertEqual(lines[1], 'Der\tART\tder\t_')
+        self.assertEqual(lines[-1], '</s>')
+        self.assertEqual(len(lines), 13)
+
+    def test_want_deprels(self):
+        app = ExportToCQP()
+        app.want_deprels = True
+        self.assertEqual(app.p_attribute_names(),
+                         ['word', 'pos', 'lemma', 'morph', 'deprel', 'attach'])
+        lines = self.write_cqp([], app)
+        self.assertEqual(lines[1], 'Der\tART\tder\t_\tDET\t+1')
+
+    def test_p_atts(self):
+        lines = self.write_cqp([('-P', 'lemma'), ('-P', 'attach'),
+                                ('-S', 'text')])
+        self.assertEqual(lines[0], '<text id="t1" origin="test">')
+        self.assertEqual(lines[2:4], ['Der\tder\t+1', 'Hund\tHund\t+1'])
+        self.assertEqual(lines[4], 'sieht\tsehen\tROOT')
@@ -0,0 +1,87 @@
+import gc
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+import exmldoc
+from exmldoc.loadcache import LoadCache, SUFFIX
+from exmldoc.tests.test_edges import inline_xml
+from exmldoc.tests.test_textindex import two_texts, text1, head, tail
+
+
+class TestLoadCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.fname = os.path.join(self.tmpdir, 'doc.exml.xml')
+        with open(self.fname, 'wb') as f_out:
+            f_out.write(two_texts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def entries(self):
+        return [fname for fname in os.listdir(self.cache_dir)
+                if fname.endswith(SUFFIX)]
+
+    def test_roundtrip(self):
+        cache = LoadCache(self.cache_dir)
+        expected = exmldoc.load(self.fname)
+        for i in range(2):
+            doc = exmldoc.load(self.fname, cache=cache)
+            self.assertEqual(doc.words, expected.words)
+            self.assertEqual(inline_xml(doc), inline_xml(expected))
+            self.assertIs(doc.object_by_id['s1_2'].parent,
+                          doc.object_by_id['s1_500'])
+            self.assertEqual(doc.word_ids['s2_1'], 6)
+            # no attributes appear that the parsed objects lack
+            self.assertEqual([sorted(vars(n)) for n in doc.w_objs],
+                             [sorted(vars(n)) for n in expected.w_objs])
+            self.assertTrue(gc.isenabled())
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(self.entries()), 1)
+        # the storage options do not change what is cached
+        doc = exmldoc.load(self.fname, cache=cache, edge_store=True)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertIsNotNone(doc.edge_store)
+        self.assertEqual(inline_xml(doc), inline_xml(expected))
+
+    def test_changed(self):
+        cache = LoadCache(self.cache_dir)
+        exmldoc.load(self.fname, cache=cache)
+        with open(self.fname, 'wb') as f_out:
+            f_out.write(head + text1 + tail.lstrip(b'\n'))
+        os.utime(self.fname, (0, 0))
+        doc = exmldoc.load(self.fname, cache=cache)
+        self.assertEqual(len(doc.words), 9)
+        self.assertEqual(cache.misses, 2)
+
+    def test_evict(self):
+        exmldoc.load(self.fname, cache=self.cache_dir)
+        old_entry = os.path.join(self.cache_dir, self.entries()[0])
+        size = os.path.getsize(old_entry)
+        os.utime(old_entry, (0, 0))
+        cache = LoadCache(self.cache_dir, max_bytes=size)
+        os.utime(self.fname, (0, 0))
+        exmldoc.load(self.fname, cache=cache)
+        self.assertEqual(len(self.entries()), 1)
+        self.assertFalse(os.path.exists(old_entry))
+        self.assertEqual(cache.misses, 1)
+
+    def test_damaged(self):
+        cache = LoadCache(self.cache_dir)
+        expected = exmldoc.load(self.fname)
+        exmldoc.load(self.fname, cache=cache)
+        entry = os.path.join(self.cache_dir, self.entries()[0])
+        with open(entry, 'rb') as f_in:
+            data = f_in.read()
+        for damaged in (data[:len(data) // 2], data[:40] + b'\xc1' * 40):
+            with open(entry, 'wb') as f_out:
+                f_out.write(damaged)
+            doc = exmldoc.load(self.fname, cache=cache)
+            self.assertEqual(inline_xml(doc), inline_xml(expected))
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        # the damaged entry was replaced by a good one
+        exmldoc.load(self.fname, cache=cache)
+        self.assertEqual(cache.hits, 1)
@@ -0,0 +1,49 @@
+# coding=utf-8
+import io
+import unittest
+import exmldoc
+from exmldoc.tests.test_edges import edge_doc, inline_xml
+
+
+def read_doc(data, parser):
+    doc = exmldoc.create_doc()
+    reader = exmldoc.XMLCorpusReader(doc, io.BytesIO(data), None,
+                                     parser=parser)
+    while True:
+        try:
+            reader.addNext()
+        except StopIteration:
+            break
+    exmldoc.postprocess_doc(doc)
+    return doc
+
+
+def write_doc(data, encoding):
+    doc = exmldoc.create_doc()
+    f_out = io.StringIO()
+    exmldoc.write_corpus_xml(doc, exmldoc.XMLCorpusReader(
+        doc, io.BytesIO(data), None), f_out, encoding)
+    return f_out.getvalue().encode(encoding)
+
+
+class TestParsers(unittest.TestCase):
+    def test_backends(self):
+        expected = inline_xml(read_doc(edge_doc, 'etree'))
+        canonical = write_doc(edge_doc, 'UTF-8')
+        self.assertEqual(inline_xml(read_doc(edge_doc, 'expat')), expected)
+        self.assertEqual(inline_xml(read_doc(canonical, 'expat')), expected)
+        self.assertRaises(ValueError, read_doc, edge_doc, 'sax')
+
+    def test_encoding(self):
+        data = edge_doc.replace(b'form="Hund"',
+                                u'form="Hündin &amp; €"'.encode('UTF-8'))
+        expected = inline_xml(read_doc(data, 'etree'))
+        latin = data.decode('UTF-8').replace(
+            'encoding="utf-8"', 'encoding="ISO-8859-15"').encode('ISO-8859-15')
+        # non-ASCII characters as character references
+        canonical = write_doc(data, 'ISO-8859-15')
+        doc = read_doc(canonical, 'expat')
+        self.assertEqual(doc.words[1], u'Hündin & €')
+        doc = read_doc(latin, 'expat')
+        self.assertEqual(doc.words[1], u'Hündin & €')
+        self.assertEqual(inline_xml(doc), expected)
@@ -0,0 +1,74 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+import exmldoc
+from exmldoc import query
+from exmldoc.tests.test_textindex import two_texts
+from exmldoc.tests.test_tree import load_tree_doc
+
+
+class TestQuery(unittest.TestCase):
+    def test_parse(self):
+        q = query.parse_query(
+            '#np:[cat="NX" & func!=/O./] & #np >HD #w & #w:[T]')
+        self.assertEqual(list(q.variables), ['#np', '#w'])
+        self.assertEqual(q.relations, [('>', 'HD', '#np', '#w')])
+        self.assertTrue(q.variables['#w'].terminal)
+        self.assertRaises(query.QuerySyntaxError,
+                          query.parse_query, '[cat="NX"')
+
+    def test_search(self):
+        doc = load_tree_doc()
+        hits = list(query.search(
+            doc, '#np:[cat="NX"] > #w & #w:[pos="ART"]'))
+        self.assertEqual([b['#w'].word for t, b in hits], ['Der', 'die', 'Die'])
+        hits = list(query.search(
+            doc, '[cat="SIMPX"] >* #w & #w:[lemma="Katze"] & [pos="ART"] . #w'))
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0][1]['#w'].xml_id, 's1_5')
+        hits = list(query.search(doc, '[func="ON"] $ [func="OA"]'))
+        self.assertEqual(len(hits), 1)
+        # the whole alternation is anchored
+        hits = list(query.search(doc, '#w:[pos=/NN|VV/]'))
+        self.assertEqual([b['#w'].word for t, b in hits],
+                         ['Hund', 'Katze', 'Katze'])
+
+    def test_index(self):
+        doc = load_tree_doc()
+        index = query.TreebankIndex.build(doc)
+        self.assertEqual(index.candidate_sentences('[lemma="Hund"]'), [0])
+        self.assertEqual(index.candidate_sentences('[cat="NX"]'), [0, 1])
+        self.assertEqual(index.candidate_sentences(
+            '[cat="SIMPX"] & [lemma="Hund"]'), [0])
+        self.assertEqual(
+            index.candidate_sentences('[cat="NX"] & [pos="VVFIN"]'), [0])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'trees.idx')
+            index.save(fname)
+            index2 = query.TreebankIndex.load(fname)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(list(index2.lookup('cat', 'NX')), [0, 3, 6])
+        hits = list(query.search(doc, '[cat="NX"] >HD [lemma="Katze"]',
+                                 index2))
+        self.assertEqual([t.xml_id for t, b in hits], ['s1', 's2'])
+
+    def test_lazy(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'two.exml.xml')
+            with open(fname, 'wb') as f_out:
+                f_out.write(two_texts)
+            index = query.TreebankIndex.build(exmldoc.load(fname))
+            doc = exmldoc.open_lazy(fname, cache_size=4)
+            hits = list(query.search(doc, '[cat="NX"] > [lemma="Vogel"]',
+                                     index))
+            self.assertEqual([t.terminals[1].xml_id for t, b in hits],
+                             ['s3_2'])
+            self.assertEqual(doc.cache_info().misses, 1)
+            hits = list(query.search(doc, '[lemma="Katze"]'))
+            self.assertEqual(len(hits), 4)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,120 @@
+import gc
+import io
+import unittest
+import weakref
+import exmldoc
+from exmldoc.spill import replace_values
+from exmldoc.tree import Tree
+from exmldoc.tests.test_edges import inline_xml
+from exmldoc.tests.test_textindex import head, text1, text2, tail
+
+text3 = text1.replace(b's1_', b's5_').replace(b's2_', b's6_').replace(
+    b'"t1"', b'"t3"').replace(b'Hund', b'Fisch')
+# the second text refers back into the first
+three_texts = head + text1 + text2.replace(
+    b'<word xml:id="s3_6" form="."',
+    b'<word xml:id="s3_6" form="." dephead="s1_3"') + text3 + \
+    tail.lstrip(b'\n')
+
+
+def read_doc(max_tokens):
+    doc = exmldoc.create_doc()
+    spill = doc.enable_spill(max_tokens)
+    reader = exmldoc.XMLCorpusReader(doc, io.BytesIO(three_texts), None)
+    last_stop = 0
+    while True:
+        try:
+            reader.addNext()
+        except StopIteration:
+            break
+        spill.finish(last_stop, len(doc.words))
+        last_stop = len(doc.words)
+    exmldoc.postprocess_doc(doc)
+    return doc, spill
+
+
+class TestSpill(unittest.TestCase):
+    def test_spill(self):
+        doc, spill = read_doc(9)
+        stats = spill.stats()
+        self.assertEqual((stats.spills, stats.page_ins), (2, 0))
+        self.assertEqual((stats.resident_tokens, stats.spilled_tokens),
+                         (9, 18))
+        self.assertIsNone(list.__getitem__(doc.w_objs, 1))
+        self.assertEqual(doc.w_objs[1].word, 'Hund')
+        self.assertEqual(spill.stats().page_ins, 1)
+        self.assertEqual(doc.object_by_id['s3_500'].cat, 'NX')
+        self.assertTrue('s1_3' in doc.object_by_id)
+        self.assertEqual([w.word for w in doc.w_objs[7:11]],
+                         ['Katze', '.', 'Der', 'Vogel'])
+        # the accessed range stays in memory until the next eviction
+        self.assertEqual(len(doc.get_objects_by_level('sentence')), 6)
+        self.assertEqual(spill.stats().resident_tokens, 27)
+        spill.evict()
+        self.assertEqual(spill.stats().resident_tokens, 9)
+
+    def test_refs(self):
+        doc, spill = read_doc(9)
+        # the first text is read back while the second is read
+        w_obj = doc.w_objs[14]
+        self.assertIs(w_obj.syn_parent, doc.object_by_id['s1_3'])
+        self.assertEqual(spill.stats().page_ins, 2)
+        doc, spill = read_doc(9)
+        w_obj = doc.w_objs[2]
+        # reading the second text spills the first one again
+        ref = doc.w_objs[14].syn_parent
+        self.assertIsInstance(ref, exmldoc.PendingRef)
+        self.assertEqual(doc.object_by_id[ref.xml_id].word, w_obj.word)
+        self.assertIs(doc.object_by_id['s1_2'].parent,
+                      doc.object_by_id['s1_500'])
+
+    def test_relink(self):
+        doc, spill = read_doc(27)
+        holder = doc.w_objs[14]
+        old_copy = weakref.ref(doc.w_objs[2])
+        spill.max_tokens = 18
+        spill.evict()
+        self.assertEqual(spill.stats().spilled_windows, 1)
+        self.assertIsInstance(holder.syn_parent, exmldoc.PendingRef)
+        gc.collect()
+        self.assertIsNone(old_copy())
+        spill.max_tokens = 27
+        w_obj = doc.object_by_id['s1_3']
+        self.assertIs(holder.syn_parent, w_obj)
+        self.assertIs(doc.w_objs[2], w_obj)
+
+    def test_file_reuse(self):
+        doc, spill = read_doc(9)
+        sizes = []
+        for i in range(4):
+            for posn in (1, 12, 22):
+                self.assertIsNotNone(doc.w_objs[posn])
+            spill.evict()
+            sizes.append(spill.stats().file_bytes)
+        self.assertEqual(spill.stats().spilled_windows, 2)
+        self.assertEqual(sizes[-1], sizes[-2])
+        self.assertTrue(sizes[-1] < 3 * sizes[0] / 2)
+
+    def test_replace_slots(self):
+        t = Tree()
+        old, new = object(), object()
+        t.terminals = [old]
+        self.assertTrue(replace_values(t, lambda x: new if x is old else x))
+        self.assertEqual(t._terminals, [new])
+
+    def test_export(self):
+        expected = exmldoc.create_doc()
+        reader = exmldoc.XMLCorpusReader(expected, io.BytesIO(three_texts),
+                                         None)
+        while True:
+            try:
+                reader.addNext()
+            except StopIteration:
+                break
+        exmldoc.postprocess_doc(expected)
+        doc, spill = read_doc(9)
+        self.assertEqual(inline_xml(doc), inline_xml(expected))
+        doc.clear_markables(0, 9)
+        self.assertEqual(doc.get_objects_by_level('sentence', 0, 9), [])
+        self.assertEqual(spill.stats().spilled_windows +
+                         len(spill.resident), 2)
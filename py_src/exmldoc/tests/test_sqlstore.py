@@ -0,0 +1,63 @@
+import io
+import os.path
+import shutil
+import tempfile
+import unittest
+import exmldoc
+from exmldoc import sqlstore
+from exmldoc.tree import Tree
+from exmldoc.tests.test_edges import inline_xml
+from exmldoc.tests.test_textindex import two_texts
+
+
+class TestSQLiteDocument(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'doc.exml.xml')
+        # a reference from the second text back into the first
+        with open(self.fname, 'wb') as f_out:
+            f_out.write(two_texts.replace(
+                b'<word xml:id="s3_6" form="."',
+                b'<word xml:id="s3_6" form="." dephead="s1_3"'))
+        self.db_fname = os.path.join(self.tmpdir, 'doc.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_import(self):
+        expected = exmldoc.load(self.fname)
+        doc = sqlstore.import_xml(self.fname, self.db_fname)
+        self.assertEqual(len(doc), 18)
+        self.assertEqual(doc.words[7:11], expected.words[7:11])
+        self.assertEqual(list(doc.words), expected.words)
+        self.assertEqual(doc.w_objs[10].word, 'Vogel')
+        sents = doc.get_objects_by_level('sentence', 8, 18)
+        self.assertEqual([s.span for s in sents], [[9, 15], [15, 18]])
+        self.assertEqual(len(doc.get_objects_by_class(Tree)), 4)
+        self.assertEqual(doc.get_objects_by_level('no_such_level'), [])
+        self.assertEqual(doc.get_object('s3_500'),
+                         doc.text('t2').object_by_id['s3_500'])
+        self.assertEqual(doc.get_object('s3_500').span, [9, 11])
+        ref = doc.w_objs[14].syn_parent
+        self.assertIsInstance(ref, exmldoc.PendingRef)
+        self.assertEqual(doc.get_object(ref.xml_id), doc.w_objs[2])
+        self.assertRaises(ValueError, sqlstore.import_xml,
+                          self.fname, self.db_fname)
+
+    def test_export(self):
+        sqlstore.import_xml(self.fname, self.db_fname)
+        doc = sqlstore.SQLiteDocument(self.db_fname, cache_size=1)
+        f_out = io.StringIO()
+        doc.write_xml(f_out)
+        doc.close()
+        result = exmldoc.create_doc()
+        reader = exmldoc.XMLCorpusReader(
+            result, io.BytesIO(f_out.getvalue().encode('UTF-8')), None)
+        while True:
+            try:
+                reader.addNext()
+            except StopIteration:
+                break
+        exmldoc.postprocess_doc(result)
+        self.assertEqual(inline_xml(result),
+                         inline_xml(exmldoc.load(self.fname)))
@@ -0,0 +1,63 @@
+import random
+import shutil
+import tempfile
+import unittest
+from mock import mock_open, patch
+import simplejson as json
+import exmldoc
+from exmldoc import suffix
+from exmldoc.tests.test_tree import tree_doc
+
+
+class TestSuffixIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_suffix_array(self):
+        seq = [2, 0, 1, 0, 1, 0]
+        sa = suffix.suffix_array(seq)
+        self.assertEqual(list(sa), sorted(range(len(seq)),
+                                          key=lambda i: seq[i:]))
+        self.assertEqual(list(suffix.lcp_array(seq, sa)),
+                         [0, 1, 3, 0, 2, 0])
+        rnd = random.Random(42)
+        for n in [0, 1, 2, 17, 300]:
+            seq = [rnd.randrange(3) for i in range(n)]
+            # repeated text gives long common prefixes
+            seq = seq + [5] + seq
+            self.assertEqual(list(suffix.suffix_array(seq)),
+                             sorted(range(len(seq)),
+                                    key=lambda i: seq[i:]))
+
+    def test_phrases(self):
+        builder = suffix.SuffixIndexBuilder(self.tmpdir)
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        m = mock_open(read_data=tree_doc)
+        with patch('exmldoc.open', m):
+            reader = exmldoc.XMLCorpusReader(doc, 'fake_trees.exml.xml')
+            builder.add_document('a', reader)
+        # the second copy comes in through the JSON reader
+        with patch('exmldoc.open', mock_open(read_data=tree_doc)):
+            doc = exmldoc.load('fake_trees.exml.xml')
+        json_lines = (json.dumps(doc.json_chunk(0, 6)) + '\n' +
+                      json.dumps(doc.json_chunk(6, 9)) + '\n')
+        doc = exmldoc.make_syntax_doc(want_deps=True)
+        m = mock_open(read_data=json_lines.encode('utf-8'))
+        with patch('exmldoc.open', m):
+            reader = exmldoc.JSONCorpusReader(doc, 'fake.json')
+            builder.add_document('b', reader)
+        builder.close()
+        index = suffix.SuffixIndex(self.tmpdir)
+        self.assertEqual(len(index), 18)
+        self.assertEqual(index.count(['die', 'Katze']), 2)
+        self.assertEqual(index.count([u'Katze', u'.']), 4)
+        self.assertEqual(index.count(['Katze', 'Hund']), 0)
+        self.assertEqual(index.count(['Maus']), 0)
+        self.assertEqual(list(index.locations(['Katze'])), [4, 7, 13, 16])
+        self.assertEqual(index.continuations(['Katze']), [(b'.', 4)])
+        self.assertEqual(index.continuations(['.']),
+                         [(b'Die', 2), (b'Der', 1)])
+        self.assertEqual(index.continuations(['.'], k=1), [(b'Die', 2)])
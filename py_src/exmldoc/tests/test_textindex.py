@@ -0,0 +1,131 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+import exmldoc
+from exmldoc import parallel, textindex
+from exmldoc.tests.test_edges import inline_xml
+from exmldoc.tests.test_tree import tree_doc
+
+head, text1 = tree_doc.split(b'<text ', 1)
+text1, tail = text1.rsplit(b'</text>', 1)
+text1 = b'<text ' + text1 + b'</text>\n'
+text2 = text1.replace(b's1_', b's3_').replace(b's2_', b's4_').replace(
+    b'"t1"', b'"t2"').replace(b'Hund', b'Vogel')
+two_texts = head + text1 + text2 + tail.lstrip(b'\n')
+
+
+class TestTextIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'two.exml.xml')
+        with open(self.fname, 'wb') as f_out:
+            f_out.write(two_texts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_index(self):
+        idx = textindex.TextIndex(self.fname)
+        self.assertTrue(os.path.exists(self.fname + '.tidx'))
+        self.assertEqual(len(idx), 2)
+        self.assertEqual(idx.token_starts, [0, 9])
+        self.assertEqual(idx.text_at(10), 1)
+        self.assertRaises(IndexError, idx.text_at, 18)
+        doc = idx.load_text('t2')
+        self.assertEqual(doc.words[:3], ['Der', 'Vogel', 'sieht'])
+        self.assertEqual(len(doc.get_objects_by_level('sentence')), 2)
+        self.assertEqual(doc.object_by_id['s3_2'].parent.xml_id, 's3_500')
+        doc, posn = idx.load_tokens(10)
+        self.assertEqual(doc.words[posn], 'Vogel')
+        idx.load_text(0, doc)
+        self.assertEqual(len(doc.words), 18)
+        self.assertEqual(len(doc.get_objects_by_level('text')), 2)
+
+    def test_stale(self):
+        textindex.TextIndex(self.fname)
+        with open(self.fname, 'wb') as f_out:
+            f_out.write(head + text2 + tail.lstrip(b'\n'))
+        os.utime(self.fname, (0, 0))
+        idx = textindex.TextIndex(self.fname)
+        self.assertEqual(len(idx), 1)
+        self.assertEqual(idx.load_text(0).words[1], 'Vogel')
+
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data):
+        fname = os.path.join(self.tmpdir, 'par.exml.xml')
+        with open(fname, 'wb') as f_out:
+            f_out.write(data)
+        return fname
+
+    def test_load(self):
+        fname = self.write(two_texts.replace(
+            b'<node xml:id="s3_501" cat="VXFIN" func="HD" parent="s3_503">',
+            b'<node xml:id="s3_501" cat="VXFIN" func="HD" parent="s3_503">\n'
+            b'<secEdge cat="refint" parent="s1_500"/>'))
+        expected = exmldoc.load(fname)
+        for processes in [1, 2]:
+            doc = parallel.load_parallel(fname, processes=processes,
+                                         chunks_per_process=1)
+            self.assertEqual(doc.words, expected.words)
+            self.assertEqual(inline_xml(doc), inline_xml(expected))
+            self.assertIs(doc.object_by_id['s3_501'].secedge[0][1],
+                          doc.object_by_id['s1_500'])
+            self.assertEqual(doc.word_ids['s3_1'], 9)
+            self.assertIs(doc.object_by_id['s3_2'].parent,
+                          doc.object_by_id['s3_500'])
+            self.assertEqual(doc.object_by_id['s3_500'].span, [9, 11])
+
+    def test_forward_ref(self):
+        fname = self.write(two_texts.replace(
+            b'<word xml:id="s1_6" form="."',
+            b'<word xml:id="s1_6" form="." dephead="s3_3"'))
+        self.assertRaises(KeyError, exmldoc.load, fname)
+        doc = parallel.load_parallel(fname, processes=1,
+                                     chunks_per_process=2)
+        self.assertIs(doc.w_objs[5].syn_parent, doc.w_objs[11])
+        self.assertEqual(doc.pending_refs, set())
+
+
+class TestLazyDocument(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'lazy.exml.xml')
+        with open(self.fname, 'wb') as f_out:
+            f_out.write(two_texts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_open(self):
+        doc = exmldoc.open_lazy(self.fname, cache_size=1)
+        self.assertEqual(len(doc), 18)
+        self.assertEqual(doc.cache_info().misses, 0)
+        self.assertEqual(doc.words[10], 'Vogel')
+        self.assertEqual(doc.words[7:11], ['Katze', '.', 'Der', 'Vogel'])
+        self.assertEqual(doc.w_objs[-1].word, '.')
+        info = doc.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions),
+                         (1, 3, 2))
+        sents = doc.get_objects_by_level('sentence', 8, 18)
+        self.assertEqual([s.span for s in sents], [[9, 15], [15, 18]])
+        self.assertEqual(doc.words[sents[1].span[0]:sents[1].span[1]],
+                         ['Die', 'Katze', '.'])
+        self.assertIsInstance(sents[0].obj, exmldoc.tree.Tree)
+        terminals = sents[1].terminals
+        self.assertEqual([n.span[0] for n in terminals], [15, 16, 17])
+        self.assertEqual(terminals[0], doc.w_objs[15])
+        self.assertEqual(doc.w_objs[16].parent.span, [15, 17])
+        self.assertEqual(sents[0], doc.text('t2').object_by_id[sents[0].xml_id])
+        self.assertEqual(doc.text_start('t2'), 9)
+        self.assertEqual(list(doc.words), exmldoc.load(self.fname).words)
+        self.assertEqual(doc.cache_info().currsize, 1)
+        self.assertEqual(doc.get_objects_by_level('sentence', 0, 1)[0].span,
+                         [0, 6])
@@ -0,0 +1,89 @@
+import os.path
+import shutil
+import tempfile
+from array import array
+import unittest
+from mock import mock_open, patch
+import exmldoc
+from exmldoc import tokindex
+from exmldoc.tests.test_tree import tree_doc
+
+
+class TestTokenIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def build_index(self):
+        builder = tokindex.TokenIndexBuilder(self.tmpdir, max_memory=4)
+        for fname in ['a', 'b']:
+            doc = exmldoc.make_syntax_doc(want_deps=True)
+            m = mock_open(read_data=tree_doc)
+            with patch('exmldoc.open', m):
+                reader = exmldoc.XMLCorpusReader(doc, 'fake_trees.exml.xml')
+                builder.add_document(fname, reader)
+        builder.close()
+        return tokindex.TokenIndex(self.tmpdir)
+
+    def test_varints(self):
+        out = bytearray()
+        positions = [0, 3, 200, 70000]
+        last = -1
+        for posn in positions:
+            tokindex.encode_varint(posn - last - 1, out)
+            last = posn
+        self.assertEqual(list(tokindex.decode_varints(bytes(out), 4)),
+                         positions)
+        self.assertEqual(list(tokindex.iter_varints(
+            bytes(out), 4, block_size=1)), positions)
+        # stops after count positions, without reading the rest
+        self.assertEqual(list(tokindex.iter_varints(
+            bytes(out) + b'\xff', 2, 0, len(out) + 1, 2)), positions[:2])
+
+    def test_encode_postings(self):
+        lists = [[1, 4], [0, 2, 3, 9], [], [5], [6, 7, 8]]
+        rev = array('i', [posn for lst in lists for posn in lst])
+        if tokindex.NEED_SWAP:
+            rev.byteswap()
+        rev_fname = os.path.join(self.tmpdir, 'a.rev')
+        post_fname = os.path.join(self.tmpdir, 'a.post')
+        with open(rev_fname, 'wb') as f_out:
+            rev.tofile(f_out)
+        # read the reverse index a few positions at a time
+        with patch('exmldoc.tokindex.CHUNK_SIZE', 3):
+            tokindex.encode_postings(rev_fname, [len(lst) for lst in lists],
+                                     post_fname, post_fname + '.idx')
+        with open(post_fname + '.idx', 'rb') as f_in:
+            offsets = array('q', f_in.read())
+        if tokindex.NEED_SWAP:
+            offsets.byteswap()
+        with open(post_fname, 'rb') as f_in:
+            buf = f_in.read()
+        self.assertEqual(
+            [list(tokindex.decode_varints(buf[offsets[k]:offsets[k + 1]],
+                                          len(lst)))
+             for k, lst in enumerate(lists)], lists)
+
+    def test_lookup(self):
+        index = self.build_index()
+        self.assertEqual(len(index), 18)
+        self.assertEqual(list(index.lookup('form', u'Katze')), [4, 7, 13, 16])
+        self.assertEqual(list(index.lookup('lemma', 'die')), [3, 6, 12, 15])
+        self.assertEqual(index.count('pos', 'NN'), 6)
+        self.assertEqual(len(index.lookup('form', 'Maus')), 0)
+        self.assertEqual(index.count('form', 'Maus'), 0)
+
+    def test_kwic(self):
+        index = self.build_index()
+        hits = index.kwic('lemma', 'sehen', width=2)
+        self.assertEqual(hits[1], (11, [b'Der', b'Hund'], b'sieht',
+                                   [b'die', b'Katze']))
+        self.assertEqual([hit[0] for hit in
+                          index.kwic('form', 'Katze', limit=3)], [4, 7, 13])
+        self.assertEqual(index.kwic('form', 'Maus'), [])
+        self.assertEqual(index.context(0, 2)[0], [])
+        self.assertEqual(index.context(17, 2)[2], [])
+        self.assertEqual(index.locate(11), ('b', 2))
+        self.assertEqual(index.locate(8), ('a', 8))
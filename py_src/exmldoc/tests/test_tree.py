@@ -0,0 +1,193 @@
+# coding=utf-8
+import io
+import unittest
+from mock import mock_open, patch
+import exmldoc
+from exmldoc import tree
+
+tree_doc = u'''<?xml version="1.0" encoding="utf-8"?>
+<exml-doc>
+<schema>
+<tnode name="word">
+ <text-attr name="form"/>
+ <enum-attr name="pos">
+  <val name="ART"/>
+  <val name="NN"/>
+  <val name="VVFIN"/>
+  <val name="$."/>
+ </enum-attr>
+ <text-attr name="lemma"/>
+ <enum-attr name="func">
+  <val name="HD"/>
+  <val name="-"/>
+  <val name="--"/>
+ </enum-attr>
+ <node-ref name="parent"/>
+ <node-ref name="dephead"/>
+ <enum-attr name="deprel">
+  <val name="DET"/>
+  <val name="SUBJ"/>
+  <val name="OBJA"/>
+ </enum-attr>
+</tnode>
+<node name="node">
+ <enum-attr name="cat">
+  <val name="NX"/>
+  <val name="VXFIN"/>
+  <val name="SIMPX"/>
+ </enum-attr>
+ <enum-attr name="func">
+  <val name="ON"/>
+  <val name="OA"/>
+  <val name="HD"/>
+  <val name="--"/>
+ </enum-attr>
+ <node-ref name="parent"/>
+</node>
+</schema>
+<body serialization="inline">
+<text xml:id="t1" origin="test">
+<sentence xml:id="s1">
+<node xml:id="s1_503" cat="SIMPX" func="--">
+<node xml:id="s1_500" cat="NX" func="ON" parent="s1_503">
+<word xml:id="s1_1" form="Der" pos="ART" lemma="der" func="-" parent="s1_500" dephead="s1_2" deprel="DET"/>
+<word xml:id="s1_2" form="Hund" pos="NN" lemma="Hund" func="HD" parent="s1_500" dephead="s1_3" deprel="SUBJ"/>
+</node>
+<node xml:id="s1_501" cat="VXFIN" func="HD" parent="s1_503">
+<word xml:id="s1_3" form="sieht" pos="VVFIN" lemma="sehen" func="HD" parent="s1_501"/>
+</node>
+<node xml:id="s1_502" cat="NX" func="OA" parent="s1_503">
+<word xml:id="s1_4" form="die" pos="ART" lemma="die" func="-" parent="s1_502" dephead="s1_5" deprel="DET"/>
+<word xml:id="s1_5" form="Katze" pos="NN" lemma="Katze" func="HD" parent="s1_502" dephead="s1_3" deprel="OBJA"/>
+</node>
+</node>
+<word xml:id="s1_6" form="." pos="$." lemma="." func="--"/>
+</sentence>
+<sentence xml:id="s2">
+<node xml:id="s2_500" cat="NX" func="--">
+<word xml:id="s2_1" form="Die" pos="ART" lemma="die" func="-" parent="s2_500" dephead="s2_2" deprel="DET"/>
+<word xml:id="s2_2" form="Katze" pos="NN" lemma="Katze" func="HD" parent="s2_500"/>
+</node>
+<word xml:id="s2_3" form="." pos="$." lemma="." func="--"/>
+</sentence>
+</text>
+</body>
+</exml-doc>
+'''.encode('utf-8')
+
+
+def load_tree_doc(**kw):
+    m = mock_open(read_data=tree_doc)
+    with patch('exmldoc.open', m):
+        doc = exmldoc.load('fake_trees.exml.xml', **kw)
+    return doc
+
+
+class TestTrees(unittest.TestCase):
+    def test_postprocess(self):
+        doc = load_tree_doc()
+        trees = doc.get_objects_by_class(tree.Tree)
+        self.assertEqual(len(trees), 2)
+        t1, t2 = trees
+        self.assertEqual([n.word for n in t1.terminals],
+                         ['Der', 'Hund', 'sieht', 'die', 'Katze', '.'])
+        self.assertEqual([n.xml_id for n in t1.roots],
+                         ['s1_503', 's1_6'],
+                         'roots should be in span order')
+        simpx = t1.roots[0]
+        self.assertEqual([n.xml_id for n in simpx.children],
+                         ['s1_500', 's1_501', 's1_502'],
+                         'children should be in span order')
+        self.assertEqual((simpx.start, simpx.end), (0, 5))
+        np2 = t2.roots[0]
+        self.assertEqual((np2.start, np2.end), (0, 2),
+                         'start/end should be relative to the sentence')
+        self.assertEqual([n.word for n in np2.children], ['Die', 'Katze'])
+        self.assertEqual([n.start for n in t2.terminals], [0, 1, 2])
+
+    def test_lazy_trees(self):
+        doc = load_tree_doc(lazy_trees=True)
+        t1, t2 = doc.get_objects_by_class(tree.Tree)
+        self.assertIsNone(t2._roots,
+                          'trees should not be built before first access')
+        self.assertEqual([n.start for n in doc.w_objs[6:9]], [-1, -1, -1],
+                         'terminal offsets should wait for the tree')
+        np1 = doc.object_by_id['s1_502']
+        self.assertEqual((np1.start, np1.end), (3, 5))
+        self.assertIsNone(t2._roots)
+        # going through a node builds the sentence it belongs to
+        np2 = doc.w_objs[7].parent
+        self.assertEqual([n.word for n in np2.children], ['Die', 'Katze'])
+        self.assertEqual([n.xml_id for n in t2.roots], ['s2_500', 's2_3'])
+        self.assertEqual([(n.start, n.end) for n in doc.w_objs[6:9]],
+                         [(0, 1), (1, 2), (2, 3)])
+        self.assertIsNone(t1._roots,
+                          'other sentences should stay unbuilt')
+        self.assertEqual(len(t1.terminals), 6)
+
+    def test_read_trees_exml(self):
+        m = mock_open(read_data=tree_doc)
+        with patch('exmldoc.open', m), \
+                patch('sys.stderr', new_callable=io.StringIO) as f_err:
+            trees = list(exmldoc.read_trees_exml('fake_trees.exml.xml'))
+        self.assertEqual([t.xml_id for t in trees], ['s1', 's2'])
+        self.assertEqual([n.xml_id for n in trees[1].terminals],
+                         ['s2_1', 's2_2', 's2_3'])
+        self.assertEqual(f_err.getvalue(), '')
+
+    def test_ancestor_index(self):
+        doc = load_tree_doc()
+        t1 = doc.get_objects_by_class(tree.Tree)[0]
+        der, hund, sieht, die, katze, punct = t1.terminals
+        simpx = t1.roots[0]
+        np1 = der.parent
+        self.assertTrue(t1.dominates(simpx, katze))
+        self.assertTrue(t1.dominates(np1, hund))
+        self.assertFalse(t1.dominates(np1, katze))
+        self.assertFalse(t1.dominates(np1, np1),
+                         'dominance should be proper')
+        self.assertIs(t1.lca(der, hund), np1)
+        self.assertIs(t1.lca(hund, katze), simpx)
+        self.assertIs(t1.lca(np1, der), np1)
+        self.assertIsNone(t1.lca(der, punct),
+                          'nodes below different roots have no LCA')
+        self.assertEqual(t1.depth(simpx), 0)
+        self.assertEqual(t1.depth(katze), 2)
+        self.assertEqual(t1.path(der, katze),
+                         [der, np1, simpx, katze.parent, katze])
+        self.assertEqual(t1.path(hund, hund), [hund])
+
+    def test_add_tree_to_doc(self):
+        doc = load_tree_doc()
+        trees = doc.get_objects_by_class(tree.Tree)
+        doc2 = exmldoc.make_syntax_doc()
+        for t in trees:
+            t.all_nes = [('ANIM', [0, 2])]
+            exmldoc.add_tree_to_doc(t, doc2)
+        self.assertEqual(doc2.words, doc.words)
+        self.assertEqual([t.span for t in doc2.get_objects_by_level('sentence')],
+                         [[0, 6], [6, 9]])
+        self.assertEqual([ne.span for ne in doc2.get_objects_by_level('ne')],
+                         [[0, 2], [6, 8]])
+        self.assertIs(doc2.mlevel_cache[exmldoc.NamedEntity],
+                      doc2.schema_by_name('ne'))
+        self.assertRaises(ValueError, doc2.register_objects, [object()])
+
+    def test_dense_markables(self):
+        doc = load_tree_doc(dense_markables=True)
+        self.assertIsInstance(doc.markables_by_start, exmldoc.DenseBag)
+        sparse_doc = load_tree_doc()
+        self.assertEqual(
+            [n.xml_id for n in doc.get_objects_by_level('node')],
+            [n.xml_id for n in sparse_doc.get_objects_by_level('node')])
+        t1, t2 = doc.get_objects_by_class(tree.Tree)
+        self.assertEqual([n.xml_id for n in t2.roots], ['s2_500', 's2_3'])
+        def event_list(d):
+            return [(evt[0], evt[1] if evt[0] != 'terminal' else evt[1].word,
+                     list(evt[2]) if evt[0] == 'start' else None)
+                    for evt in d.inline_events(0, 9)]
+        self.assertEqual(event_list(doc), event_list(sparse_doc))
+        doc.clear_markables(0, 6)
+        self.assertEqual(len(doc.get_objects_by_class(tree.Tree)), 1)
+        doc.set_dense_markables(False)
+        self.assertEqual(len(doc.get_objects_by_class(tree.Tree)), 1)
@@ -0,0 +1,71 @@
+import io
+import unittest
+import exmldoc
+from exmldoc.tests.test_edges import edge_doc
+
+# s1_3 refers ahead into the second sentence
+window_doc = edge_doc.replace(
+    b'<word xml:id="s1_3" form="sieht" pos="VVFIN" lemma="sehen" '
+    b'func="HD" parent="s1_501"/>',
+    b'<word xml:id="s1_3" form="sieht" pos="VVFIN" lemma="sehen" '
+    b'func="HD" parent="s1_501" dephead="s2_2"/>')
+
+
+def read_windows(**kw):
+    doc = exmldoc.create_doc()
+    reader = exmldoc.XMLCorpusReader(doc, io.BytesIO(window_doc), None, **kw)
+    windows = []
+    while True:
+        try:
+            start = reader.addNext()
+        except StopIteration:
+            break
+        windows.append((start, len(doc.words)))
+    return doc, reader, windows
+
+
+class TestWindow(unittest.TestCase):
+    def test_windows(self):
+        expected, reader, windows = read_windows()
+        self.assertEqual(windows, [(0, 9), (9, 9), (9, 9)])
+        doc, reader, windows = read_windows(window=1)
+        self.assertEqual(windows, [(0, 6), (6, 9), (9, 9), (9, 9)])
+        doc, reader, windows = read_windows(window=4, window_unit='token')
+        self.assertEqual(windows, [(0, 4), (4, 8), (8, 9), (9, 9), (9, 9)])
+
+    def test_refs(self):
+        doc = exmldoc.create_doc()
+        reader = exmldoc.XMLCorpusReader(doc, io.BytesIO(window_doc), None,
+                                         window=1)
+        reader.addNext()
+        self.assertEqual(doc.pending_refs, set(['s2_2']))
+        self.assertIsInstance(doc.w_objs[2].syn_parent, exmldoc.PendingRef)
+        reader.addNext()
+        self.assertEqual(doc.pending_refs, set())
+        self.assertIs(doc.w_objs[2].syn_parent, doc.w_objs[7])
+        # the text is still open, but has its attributes
+        self.assertEqual(doc.get_objects_by_level('text'), [])
+        self.assertEqual(doc.object_by_id['t1'].origin, 'test')
+
+    def test_export(self):
+        expected = exmldoc.create_doc()
+        f_expected = io.StringIO()
+        exmldoc.write_corpus_xml(
+            expected, exmldoc.XMLCorpusReader(
+                expected, io.BytesIO(window_doc), None), f_expected)
+        for kw in [dict(window=1), dict(window=2, window_unit='token')]:
+            doc = exmldoc.create_doc()
+            f_out = io.StringIO()
+            exmldoc.write_corpus_xml(
+                doc, exmldoc.XMLCorpusReader(
+                    doc, io.BytesIO(window_doc), None, **kw), f_out)
+            self.assertEqual(f_out.getvalue(), f_expected.getvalue())
+            doc = exmldoc.create_doc()
+            reader = exmldoc.XMLCorpusReader(
+                doc, io.BytesIO(window_doc), None, **kw)
+            events = list(reader.inline_events())
+            starts = [ev[1] for ev in events if ev[0] == 'start']
+            self.assertEqual(starts.count('text'), 1)
+            self.assertEqual(starts.count('sentence'), 2)
+            self.assertEqual(len([ev for ev in events if ev[0] == 'end']),
+                             len(starts))
@@ -0,0 +1,246 @@
+"""
+Random access to the texts of large EXML files.
+
+:py:func:`build_text_index` scans an (uncompressed) EXML file once and
+writes a sidecar file ``<fname>.tidx`` with the byte range of the schema
+header and, for each ``<text>``, its ID, byte range, first token
+position and number of tokens::
+
+  file    <size>  <mtime>
+  prolog  0       <end>
+  schema  <start> <end>
+  text    <id>    <start> <end> <first token> <tokens>
+
+:py:class:`TextIndex` parses the schema header once and then reads a
+single text (by number, ID or token position) by seeking to its byte
+offset, without going through the texts before it.
+"""
+from __future__ import print_function
+
+import mmap
+import os
+import os.path
+import re
+import sys
+from bisect import bisect_right
+from io import BytesIO
+
+import exmldoc
+
+tag_re = re.compile(br'<(/?)(text|word|schema)(?=[\s/>])')
+id_re = re.compile(br'''xml:id\s*=\s*(["'])(.*?)\1''')
+
+
+def index_fname_for(fname):
+    return fname + '.tidx'
+
+
+def scan_texts(buf):
+    """
+    finds the schema header and the texts in the contents of an
+    EXML file. Returns (prolog_end, (schema_start, schema_end), texts)
+    where texts is a list of (id, start, end, first_token, n_tokens).
+    """
+    schema = None
+    prolog_end = None
+    texts = []
+    n_words = 0
+    text_start = None
+    for m in tag_re.finditer(buf):
+        closing, tag = m.group(1), m.group(2)
+        if tag == b'word':
+            if not closing:
+                n_words += 1
+        elif tag == b'text':
+            if not closing:
+                tag_end = buf.find(b'>', m.end())
+                m_id = id_re.search(buf, m.end(), tag_end)
+                text_id = None
+                if m_id is not None:
+                    text_id = m_id.group(2).decode('UTF-8')
+                text_start = (text_id, m.start(), n_words)
+                if buf[tag_end - 1:tag_end] == b'/':
+                    texts.append((text_id, m.start(), tag_end + 1,
+                                  n_words, 0))
+                    text_start = None
+            elif text_start is not None:
+                text_id, start, first_token = text_start
+                end = buf.find(b'>', m.end()) + 1
+                texts.append((text_id, start, end, first_token,
+                              n_words - first_token))
+                text_start = None
+        elif tag == b'schema':
+            if not closing:
+                prolog_end = m.start()
+                schema_start = m.start()
+            else:
+                schema = (schema_start, buf.find(b'>', m.end()) + 1)
+    if schema is None:
+        raise ValueError("no schema header found")
+    return prolog_end, schema, texts
+
+
+def build_text_index(fname, index_fname=None):
+    """
+    scans an EXML file and writes its text index
+
+    :return: the name of the index file
+    """
+    if fname.endswith('.gz'):
+        raise ValueError("cannot index compressed file %s" % (fname,))
+    if index_fname is None:
+        index_fname = index_fname_for(fname)
+    with open(fname, 'rb') as f_in:
+        st = os.fstat(f_in.fileno())
+        buf = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            prolog_end, schema, texts = scan_texts(buf)
+        finally:
+            buf.close()
+    tmp_fname = index_fname + '.tmp'
+    with open(tmp_fname, 'w') as f_out:
+        print("file\t%d\t%d" % (st.st_size, int(st.st_mtime)), file=f_out)
+        print("prolog\t0\t%d" % (prolog_end,), file=f_out)
+        print("schema\t%d\t%d" % schema, file=f_out)
+        for text_id, start, end, first_token, n_tokens in texts:
+            print("text\t%s\t%d\t%d\t%d\t%d" % (
+                '' if text_id is None else text_id,
+                start, end, first_token, n_tokens), file=f_out)
+    os.rename(tmp_fname, index_fname)
+    return index_fname
+
+
+class TextIndex(object):
+
+    """
+    reads single texts from an EXML file, using (and if necessary
+    creating or updating) its text index
+
+    :param encoding: passed on to :py:class:`exmldoc.XMLCorpusReader`
+    """
+
+    def __init__(self, fname, index_fname=None, encoding=None):
+        self.fname = fname
+        self.encoding = encoding
+        if index_fname is None:
+            index_fname = index_fname_for(fname)
+        self.index_fname = index_fname
+        if not self.is_current():
+            build_text_index(fname, index_fname)
+        self.read_index()
+        self.header = None
+
+    def is_current(self):
+        if not os.path.exists(self.index_fname):
+            return False
+        st = os.stat(self.fname)
+        with open(self.index_fname) as f_idx:
+            line = f_idx.readline().rstrip('\n').split('\t')
+        return (line[0] == 'file' and int(line[1]) == st.st_size and
+                int(line[2]) == int(st.st_mtime))
+
+    def read_index(self):
+        self.texts = []
+        self.text_ids = {}
+        self.token_starts = []
+        for l in open(self.index_fname):
+            line = l.rstrip('\n').split('\t')
+            if line[0] == 'prolog':
+                self.prolog = (int(line[1]), int(line[2]))
+            elif line[0] == 'schema':
+                self.schema = (int(line[1]), int(line[2]))
+            elif line[0] == 'text':
+                text_id = line[1] or None
+                if text_id is not None:
+                    self.text_ids[text_id] = len(self.texts)
+                entry = tuple([text_id] + [int(x) for x in line[2:]])
+                self.texts.append(entry)
+                self.token_starts.append(entry[3])
+
+    def __len__(self):
+        return len(self.texts)
+
+    def read_bytes(self, start, end):
+        with open(self.fname, 'rb') as f_in:
+            f_in.seek(start)
+            return f_in.read(end - start)
+
+    def get_header(self):
+        """returns the prolog and the parsed schema element"""
+        if self.header is None:
+            prolog = self.read_bytes(*self.prolog)
+            schema_xml = self.read_bytes(*self.schema)
+            elem = exmldoc.etree.fromstring(
+                prolog + schema_xml + b'</exml-doc>').find('schema')
+            self.header = (prolog, elem)
+        return self.header
+
+    def text_number(self, key):
+        """maps a text ID (or a text number) to the text number"""
+        if isinstance(key, int):
+            return key
+        return self.text_ids[key]
+
+    def text_at(self, posn):
+        """returns the number of the text containing token posn"""
+        k = bisect_right(self.token_starts, posn) - 1
+        if k < 0 or posn >= self.token_starts[k] + self.texts[k][4]:
+            raise IndexError(posn)
+        return k
+
+    def reader(self, key, doc=None):
+        """
+        returns an XMLCorpusReader for one text. A new document
+        gets the schema from the header of the file.
+        """
+        text_id, start, end, first_token, n_tokens = \
+            self.texts[self.text_number(key)]
+        prolog, schema_elem = self.get_header()
+        if doc is None:
+            doc = exmldoc.create_doc()
+            exmldoc.process_schema(doc, schema_elem)
+        data = (prolog + b'<body serialization="inline">' +
+                self.read_bytes(start, end) + b'</body></exml-doc>')
+        reader = exmldoc.XMLCorpusReader(doc, BytesIO(data),
+                                         self.encoding)
+        reader.state = 'BEFORE_BODY'
+        return reader
+
+    def load_text(self, key, doc=None, lazy_trees=True):
+        """
+        reads one text (by number or ID) into a new document, or
+        appends it to doc
+        """
+        reader = self.reader(key, doc)
+        doc = reader.doc
+        start = len(doc.words)
+        while True:
+            try:
+                reader.addNext()
+            except StopIteration:
+                break
+        exmldoc.postprocess_doc(doc, start, lazy=lazy_trees)
+        return doc
+
+    def load_tokens(self, posn, lazy_trees=True):
+        """
+        reads the text that contains the token at posn, and returns
+        the document together with the position of the token in it
+        """
+        k = self.text_at(posn)
+        doc = self.load_text(k, lazy_trees=lazy_trees)
+        return doc, posn - self.token_starts[k]
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        print("Usage: python -m exmldoc.textindex file.exml.xml ...")
+        sys.exit(1)
+    for fname in argv:
+        build_text_index(fname)
+
+
+if __name__ == '__main__':
+    main()
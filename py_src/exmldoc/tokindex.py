@@ -0,0 +1,361 @@
+"""
+A persistent inverted index from token attribute values to corpus
+positions, for concordance (KWIC) lookups that do not need to parse
+any XML.
+
+For each indexed attribute, the index directory contains the CWB-style
+lexicon and corpus stream (see :py:mod:`exmldoc.cwb`) and
+
+  ``<attr>.post``      the postings of each lexicon id, as varint-coded
+                       gaps between ascending positions
+  ``<attr>.post.idx``  the byte offset of each id's postings (64 bit)
+
+together with ``offsets.txt``, which maps files to global positions.
+All files are memory-mapped when the index is opened.
+
+Usage::
+
+  python -m exmldoc.tokindex corpus_dir index_dir
+"""
+from __future__ import print_function
+
+import mmap
+import os
+import os.path
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+from .cwb import PAttributeWriter, compute_reverse_index, read_ints, \
+    to_bytes, NEED_SWAP, CHUNK_SIZE
+
+if sys.version_info.major >= 3:
+    xrange = range
+    unicode = str
+
+    def byte_values(buf):
+        return buf
+else:
+    def byte_values(buf):
+        return bytearray(buf)
+
+DEFAULT_ATTRS = ('form', 'lemma', 'pos')
+
+
+def encode_varint(n, out):
+    """appends the varint encoding of n to the bytearray out"""
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def iter_varints(buf, count, start=0, end=None, block_size=4096):
+    """
+    yields the positions of at most count varint-coded gaps in
+    buf[start:end], copying only blocks of block_size bytes
+    """
+    if end is None:
+        end = len(buf)
+    posn = -1
+    val = 0
+    shift = 0
+    n = 0
+    while start < end and n < count:
+        block = byte_values(buf[start:min(start + block_size, end)])
+        start += block_size
+        for b in block:
+            val |= (b & 0x7f) << shift
+            if b & 0x80:
+                shift += 7
+            else:
+                posn += val + 1
+                yield posn
+                n += 1
+                if n == count:
+                    return
+                val = 0
+                shift = 0
+
+
+def decode_varints(buf, count):
+    """decodes count varint-coded gaps, returns the positions"""
+    return array('i', iter_varints(buf, count))
+
+
+def encode_postings(rev_fname, counts, post_fname, idx_fname):
+    """
+    turns a CWB reverse index into delta-coded postings; each list
+    stores (gap - 1), starting from position -1
+    """
+    offsets = array('q')
+    offset = 0
+    with open(rev_fname, 'rb') as f_rev:
+        with open(post_fname, 'wb') as f_post:
+            # positions read ahead of the current list, from pending[start]
+            pending = array('i')
+            start = 0
+            for count in counts:
+                offsets.append(offset)
+                if len(pending) - start < count:
+                    pending = pending[start:]
+                    start = 0
+                    while len(pending) < count:
+                        chunk = read_ints(f_rev, max(CHUNK_SIZE, count))
+                        if not chunk:
+                            break
+                        pending.extend(chunk)
+                positions = pending[start:start + count]
+                start += len(positions)
+                out = bytearray()
+                last = -1
+                for posn in positions:
+                    encode_varint(posn - last - 1, out)
+                    last = posn
+                f_post.write(bytes(out))
+                offset += len(out)
+    offsets.append(offset)
+    if NEED_SWAP:
+        offsets.byteswap()
+    with open(idx_fname, 'wb') as f_idx:
+        offsets.tofile(f_idx)
+
+
+class TokenIndexBuilder(object):
+
+    """
+    collects the values of some terminal attributes in a single
+    pass over a corpus, and writes the index when closed
+    """
+
+    def __init__(self, index_dir, attrs=DEFAULT_ATTRS, encoding='UTF-8',
+                 max_memory=1 << 24):
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        self.index_dir = index_dir
+        self.attrs = list(attrs)
+        self.encoding = encoding
+        self.max_memory = max_memory
+        self.writers = [PAttributeWriter(index_dir, att) for att in attrs]
+        self.files = []
+        self.posn = 0
+        self.props = None
+
+    def add_document(self, fname, reader):
+        """reads all tokens of a document from an XMLCorpusReader"""
+        self.files.append((fname, self.posn))
+        doc = reader.doc
+        if self.props is None:
+            props = []
+            for att in self.attrs:
+                try:
+                    props.append(doc.t_schema.attribute_by_name(att).prop_name)
+                except KeyError:
+                    props.append(att)
+            self.props = props
+        last_stop = len(doc.words)
+        while True:
+            try:
+                new_stop = reader.addNext()
+            except StopIteration:
+                new_stop = len(doc.words)
+                at_end = True
+            else:
+                at_end = False
+            self.add_tokens(doc.w_objs[last_stop:new_stop])
+            doc.clear_markables(last_stop, new_stop)
+            last_stop = new_stop
+            if at_end:
+                break
+
+    def add_tokens(self, w_objs):
+        encoding = self.encoding
+        for writer, prop in zip(self.writers, self.props):
+            add = writer.add
+            for n in w_objs:
+                add(to_bytes(getattr(n, prop, None), encoding))
+        self.posn += len(w_objs)
+
+    def close(self):
+        for writer in self.writers:
+            (corpus_fname, counts, rev_fname, rdx_fname) = writer.close()
+            compute_reverse_index(corpus_fname, counts, rev_fname,
+                                  rdx_fname, self.max_memory)
+            encode_postings(rev_fname, counts,
+                            writer.prefix + '.post',
+                            writer.prefix + '.post.idx')
+            os.unlink(rev_fname)
+            os.unlink(rdx_fname)
+        with open(os.path.join(self.index_dir, 'offsets.txt'), 'w') as f_out:
+            for fname, posn in self.files:
+                print("%s\t%d" % (fname, posn), file=f_out)
+
+
+def map_file(fname):
+    with open(fname, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IndexedAttribute(object):
+
+    """
+    the memory-mapped lexicon, corpus stream and postings
+    of one attribute
+    """
+
+    def __init__(self, index_dir, name):
+        prefix = os.path.join(index_dir, name)
+        self.name = name
+        self.lexicon = map_file(prefix + '.lexicon')
+        self.lex_idx = map_file(prefix + '.lexicon.idx')
+        self.lex_srt = map_file(prefix + '.lexicon.srt')
+        self.corpus = map_file(prefix + '.corpus')
+        self.counts = map_file(prefix + '.corpus.cnt')
+        self.postings = map_file(prefix + '.post')
+        self.post_idx = map_file(prefix + '.post.idx')
+        self.n_ids = len(self.lex_idx) // 4
+
+    def __len__(self):
+        return len(self.corpus) // 4
+
+    def get_string(self, wid):
+        start = struct.unpack_from('>i', self.lex_idx, 4 * wid)[0]
+        end = self.lexicon.find(b'\0', start)
+        return self.lexicon[start:end]
+
+    def get_id(self, val):
+        """returns the lexicon id of a value, or None"""
+        lo = 0
+        hi = self.n_ids
+        srt = self.lex_srt
+        while lo < hi:
+            mid = (lo + hi) // 2
+            wid = struct.unpack_from('>i', srt, 4 * mid)[0]
+            s = self.get_string(wid)
+            if s < val:
+                lo = mid + 1
+            elif s > val:
+                hi = mid
+            else:
+                return wid
+        return None
+
+    def count(self, wid):
+        return struct.unpack_from('>i', self.counts, 4 * wid)[0]
+
+    def positions(self, wid):
+        return array('i', self.iter_positions(wid))
+
+    def iter_positions(self, wid, limit=None):
+        """yields the positions of an id, or the first limit of them"""
+        start, end = struct.unpack_from('>qq', self.post_idx, 8 * wid)
+        count = self.count(wid)
+        if limit is not None:
+            count = min(count, limit)
+        return iter_varints(self.postings, count, start, end)
+
+    def ids_at(self, start, end):
+        return struct.unpack_from('>%di' % (end - start,),
+                                  self.corpus, 4 * start)
+
+
+class TokenIndex(object):
+
+    """
+    read-only access to an index created by :py:class:`TokenIndexBuilder`
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.attributes = {}
+        for fname in os.listdir(index_dir):
+            if fname.endswith('.post.idx'):
+                name = fname[:-len('.post.idx')]
+                self.attributes[name] = IndexedAttribute(index_dir, name)
+        self.file_names = []
+        self.file_starts = []
+        offsets_fname = os.path.join(index_dir, 'offsets.txt')
+        if os.path.exists(offsets_fname):
+            for l in open(offsets_fname):
+                line = l.strip().split()
+                if line:
+                    self.file_names.append(line[0])
+                    self.file_starts.append(int(line[1]))
+
+    def __len__(self):
+        for att in self.attributes.values():
+            return len(att)
+        return 0
+
+    def encode(self, val):
+        if isinstance(val, unicode):
+            return val.encode('UTF-8')
+        return val
+
+    def lookup(self, attr, val):
+        """returns the sorted positions where attribute attr has value val"""
+        att = self.attributes[attr]
+        wid = att.get_id(self.encode(val))
+        if wid is None:
+            return array('i')
+        return att.positions(wid)
+
+    def count(self, attr, val):
+        att = self.attributes[attr]
+        wid = att.get_id(self.encode(val))
+        if wid is None:
+            return 0
+        return att.count(wid)
+
+    def tokens(self, start, end, attr='form'):
+        """returns the values of attr for positions start..end-1"""
+        att = self.attributes[attr]
+        start = max(start, 0)
+        end = min(end, len(att))
+        return [att.get_string(wid) for wid in att.ids_at(start, end)]
+
+    def context(self, posn, width=5, attr='form'):
+        """returns (left context, token, right context) for a position"""
+        return (self.tokens(posn - width, posn, attr),
+                self.tokens(posn, posn + 1, attr)[0],
+                self.tokens(posn + 1, posn + 1 + width, attr))
+
+    def kwic(self, attr, val, width=5, limit=None, show='form'):
+        """
+        returns (position, left, token, right) tuples for
+        the occurrences of val
+        """
+        att = self.attributes[attr]
+        wid = att.get_id(self.encode(val))
+        if wid is None:
+            return []
+        # only the first limit postings are decoded
+        return [(posn,) + self.context(posn, width, show)
+                for posn in att.iter_positions(wid, limit)]
+
+    def locate(self, posn):
+        """maps a global position to (file name, position in file)"""
+        k = bisect_right(self.file_starts, posn) - 1
+        if k < 0:
+            raise IndexError(posn)
+        return self.file_names[k], posn - self.file_starts[k]
+
+
+def main(argv=None):
+    from .corpus import Corpus
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    builder = TokenIndexBuilder(argv[1])
+    for fname, doc, reader in Corpus(argv[0]).readers():
+        builder.add_document(fname, reader)
+    builder.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -50,12 +50,16 @@ class Tree(object):
 
        The leaves/pre-terminals of the tree
 
+    For trees read from a document, roots, terminals and the
+    children of the nodes may be computed on first access
+    (see :py:meth:`set_builder`).
+
     .. py:attribute:: encoding
 
        The encoding for any (non-unicode) string values in the tree's nodes
     '''
-    __slots__ = ['node_table', 'roots', 'terminals', 'encoding',
-                 '__dict__']
+    __slots__ = ['node_table', '_roots', '_terminals', '_builder',
+                 '_ancestors', 'encoding', '__dict__']
 
     def __getstate__(self):
         return (self.node_table,
@@ -65,11 +69,56 @@ class Tree(object):
 
     def __setstate__(self, state):
         self.node_table, self.roots, self.terminals, self.__dict__ = state
+        self._builder = None
+        self._ancestors = None
 
     def __init__(self):
         self.node_table = {}
-        self.roots = []
-        self.terminals = []
+        self._roots = []
+        self._terminals = []
+        self._builder = None
+        self._ancestors = None
+
+    def _get_roots(self):
+        if self._roots is None:
+            self.materialize()
+        return self._roots
+
+    def _set_roots(self, roots):
+        self._roots = roots
+
+    roots = property(_get_roots, _set_roots)
+
+    def _get_terminals(self):
+        if self._terminals is None:
+            self.materialize()
+        return self._terminals
+
+    def _set_terminals(self, terminals):
+        self._terminals = terminals
+
+    terminals = property(_get_terminals, _set_terminals)
+
+    def set_builder(self, builder, nodes=()):
+        """
+        defers the computation of roots, terminals and the
+        children of the given nodes until one of them is first
+        accessed. builder is called with this tree and has to
+        fill in all of these.
+        """
+        self._roots = None
+        self._terminals = None
+        self._builder = builder
+        for n in nodes:
+            n._children = None
+            n._tree = self
+
+    def materialize(self):
+        """builds the structure of this tree if it has been deferred"""
+        builder = self._builder
+        if builder is not None:
+            self._builder = None
+            builder(self)
 
     def __iter__(self):
         return iter(self.roots)
@@ -166,14 +215,134 @@ class Tree(object):
         sys.stderr.write('Looking for a discontinuity between %r and %r' % (
             self.terminals[nodes[index].end],
             self.terminals[nodes[index + 1].start]))
+        ancestors = self.ancestor_index()
         for n in self.terminals[nodes[index].end:nodes[index + 1].start]:
-            n1 = n
-            while n1 != None:
-                if n1 == sent_node:
-                    return True
-                n1 = n1.parent
+            if n is sent_node or ancestors.dominates(sent_node, n):
+                return True
         return False
 
+    def ancestor_index(self):
+        """
+        returns the :py:class:`AncestorIndex` for this tree, building
+        it on first use. Call :py:meth:`invalidate_index` after
+        changing the structure of the tree.
+        """
+        if self._ancestors is None:
+            self._ancestors = AncestorIndex(self)
+        return self._ancestors
+
+    def invalidate_index(self):
+        self._ancestors = None
+
+    def dominates(self, a, b):
+        "returns True iff node a properly dominates node b"
+        return self.ancestor_index().dominates(a, b)
+
+    def lca(self, a, b):
+        "returns the lowest common ancestor of a and b, or None"
+        return self.ancestor_index().lca(a, b)
+
+    def path(self, a, b):
+        "returns the nodes on the path from a to b, including both"
+        return self.ancestor_index().path(a, b)
+
+    def depth(self, n):
+        "returns the depth of node n, with roots at depth 0"
+        return self.ancestor_index().depth(n)
+
+
+class AncestorIndex(object):
+    '''
+    answers dominance, depth and lowest-common-ancestor queries on
+    a tree in constant time, using a preorder (interval) numbering
+    of the nodes and a sparse table over their Euler tour.
+
+    All roots hang below a virtual root with number 0, so nodes in
+    different root subtrees have no common ancestor.
+    '''
+
+    def __init__(self, t):
+        nodes = [None]
+        number = {}
+        depths = [-1]
+        last = [0]
+        euler = [0]
+        first = [0]
+        # iterative Euler tour; each stack entry is
+        # (preorder number, remaining children)
+        stack = [(0, iter(t.roots))]
+        while stack:
+            num, it = stack[-1]
+            try:
+                n = next(it)
+            except StopIteration:
+                stack.pop()
+                last[num] = len(nodes) - 1
+                if stack:
+                    euler.append(stack[-1][0])
+                continue
+            n_num = len(nodes)
+            nodes.append(n)
+            number[n] = n_num
+            depths.append(depths[num] + 1)
+            last.append(n_num)
+            first.append(len(euler))
+            euler.append(n_num)
+            stack.append((n_num, iter(n.children)))
+        self.nodes = nodes
+        self.number = number
+        self.depths = depths
+        self.last = last
+        self.first = first
+        # ancestors have smaller preorder numbers than their
+        # descendants, so the minimum number between two positions
+        # of the Euler tour is the lowest common ancestor
+        table = [euler]
+        k = 1
+        while 2 * k <= len(euler):
+            prev = table[-1]
+            table.append([min(prev[i], prev[i + k])
+                          for i in range(len(euler) - 2 * k + 1)])
+            k *= 2
+        self.table = table
+
+    def dominates(self, a, b):
+        "returns True iff a properly dominates b"
+        number = self.number
+        a_num = number[a]
+        b_num = number[b]
+        return a_num < b_num <= self.last[a_num]
+
+    def depth(self, n):
+        return self.depths[self.number[n]]
+
+    def lca(self, a, b):
+        first = self.first
+        i = first[self.number[a]]
+        j = first[self.number[b]]
+        if i > j:
+            i, j = j, i
+        k = (j - i + 1).bit_length() - 1
+        row = self.table[k]
+        return self.nodes[min(row[i], row[j - (1 << k) + 1])]
+
+    def path(self, a, b):
+        top = self.lca(a, b)
+        up = []
+        n = a
+        while n is not top:
+            up.append(n)
+            n = n.parent
+        down = []
+        n = b
+        while n is not top:
+            down.append(n)
+            n = n.parent
+        if top is not None:
+            up.append(top)
+        down.reverse()
+        return up + down
+
 
 # abstract base class for all nodes
 class Node(object):
@@ -186,6 +355,22 @@ class Node(object):
         self.children = []
         self.parent = None
 
+    def _get_children(self):
+        try:
+            children = self._children
+        except AttributeError:
+            # nodes pickled before children could be computed lazily
+            children = self._children = self.__dict__.pop('children', [])
+        if children is None:
+            self._tree.materialize()
+            children = self._children
+        return children
+
+    def _set_children(self, children):
+        self._children = children
+
+    children = property(_get_children, _set_children)
+
     def add_at(self, node, pos):
         self.children[pos:pos] = [node]
         node.set_parent(self)
@@ -14,6 +14,9 @@ setup(
         'setuptools >= 19',
         'mock >= 2.0.0'
     ],
+    extras_require={
+        'arrays': ['numpy']
+    },
     license='LGPLv3',
     classifiers = [
         'Development Status :: 5 - Production/Stable',